@@ -0,0 +1,91 @@
+"""IsolationForest anomaly stage that scales with the log
+
+The forest is trained on a bounded random subsample of the matrix with every core (each tree only
+looks at a few hundred rows anyway, and a contamination cut otherwise scores the whole training
+set during fit), then the full matrix is scored in fixed-size chunks. Rows are kept either by the
+forest's own cut (contamination, a fraction or 'auto') or by a fixed score threshold, and the raw
+scores are handed back so rows can be ranked.
+
+numpy and scikit-learn are imported where they are used, dns_clustering.py imports this module
+for its options and -h shouldn't load them.
+"""
+
+# Rows the forest is trained on at most
+FIT_ROWS = 100000
+# Rows scored at once
+SCORE_ROWS = 65536
+
+
+def parse_contamination(text):
+    """'auto' or a fraction like 0.2"""
+    if text == 'auto':
+        return text
+    value = float(text)
+    if not 0 < value <= 0.5:
+        raise ValueError('contamination must be auto or in (0, 0.5], got {:s}'.format(text))
+    return value
+
+
+class AnomalyStage:
+    """IsolationForest trained on a subsample, scored in chunks
+    Args:
+        contamination (str or float): 'auto' or the expected fraction of anomalies
+        threshold (float): Keep rows whose anomaly score is at least this, overrides contamination
+        fit_rows (int): Train on at most this many randomly chosen rows
+        random_state (int): Seed for the subsample and the forest
+    Notes:
+        Anomaly scores are the forest's scores from the original paper, in (0, 1] with higher
+        meaning more anomalous. With contamination='auto' the cut is at 0.5.
+    """
+
+    def __init__(self, contamination='auto', threshold=None, fit_rows=FIT_ROWS, random_state=None):
+        self.contamination = contamination
+        self.threshold = threshold
+        self.fit_rows = fit_rows
+        self.random_state = random_state
+        # Imported here, scikit-learn takes a second to load and most runs never build a forest
+        from sklearn.ensemble import IsolationForest
+        self.forest = IsolationForest(contamination=contamination, n_jobs=-1, random_state=random_state)
+
+    def fit(self, matrix, counts=None):
+        """Train the forest
+        Args:
+            matrix (ndarray): Rows to train on
+            counts (ndarray): How many records each row stands for when the rows were deduplicated
+                (see dns_features.dedup), the subsample is drawn from the records (default = None, one each)
+        """
+        import numpy as np
+        rows = len(matrix) if counts is None else int(counts.sum())
+        picked = None
+        if rows > self.fit_rows:
+            rng = np.random.default_rng(self.random_state)
+            picked = np.sort(rng.choice(rows, self.fit_rows, replace=False))
+        if counts is not None:
+            # Record number -> the row it was deduplicated into, the forest sees the records' mix
+            records = np.arange(rows) if picked is None else picked
+            picked = np.searchsorted(np.cumsum(counts), records, side='right')
+        self.forest.fit(matrix if picked is None else matrix[picked])
+        return self
+
+    @property
+    def cut(self):
+        """Anomaly score at or above which a row counts as anomalous"""
+        if self.threshold is not None:
+            return self.threshold
+        # predict() flags rows whose score_samples fall below offset_
+        return -self.forest.offset_
+
+    def score(self, matrix, score_rows=SCORE_ROWS):
+        """Anomaly score of every row, score_rows at a time"""
+        import numpy as np
+        scores = np.empty(len(matrix))
+        for start in range(0, len(matrix), score_rows):
+            scores[start:start + score_rows] = -self.forest.score_samples(matrix[start:start + score_rows])
+        return scores
+
+    def is_anomaly(self, scores):
+        import numpy as np
+        scores = np.asarray(scores)
+        if self.threshold is not None:
+            return scores >= self.threshold
+        return scores > self.cut
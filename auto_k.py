@@ -0,0 +1,168 @@
+"""Pick the number of clusters by scoring candidate K values on a sample
+
+Every candidate K is fitted and scored on a stratified sample of the matrix instead of the whole
+thing (a full silhouette score is O(n^2)), the candidates are spread over a process pool and the
+sweep stops once the scores stop improving.
+
+numpy and pandas are imported where they are used, the scripts import this module for their --score
+choices and -h shouldn't load them.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Silhouette is O(n^2) even on the sample, it is scored on at most this many of the sampled rows
+SILHOUETTE_ROWS = 4000
+
+
+def _silhouette(matrix, labels, random_state=None):
+    from sklearn.metrics import silhouette_score
+    size = SILHOUETTE_ROWS if len(matrix) > SILHOUETTE_ROWS else None
+    return silhouette_score(matrix, labels, sample_size=size, random_state=random_state)
+
+
+def _calinski_harabasz(matrix, labels):
+    from sklearn.metrics import calinski_harabasz_score
+    return calinski_harabasz_score(matrix, labels)
+
+
+def _davies_bouldin(matrix, labels):
+    from sklearn.metrics import davies_bouldin_score
+    return davies_bouldin_score(matrix, labels)
+
+
+# name -> (score function, True when higher is better)
+# scikit-learn is only imported once a K is scored, so the scripts' --score choices load fast
+CRITERIA = {
+    'silhouette': (_silhouette, True),
+    'calinski_harabasz': (_calinski_harabasz, True),
+    'davies_bouldin': (_davies_bouldin, False),
+}
+SAMPLE_SIZE = 10000
+# Stop after this many K values in a row failed to beat the best score by TOLERANCE (relative)
+PATIENCE = 3
+TOLERANCE = 0.01
+
+
+class StratifiedReservoir:
+    """Bounded stratified sample of a stream of DataFrame chunks
+    Every stratum keeps the rows with the smallest random keys (a bottom-k reservoir), which is a
+    uniform sample of that stratum however the rows were chunked. sample() then allocates the
+    final size across strata in proportion to their counts, at least one row each so rare
+    strata (odd qtypes) are always represented.
+    Args:
+        size (int): Rows in the final sample
+        random_state (int): Seed for the row keys
+    """
+
+    def __init__(self, size=SAMPLE_SIZE, random_state=None):
+        self.size = size
+        import numpy as np
+        self.rng = np.random.default_rng(random_state)
+        self.counts = {}
+        self._kept = {}
+
+    def update(self, df, strata):
+        import numpy as np
+        import pandas as pd
+        strata = pd.Series(np.asarray(strata, dtype=object)).fillna('NaN')
+        keys = self.rng.random(len(df))
+        # Positions, not labels: ascii chunks are indexed on ts, which repeats
+        for stratum, positions in strata.groupby(strata, sort=False).indices.items():
+            self.counts[stratum] = self.counts.get(stratum, 0) + len(positions)
+            rows = df.iloc[positions].assign(_key=keys[positions])
+            kept = self._kept.get(stratum)
+            if kept is not None:
+                rows = pd.concat([kept, rows])
+            self._kept[stratum] = rows.nsmallest(self.size, '_key')
+        return self
+
+    def sample(self):
+        import pandas as pd
+        total = sum(self.counts.values())
+        if not total:
+            return pd.DataFrame()
+        frames = []
+        for stratum, count in self.counts.items():
+            take = max(1, int(round(self.size * count / total)))
+            frames.append(self._kept[stratum].head(take))
+        return pd.concat(frames).drop(columns='_key')
+
+
+def _score_k(job):
+    """Worker: fit K clusters on the sample and score them"""
+    from sklearn.cluster import KMeans
+    from threadpoolctl import threadpool_limits
+    import numpy as np
+    matrix, k, criterion, random_state = job
+    start = time.time()
+    score_func, _ = CRITERIA[criterion]
+    # One thread per worker, the pool already uses every core
+    with threadpool_limits(1):
+        kmeans = KMeans(n_clusters=k, n_init=3, random_state=random_state).fit(matrix)
+        labels = kmeans.labels_
+        score = score_func(matrix, labels) if len(np.unique(labels)) > 1 else np.nan
+    return k, score, kmeans.inertia_, time.time() - start
+
+
+def choose_k(matrix, k_values, criterion='silhouette', workers=None, patience=PATIENCE, tolerance=TOLERANCE, random_state=None):
+    """Score candidate K values in parallel and return the best one
+    Args:
+        matrix (ndarray): Sample to cluster (see StratifiedReservoir), rows x features
+        k_values (list): Candidate K values, tried smallest first
+        criterion (str): silhouette, calinski_harabasz or davies_bouldin
+        workers (int): Number of worker processes (default = number of cores)
+        patience (int): Stop once this many K values in a row haven't improved the best score
+        tolerance (float): Relative improvement needed to count as better
+    Returns:
+        (best K, DataFrame score table with k, score, inertia and seconds per K)
+    """
+    import numpy as np
+    import pandas as pd
+    _, higher_better = CRITERIA[criterion]
+    k_values = [k for k in sorted(k_values) if 2 <= k < len(matrix)]
+    if not k_values:
+        return min(2, len(matrix)), pd.DataFrame(columns=['k', 'score', 'inertia', 'seconds'])
+    workers = min(workers or os.cpu_count() or 1, len(k_values))
+
+    results = []
+    best = None
+    stale = 0
+    # Like load_directory, only pay for a pool when there is more than one worker
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    mapper = pool.map if pool else map
+    try:
+        # One wave of K values per round so the sweep can stop between waves
+        for start in range(0, len(k_values), workers):
+            wave = [(matrix, k, criterion, random_state) for k in k_values[start:start + workers]]
+            for k, score, inertia, seconds in mapper(_score_k, wave):
+                results.append((k, score, inertia, seconds))
+                if np.isnan(score):
+                    continue
+                signed = score if higher_better else -score
+                if best is None or signed > best + tolerance * abs(best):
+                    best = signed
+                    stale = 0
+                else:
+                    stale += 1
+            if stale >= patience:
+                break
+    finally:
+        if pool:
+            pool.shutdown()
+
+    table = pd.DataFrame(results, columns=['k', 'score', 'inertia', 'seconds'])
+    scored = table.dropna(subset=['score'])
+    if scored.empty:
+        return k_values[0], table
+    best_row = scored['score'].idxmax() if higher_better else scored['score'].idxmin()
+    return int(table.loc[best_row, 'k']), table
+
+
+def parse_k_range(text):
+    """'2-16' -> [2, ..., 16], '4,8,12' -> [4, 8, 12]"""
+    if '-' in text:
+        low, high = text.split('-', 1)
+        return list(range(int(low), int(high) + 1))
+    return [int(k) for k in text.split(',')]
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""Benchmark every script's hot path on synthetic logs
+
+Logs are generated with zeek_gen.py (seeded, so every run measures the same data) and cached in
+--data-dir. Every stage runs in its own process, so the peak RSS reported is the stage's own and
+not whatever the previous stage left behind. Setup (loading the log a stage works on) isn't part
+of a stage's wall time, except for the load_* stages which measure exactly that. cached_dns is
+load_dns served from a warm parse cache, the two side by side are what --cache saves.
+
+Results are printed as a table and saved as JSON together with the git commit, so runs of two
+versions can be compared with --compare.
+
+--cold-start measures how long the scripts take to start instead: `-h` of every zat_cli.py
+subcommand and of the script it runs, each in a fresh interpreter, median of COLD_RUNS runs.
+
+Usage:
+    python3 benchmark.py --rows 10000 100000 -o results.json
+    python3 benchmark.py --rows 1000000 --stages load_dns cluster --compare results.json
+    python3 benchmark.py --cold-start -o startup.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import pandas as pd
+from stage_profile import Profiler, peak_rss_mb
+
+# stage -> log type it runs on
+STAGES = {
+    'load_dns': 'dns',
+    'load_ssl': 'ssl',
+    'load_x509': 'x509',
+    'load_conn': 'conn',
+    'load_mixed': 'mixed',
+    'cached_dns': 'dns',
+    'compact_dns': 'dns',
+    'compact_ssl': 'ssl',
+    'compact_x509': 'x509',
+    'compact_conn': 'conn',
+    'compact_mixed': 'mixed',
+    'featurize': 'dns',
+    'cluster': 'dns',
+    'dns_length': 'dns',
+    'tor': 'ssl',
+    'cert': 'x509',
+    'detect': 'mixed',
+}
+DEFAULT_ROWS = [10000, 100000]
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'zat_bench')
+# Cluster count and length cut used by the cluster and dns_length stages
+CLUSTERS = 4
+LENGTH = 50
+# Runs of every command measured by --cold-start, the median is reported
+COLD_RUNS = 5
+
+
+# Each stage loads what it needs and returns the work to time, which returns the rows processed.
+# Imports happen here so a stage only pays for the modules it uses.
+
+def _load(path, json_format, fields=None, compact=True):
+    from zeek_loader import load_log
+    return load_log(path, json_format=json_format, fields=fields, compact=compact)
+
+
+def _load_stage(path, json_format):
+    return lambda: len(_load(path, json_format))
+
+
+def _cached_load(path, json_format):
+    # The miss that fills the cache is setup, the timed load is a warm hit
+    import parse_cache
+    from zeek_loader import _parse_log
+    cache_dir = tempfile.mkdtemp(prefix='zat_bench_cache')
+    options = {'json_format': json_format}
+    parse_cache.cached_load(path, options, lambda: _parse_log(path, json_format, None, True, None, None, None), cache_dir)
+
+    def work():
+        df = parse_cache.load(path, options, cache_dir)
+        parse_cache.clear(cache_dir)
+        os.rmdir(cache_dir)
+        return len(df)
+    return work
+
+
+def _compact(path, json_format):
+    # Frame memory with the loader's plain dtypes and after compact_dtypes.compact
+    from compact_dtypes import compact, frame_memory, guess_log_type
+    df = _load(path, json_format, compact=False)
+
+    def work():
+        compacted = compact(df, guess_log_type(path))
+        # Counted once the clock has stopped, see run_stage
+        return {
+            'rows': len(df),
+            'frame_mb': lambda: round(frame_memory(df) / 1e6, 1),
+            'compact_mb': lambda: round(frame_memory(compacted) / 1e6, 1),
+        }
+    return work
+
+
+def _featurize(path, json_format):
+    import dns_clustering
+    df = _load(path, json_format, dns_clustering.FIELDS)
+    return lambda: len(dns_clustering.add_features(df))
+
+
+def _cluster(path, json_format):
+    import dns_clustering
+    from zat.dataframe_to_matrix import DataFrameToMatrix
+    from sklearn.cluster import KMeans
+    df = dns_clustering.add_features(_load(path, json_format, dns_clustering.FIELDS))
+
+    def work():
+        matrix = DataFrameToMatrix().fit_transform(df[dns_clustering.FEATURES])
+        KMeans(n_clusters=CLUSTERS, n_init=3, random_state=0).fit(matrix)
+        return len(df)
+    return work
+
+
+def _dns_length(path, json_format):
+    import dns_length
+    df = _load(path, json_format, dns_length.FIELDS)
+
+    def work():
+        # Rendering the hits is part of what the script does
+        str(dns_length.long_entries(df, LENGTH))
+        return len(df)
+    return work
+
+
+def _tor(path, json_format):
+    import tor_and_port_counter_ascii_json as tor_counter
+    from tor_detect import TorPortStage, format_hits
+    df = _load(path, json_format, tor_counter.FIELDS)
+
+    def work():
+        stage = TorPortStage()
+        format_hits(stage.update(df))
+        stage.report()
+        return len(df)
+    return work
+
+
+def _cert(path, json_format):
+    import cert_checker_ascii_json as cert_checker
+    from ioc_matcher import IOCMatcher
+    df = _load(path, json_format, cert_checker.FIELDS)
+    matcher = IOCMatcher(['badsite.example', 'evil.example'])
+
+    def work():
+        # Rendering the findings is part of what the script does
+        with cert_checker.open_sink(os.devnull, 'text') as sink:
+            cert_checker.check_certs(df, matcher, sink)
+        return len(df)
+    return work
+
+
+def _detect(path, json_format):
+    # One pass of every detector over a mixed day log, reading is part of the work here
+    from detect_engine import DetectorEngine, DnsLengthDetector, TorDetector, CertDetector
+    from ioc_matcher import IOCMatcher
+    import cert_checker_ascii_json as cert_checker
+    # Every record of the log is read, not only the routed ones
+    with open(path) as infile:
+        rows = sum(1 for _ in infile)
+
+    def work():
+        with open(os.devnull, 'w') as outfile:
+            sink = cert_checker.open_sink(outfile, 'text')
+            engine = DetectorEngine([DnsLengthDetector(LENGTH), TorDetector(),
+                                     CertDetector(IOCMatcher(['badsite.example', 'evil.example']), sink)], out=outfile)
+            engine.scan(path, json_format)
+            engine.report()
+        return rows
+    return work
+
+
+SETUPS = {
+    'cached_dns': _cached_load,
+    'compact_dns': _compact,
+    'compact_ssl': _compact,
+    'compact_x509': _compact,
+    'compact_conn': _compact,
+    'compact_mixed': _compact,
+    'featurize': _featurize,
+    'cluster': _cluster,
+    'dns_length': _dns_length,
+    'tor': _tor,
+    'cert': _cert,
+    'detect': _detect,
+}
+
+
+def run_stage(name, path, json_format):
+    """Run one stage in this process and return its measurements"""
+    setup = SETUPS.get(name, _load_stage)
+    # The scripts print progress, keep it out of the measurements' output
+    with contextlib.redirect_stdout(io.StringIO()):
+        work = setup(path, json_format)
+        base_rss = peak_rss_mb()
+        # Timed like the scripts' --profile stages, so the two report the same numbers
+        profiler = Profiler()
+        with profiler.stage(name):
+            measured = work()
+        timing = profiler.stages[name]
+        seconds, cpu = timing['seconds'], timing['cpu_seconds']
+    # A stage returns the rows it processed, or a dict of those plus its own measurements, which
+    # may be callables so they aren't part of the time
+    extra = measured if isinstance(measured, dict) else {'rows': measured}
+    extra = {key: value() if callable(value) else value for key, value in extra.items()}
+    rows = extra['rows']
+    return {
+        **extra,
+        'seconds': round(seconds, 4),
+        'cpu_seconds': round(cpu, 4),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'base_rss_mb': round(base_rss, 1),
+        'peak_rss_mb': round(timing['peak_rss_mb'], 1),
+    }
+
+
+def log_path(data_dir, log_type, rows, seed, fmt):
+    """Generated logs are cached per type, size, seed and format"""
+    return os.path.join(data_dir, '{:s}_{:d}_{:d}.{:s}.log'.format(log_type, rows, seed, fmt))
+
+
+def ensure_log(data_dir, log_type, rows, seed, fmt):
+    import zeek_gen
+    path = log_path(data_dir, log_type, rows, seed, fmt)
+    if not os.path.exists(path):
+        print('**Generating {:s}**'.format(path))
+        os.makedirs(data_dir, exist_ok=True)
+        # Written under a temporary name so an interrupted run doesn't leave half a log behind
+        zeek_gen.generate(log_type, rows, path + '.part', json_format=fmt == 'json', seed=seed)
+        os.replace(path + '.part', path)
+    return path
+
+
+def measure(name, path, fmt):
+    """Run a stage in a fresh interpreter so its peak RSS is its own"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-stage', name, '--input', path, '--format', fmt]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        print('**{:s} failed on {:s}**\n{:s}'.format(name, path, result.stderr.strip()))
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def cold_start(runs=COLD_RUNS):
+    """Wall time of `-h` in a fresh interpreter, through zat_cli.py and running the script directly"""
+    import zat_cli
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = [('python', '-', [sys.executable, '-c', 'pass']),
+                ('zat_cli', '-', [sys.executable, os.path.join(here, 'zat_cli.py'), '-h'])]
+    for name, (module, _) in zat_cli.COMMANDS.items():
+        commands.append(('zat_cli', name, [sys.executable, os.path.join(here, 'zat_cli.py'), name, '-h']))
+        commands.append(('script', name, [sys.executable, os.path.join(here, module + '.py'), '-h']))
+    results = []
+    for via, name, command in commands:
+        print('**Starting {:s} {:d} times**'.format(' '.join(os.path.basename(part) for part in command[1:]), runs))
+        seconds = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            seconds.append(time.perf_counter() - start)
+        results.append({'via': via, 'command': name, 'seconds': round(float(pd.Series(seconds).median()), 4),
+                        'min_seconds': round(min(seconds), 4)})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_info():
+    """What a results file was measured on"""
+    return {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(table, old_path):
+    """rows/sec of this run against an earlier results file, above 1 is faster"""
+    with open(old_path) as infile:
+        old = pd.DataFrame(json.load(infile)['results'])
+    keys = ['stage', 'format', 'log_rows']
+    merged = table.merge(old[keys + ['rows_per_sec', 'peak_rss_mb']], on=keys, suffixes=('', '_old'))
+    merged['speedup'] = (merged['rows_per_sec'] / merged['rows_per_sec_old']).round(2)
+    merged['rss_ratio'] = (merged['peak_rss_mb'] / merged['peak_rss_mb_old']).round(2)
+    return merged[keys + ['rows_per_sec_old', 'rows_per_sec', 'speedup', 'peak_rss_mb_old', 'peak_rss_mb', 'rss_ratio']]
+
+
+def parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows',
+            help='Log sizes to benchmark, default=10000 100000',
+            type=int,
+            nargs='+',
+            default=DEFAULT_ROWS)
+    parser.add_argument('-f', '--format',
+            help='Log formats to benchmark, default=json ascii (mixed logs are json only)',
+            choices=['json', 'ascii'],
+            nargs='+',
+            default=['json', 'ascii'])
+    parser.add_argument('--stages',
+            help='Stages to run, default=all of them',
+            choices=list(STAGES),
+            nargs='+',
+            default=list(STAGES))
+    parser.add_argument('-s', '--seed',
+            help='Seed of the generated logs, default=0',
+            type=int,
+            default=0)
+    parser.add_argument('--data-dir',
+            help='Where generated logs are kept between runs, default={:s}'.format(DATA_DIR),
+            default=DATA_DIR)
+    parser.add_argument('-o', '--output',
+            help='Save the results as JSON, default=benchmark_results.json',
+            default='benchmark_results.json')
+    parser.add_argument('--compare',
+            help='Earlier results file to compare rows/sec and peak RSS against',
+            default=None)
+    parser.add_argument('--cold-start',
+            help='Measure the start up time of every command instead of the stages',
+            action='store_true')
+    # Internal, used to run a single stage in a child process
+    parser.add_argument('--run-stage', help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+    if args.run_stage:
+        fmt = args.format[0] if isinstance(args.format, list) else args.format
+        print(json.dumps(run_stage(args.run_stage, args.input, fmt == 'json')))
+        return
+
+    if args.cold_start:
+        table = pd.DataFrame(cold_start())
+        print(table.to_string(index=False))
+        with open(args.output, 'w') as outfile:
+            json.dump(dict(run_info(), cold_start=table.to_dict(orient='records')), outfile, indent=2)
+        print('**Saved results to {:s}**'.format(args.output))
+        return
+
+    results = []
+    for rows in args.rows:
+        for fmt in args.format:
+            for name in args.stages:
+                log_type = STAGES[name]
+                if log_type == 'mixed' and fmt != 'json':
+                    continue
+                path = ensure_log(args.data_dir, log_type, rows, args.seed, fmt)
+                print('**Running {:s} on {:s}**'.format(name, os.path.basename(path)))
+                measured = measure(name, path, fmt)
+                if measured:
+                    results.append(dict(stage=name, format=fmt, log_rows=rows, **measured))
+
+    table = pd.DataFrame(results)
+    pd.set_option('display.width', None)
+    print(table.to_string(index=False))
+    with open(args.output, 'w') as outfile:
+        json.dump(dict(run_info(), seed=args.seed, results=results), outfile, indent=2)
+    print('**Saved results to {:s}**'.format(args.output))
+    if args.compare and not table.empty:
+        print(compare(table, args.compare).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,30 @@ from __future__ import print_function
 import os
 import sys
 import argparse
+import contextlib
 from pprint import pprint
 
 # Local imports
 from zat import zeek_log_reader
-import pandas as pd
+from hit_sink import HitSink, FORMATS, status_stream
+
+HEADERS = {
+    'spoofed': '\n<<< Suspicious Certificate Found >>>',
+    'ioc': '\n<<< Suspicious Certificate Found >>>',
+    'self_signed': '\n <<< Self-Signed Certificate Found >>>',
+}
+
+
+def format_rows(hits):
+    # One 'field  value' line per field of every certificate, like printing each row as a DataFrame did
+    fields = [field for field in hits.columns if field != 'finding']
+    width = max(len(field) for field in fields)
+    lines = []
+    for record in hits.to_dict('records'):
+        lines.append(HEADERS[record['finding']])
+        lines += ['{:<{:d}}  {}'.format(field, width, record[field]) for field in fields]
+    return ''.join(line + '\n' for line in lines)
+
 
 if __name__ == '__main__':
     # Example to check all the x509 Certs from 'Let's Encrypt' for potential phishing/malicious sites
@@ -16,6 +35,9 @@ if __name__ == '__main__':
     # Collect args from the command line
     parser = argparse.ArgumentParser()
     parser.add_argument('zeek_log', type=str, help='Specify a zeek log to run ZeekLogReader test on')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='text',
+                        help='Output format: {:s}, default=text'.format(', '.join(FORMATS)))
+    parser.add_argument('-o', '--output', default='-', help='File the certificates are written to, default=stdout')
     args, commands = parser.parse_known_args()
 
     # Check for unknown args
@@ -38,34 +60,36 @@ if __name__ == '__main__':
         # Modification: List out known ioc domains for testing
         ioc_domains = set(['ioc1', 'ioc2', 'ioc3'])
 
-        # Run the zeek reader on the x509.log file looking for spoofed domains
-        reader = zeek_log_reader.ZeekLogReader(args.zeek_log, tail=True)  # tail=False to turn off dynamic tailing
-        for row in reader.readrows():
-
-            # Pull out specified fields, i.e. Certificate Issuer
-            issuer = row['certificate.issuer']
-            subject = row['certificate.subject']
-            
-            # Include here other fields necessary for testing
-            
-            if "Let's Encrypt" in issuer:
-
-                # Check if the certificate subject has any spoofed domains
-
-                if any([domain in subject for domain in spoofed_domains]):
-                    print('\n<<< Suspicious Certificate Found >>>')
-                    #pprint(row)
-                    spoofed_df = pd.DataFrame.from_dict(row, orient='index') # Modified to print as pandas dataframe rather than pyton dict
-                    print(spoofed_df)
-                    
-         # Below are modifications from the original script.           
-                elif any([domain in subject for domain in ioc_domains]): # Check against known ioc domains
-                    print('\n<<< Suspicious Certificate Found >>>')
-                    # pprint(row)
-                    ioc_df = pd.DataFrame.from_dict(row, orient='index')
-                    print(ioc_df)
-            if issuer == subject:  # Check for self-signed certificates
-                print('\n <<< Self-Signed Certificate Found >>>')
-                # pprint(row)
-                selfsigned_df = pd.DataFrame.from_dict(row, orient='index')
-                print(selfsigned_df)
+        # The reader tails the log forever, so every hit is written as soon as it's found
+        sink = HitSink(args.output, args.format, text=format_rows, flush_seconds=0)
+
+        # zat prints its own status lines, keep them out of jsonl/csv/parquet certificates on stdout
+        with contextlib.redirect_stdout(status_stream(args.output, args.format)):
+            # Run the zeek reader on the x509.log file looking for spoofed domains
+            reader = zeek_log_reader.ZeekLogReader(args.zeek_log, tail=True)  # tail=False to turn off dynamic tailing
+            try:
+                for row in reader.readrows():
+
+                    # Pull out specified fields, i.e. Certificate Issuer
+                    issuer = row['certificate.issuer']
+                    subject = row['certificate.subject']
+
+                    # Include here other fields necessary for testing
+
+                    if "Let's Encrypt" in issuer:
+
+                        # Check if the certificate subject has any spoofed domains
+
+                        if any([domain in subject for domain in spoofed_domains]):
+                            # Modified to report the whole row rather than the python dict, through the sink
+                            # instead of building a DataFrame per row
+                            sink.write(dict(row, finding='spoofed'))
+
+                 # Below are modifications from the original script.
+                        elif any([domain in subject for domain in ioc_domains]): # Check against known ioc domains
+                            sink.write(dict(row, finding='ioc'))
+                    if issuer == subject:  # Check for self-signed certificates
+                        sink.write(dict(row, finding='self_signed'))
+            except KeyboardInterrupt:
+                pass
+        sink.close()
@@ -2,44 +2,211 @@ from __future__ import print_function
 import os
 import sys
 import argparse
+import contextlib
 from pprint import pprint
 
-# Zeek Log Conversion
-import json
-import pandas as pd
-from zat.log_to_dataframe import LogToDataFrame
-from zat.dataframe_to_matrix import DataFrameToMatrix
-from zat import zeek_log_reader
-from contextlib import redirect_stdout
+# Zeek Log Conversion, numpy, pandas and the loaders are imported where they are used so -h starts fast
+from ts_index import parse_time
+from hit_sink import HitSink, FORMATS, status_stream
+from stage_profile import Profiler, add_arguments as add_profile_arguments
 
+# These domains may be spoofed with a certificate issued by 'Let's Encrypt'
+SPOOFED_DOMAINS = ['paypal', 'gmail', 'google', 'apple', 'ebay', 'amazon']
 
-def import_json(path):
-    # list of json strings, each log entry is a string
-    with open(path) as json_file:
-        lines = json_file.readlines()
-    # json.loads converts a json string into a dict
-    # this is run on each line
-    # a dataframe is created from a sequence of dicts using from_records
-    df = pd.DataFrame.from_records(map(json.loads, lines))
-    return df
+# Only these fields are decoded from the x509 log, fingerprint only exists in newer Zeek versions
+FIELDS = ['ts', 'id', 'certificate.issuer', 'certificate.subject', 'fingerprint']
+# Findings in the order they are reported for a certificate, with their text headers
+FINDINGS = {
+    'spoofed': '\n<<< Suspicious Certificate Found >>>',
+    'self_signed': '\n <<< Self-Signed Certificate Found >>>',
+    'ioc': '\n <<< IOC Found >>>',
+}
+
+
+def check_pairs(issuers, subjects, ioc_matcher):
+    """The checks themselves, over issuer and subject columns
+    Returns:
+        spoofed and self_signed bool arrays, the IOC that matched (or None) as an object array
+    """
+    import numpy as np
+    import pandas as pd
+    from ioc_matcher import IOCMatcher
+    # Check all the x509 Certs for 'Let's Encrypt'/self-signed for potential phishing/malicious sites
+    # These domains may be spoofed with a certificate issued by 'Let's Encrypt'
+    # Both pattern sets are compiled into automatons once and run over each distinct issuer/subject
+    spoofed = IOCMatcher(SPOOFED_DOMAINS)
+    lets_encrypt = issuers.str.contains("Let's Encrypt", regex=False, na=False).to_numpy()
+    spoof_hits = lets_encrypt & pd.notna(spoofed.match_column(subjects))
+    # ascii logs load these as categoricals with different categories, compare the values themselves
+    self_signed = issuers.to_numpy(dtype=object) == subjects.to_numpy(dtype=object)
+    # Check the issuer as well as the subject for IOCs, reporting the IOC that matched
+    ioc_hits = np.full(len(issuers), None, dtype=object)
+    if ioc_matcher is not None and len(ioc_matcher):
+        ioc_hits = ioc_matcher.match_column(subjects)
+        missing = pd.isna(ioc_hits)
+        ioc_hits[missing] = ioc_matcher.match_column(issuers[missing])
+    return spoof_hits, self_signed, ioc_hits
+
+
+def find_certs(df, ioc_matcher, verdicts=None):
+    """Findings for the certificates of a frame or chunk
+    Args:
+        verdicts (VerdictCache): Verdicts of certificates checked before (default = None, check every distinct one)
+    Returns:
+        DataFrame with ts, id, issuer, subject, finding (see FINDINGS) and ioc columns, one row
+        per finding, indexed on the certificate's row in df
+    """
+    import numpy as np
+    import pandas as pd
+    from verdict_cache import certificate_keys, rules_digest
+    # Change syntax of fields based off ascii and json formats
+    if 'certificate_issuer' in df.columns:
+        issuers, subjects = df['certificate_issuer'], df['certificate_subject']
+    else:
+        issuers, subjects = df['certificate.issuer'], df['certificate.subject']
+    # ascii logs are indexed on ts, json logs and tailed batches carry it as a column
+    timestamps = df['ts'] if 'ts' in df.columns else df.index.to_series()
+
+    # The checks run once per distinct certificate, the verdicts are spread back over the records
+    codes, first, keys = certificate_keys(issuers, subjects, df.get('fingerprint'))
+
+    def compute(positions):
+        rows = first[positions]
+        spoof_hits, self_signed, ioc_hits = check_pairs(issuers.iloc[rows], subjects.iloc[rows], ioc_matcher)
+        return list(zip(spoof_hits.tolist(), self_signed.tolist(), ioc_hits.tolist()))
+
+    if verdicts is None:
+        results = compute(np.arange(len(keys)))
+    else:
+        verdicts.bind(rules_digest(SPOOFED_DOMAINS, ioc_matcher.digest if ioc_matcher is not None else None))
+        results = verdicts.lookup(keys, compute)
+    spoof_hits = np.array([spoofed for spoofed, _, _ in results], dtype=bool)[codes]
+    self_signed = np.array([signed for _, signed, _ in results], dtype=bool)[codes]
+    ioc_hits = np.array([ioc for _, _, ioc in results], dtype=object)[codes]
+
+    # One row per finding, a certificate's findings kept together in FINDINGS order
+    hits = pd.notna(ioc_hits)
+    rows = np.concatenate([np.flatnonzero(spoof_hits), np.flatnonzero(self_signed), np.flatnonzero(hits)])
+    kinds = np.repeat(np.arange(len(FINDINGS)), [spoof_hits.sum(), self_signed.sum(), hits.sum()])
+    order = np.lexsort((kinds, rows))
+    rows, kinds = rows[order], kinds[order]
+    return pd.DataFrame({
+        'ts': timestamps.to_numpy()[rows],
+        'id': df['id'].to_numpy()[rows],
+        'issuer': issuers.to_numpy(dtype=object)[rows],
+        'subject': subjects.to_numpy(dtype=object)[rows],
+        'finding': np.array(list(FINDINGS), dtype=object)[kinds],
+        # Only the ioc finding of a certificate carries the IOC, not its spoofed/self-signed ones
+        'ioc': np.where(kinds == list(FINDINGS).index('ioc'), ioc_hits[rows], None),
+    }, index=rows)
+
+
+def format_findings(hits):
+    """Render findings as the cert checker always printed them"""
+    lines = []
+    cert, cut = None, 0
+    # Iterating the column gives pandas Timestamps for ascii logs, which print like the baseline
+    # (2020-04-30 00:00:00.000951040), numpy's datetime64 would put a T in the middle
+    for row, timestamp, ID, issuer, subject, finding, ioc in zip(hits.index, hits['ts'], hits['id'],
+                                                               hits['issuer'], hits['subject'], hits['finding'], hits['ioc']):
+        if row != cert:
+            cert, cut = row, 0
+        # The spoofed and self-signed reports each drop the first three characters ('CN=') again
+        if finding != 'ioc':
+            cut += 3
+        lines.append(FINDINGS[finding])
+        lines.append('Timestamp:  {}'.format(timestamp))
+        lines.append('ID: {:s} \nIssuer: {:s} \nsubject: {:s}'.format(ID, issuer[cut:], subject[cut:]))
+        if finding == 'ioc':
+            lines.append('IOC: {:s}'.format(ioc))
+    return ''.join(line + '\n' for line in lines)
+
+
+def check_certs(df, ioc_matcher, sink, verdicts=None):
+    """Find suspicious certificates and hand them to a HitSink"""
+    sink.write(find_certs(df, ioc_matcher, verdicts))
+
+
+def open_sink(outfile, fmt):
+    return HitSink(outfile, fmt, text=format_findings)
+
+
+def run_checks(df, ioc_matcher, sink, profiler, verdicts=None):
+    # check_certs with the finding and the writing timed apart
+    with profiler.stage('detect', len(df)):
+        hits = find_certs(df, ioc_matcher, verdicts)
+    with profiler.stage('report', len(hits)):
+        sink.write(hits)
+
+
+def tail(args, ioc_matcher, sink, profiler, verdicts):
+    from zeek_tail import LogTailer
+    # Follow the live x509.log, every micro-batch goes through check_certs
+    tailer = LogTailer(args.zeek_log_path, fields=FIELDS, checkpoint=args.checkpoint, since=args.since, until=args.until)
+    print('**Tailing {:s}, Ctrl-C to stop**'.format(args.zeek_log_path))
+    try:
+        # load includes the time spent waiting for the log to grow
+        for batch in profiler.iterate('load', tailer.batches()):
+            if 'certificate_issuer' in batch.columns or 'certificate.issuer' in batch.columns:
+                run_checks(batch, ioc_matcher, sink, profiler, verdicts)
+                sink.flush()
+            tailer.commit()
+    except KeyboardInterrupt:
+        pass
+
+
+def finish(verdicts):
+    # Only worth reporting when the cache outlives the run, status goes to stderr, the findings may be on stdout
+    if verdicts.path:
+        print('**{:s}**'.format(verdicts.summary()), file=sys.stderr)
+    verdicts.save()
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-j', '--json_format',
-            help='Import zeek log in json string format',
+            help='Import zeek log in json string format (detected automatically if not set)',
             action='store_true')
     parser.add_argument('-d', '--directory',
             help='Import zeek logs from directory',
             action='store_true')
+    parser.add_argument('-w', '--workers',
+            help='Number of processes used to parse a directory of logs, default=number of cores',
+            type=int,
+            default=None)
     parser.add_argument('infile', nargs='?',
             type=argparse.FileType('r'),
             default=sys.stdin,
             help='File path to txt IOC File. One IOC per line')
     parser.add_argument('outfile', nargs='?',
-            type=argparse.FileType('w'),
-            default=sys.stdout,
-            help='Output file and path')
+            default='-',
+            help='Output file and path, default=stdout')
+    parser.add_argument('-f', '--format',
+            help='Output format of the findings: {:s}, default=text'.format(', '.join(FORMATS)),
+            choices=FORMATS,
+            default='text')
+    parser.add_argument('--cache',
+            help='Reuse parsed logs from the on-disk parse cache (clear with parse_cache.py --clear)',
+            action='store_true')
+    parser.add_argument('--since',
+            help='Only records at or after this time, epoch seconds or a UTC date like "2020-04-30 00:10"',
+            type=parse_time,
+            default=None)
+    parser.add_argument('--until',
+            help='Only records at or before this time, see --since',
+            type=parse_time,
+            default=None)
+    parser.add_argument('-t',
+            action='store_true',
+            default=False,
+            help='Sets the program to tail a live Zeek log')
+    parser.add_argument('--checkpoint',
+            help='Offset checkpoint file used with -t, default=one per log under ~/.cache/zat_logs/tail',
+            default=None)
+    parser.add_argument('--verdict-cache',
+            help='Keep the verdicts of checked certificates in this file across runs, they are dropped when the IOCs change',
+            default=None)
+    add_profile_arguments(parser)
     parser.add_argument('zeek_log_path',
             type=str,
             help='Type in location of zeek log')
@@ -48,83 +215,55 @@ def main():
     if commands:
         print('Unrecognized args: %s' % commands)
         sys.exit(1)
-    # Sanity check that this is a x509 log
-    if 'x509' not in args.zeek_log_path:
+    # Sanity check that this is a x509 log, directories are filtered down to x509 logs when loading
+    if not args.directory and 'x509' not in args.zeek_log_path:
         print('This example only works with Zeek x509.log files..')
         sys.exit(1)
     # Files may have a tilde in it
     if args.zeek_log_path:
         args.zeek_log_path = os.path.expanduser(args.zeek_log_path)
+    from ioc_matcher import IOCMatcher, read_iocs
+    from verdict_cache import VerdictCache
+    ioc_matcher = None
     if args.infile:
-        infile = args.infile.read().splitlines()
-        # ioc = infile.read()
-    if args.outfile:
-        outfile = args.outfile
-    # Determine json or ascii format
-    if args.json_format:
-        if args.directory:
-            print('**Importing zeek logs from directory in json format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            logs = []
-            for log in zeek_logs:
-                logs.append(import_json(log))
-            df = pd.concat(logs)
-        else:
-            print('**Importing zeek log in json format**')
-            df = import_json(args.zeek_log_path)
-        field_list = zip(df['ts'], df['id'], df['certificate_issuer'], df['certificate_subject'])
-    else:
-        if args.directory:
-            print('**Importing zeek logs from directory in ascii format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            logs = []
-            log_to_df = LogToDataFrame()
-            for log in zeek_logs:
-                logs.append(log_to_df.create_dataframe(log))
-            df = pd.concat(logs)
-        else:
-            print('**Importing zeek log in ascii format**')
-            print('**Hanging? High chance you are trying to import a log in json format, use -j**')
-            log_to_df = LogToDataFrame()
-            df = log_to_df.create_dataframe(args.zeek_log_path)
-        field_list = zip(df.index, df['id'], df['certificate.issuer'], df['certificate.subject'])
-
-    # Check all the x509 Certs for 'Let's Encrypt'/self-signed for potential phishing/malicious sites
-    # These domains may be spoofed with a certificate issued by 'Let's Encrypt'
-    # print(df.columns)
-    # print(df.index)
-    # Run the zeek reader on the x509.log file looking for spoofed domains
-    # reader = zeek_log_reader.ZeekLogReader(df, tail=True)  # tail=False to turn off dynamic tailing
-    for timestamp, ID, issuer, subject in field_list:
-        # Include above other fields necessary for testing
-        spoofed_domains = set(['paypal', 'gmail', 'google', 'apple', 'ebay', 'amazon'])
-        # print(spoofed_domains)
-        if "Let's Encrypt" in issuer:
-        # Check if the certificate subject has any spoofed domains
-            if any([domain in subject for domain in spoofed_domains]):
-                subject = subject[3:]
-                issuer = issuer[3:]
-                with redirect_stdout(outfile):
-                    print('\n<<< Suspicious Certificate Found >>>')
-                    print('Timestamp: ', timestamp)
-                    print('ID: {:s} \nIssuer: {:s} \nsubject: {:s}'.format(ID, issuer, subject))
-
-        if issuer == subject:  # Check for self-signed certificates
-            subject = subject[3:]
-            issuer = issuer[3:]
-            with redirect_stdout(outfile):
-                print('\n <<< Self-Signed Certificate Found >>>')
-                print('Timestamp: ', timestamp)
-                print('ID: {:s} \nIssuer: {:s} \nsubject: {:s}'.format(ID, issuer, subject))
-
-        if args.infile:
-            ioc_domains = infile
-            # print(ioc_domains)
-            if any([ioc in (subject or issuer) for ioc in ioc_domains]):
-                with redirect_stdout(outfile):
-                    print('\n <<< IOC Found >>>')
-                    print('Timestamp: ', timestamp)
-                    print('ID: {:s} \nIssuer: {:s} \nsubject: {:s}'.format(ID, issuer, subject))
+        # Build the IOC automaton once, matching cost no longer grows with the number of IOCs
+        ioc_matcher = IOCMatcher(read_iocs(args.infile.read().splitlines()))
+    if args.t and args.directory:
+        print('-t tails a single live log, it cannot be combined with -d')
+        sys.exit(1)
+    try:
+        sink = open_sink(args.outfile, args.format)
+    except (OSError, ValueError) as err:
+        print('Could not open the output: {:s}'.format(str(err)))
+        sys.exit(1)
+    # jsonl/csv/parquet findings on stdout are piped into other tools, status lines go to stderr then
+    with contextlib.redirect_stdout(status_stream(args.outfile, args.format)):
+        profiler = Profiler.from_args(args)
+        # Certificates repeat across tailed batches (and runs, with --verdict-cache), each is checked once
+        verdicts = VerdictCache(path=args.verdict_cache)
+        if args.t:
+            tail(args, ioc_matcher, sink, profiler, verdicts)
+            with profiler.stage('report'):
+                sink.close()
+            finish(verdicts)
+            profiler.report()
+            return
+        # ascii or json is detected from the start of each log, -j just skips the check
+        from zeek_loader import load_log, load_directory
+        json_format = True if args.json_format else None
+        with profiler.stage('load') as run:
+            if args.directory:
+                print('**Importing zeek logs from directory**')
+                df = load_directory(args.zeek_log_path, json_format=json_format, workers=args.workers, log_type='x509', cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
+            else:
+                print('**Importing zeek log**')
+                df = load_log(args.zeek_log_path, json_format=json_format, cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
+            run.rows = len(df)
+        run_checks(df, ioc_matcher, sink, profiler, verdicts)
+        with profiler.stage('report'):
+            sink.close()
+        finish(verdicts)
+        profiler.report()
 
 
 if __name__ == '__main__':
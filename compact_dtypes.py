@@ -0,0 +1,192 @@
+"""Memory-compact dtypes for loaded Zeek frames
+
+json logs come out of the decoder as Python objects and int64s: every proto, qtype_name or
+@stream value is its own string object and every port eight bytes. compact() applies a per
+log type schema instead:
+    category  low cardinality fields (proto, service, conn_state, cipher, qtype_name, @stream, ...)
+    ip        addresses, as categories (hosts repeat heavily) or packed into uint32 with ips='packed'
+    uintN     ports, counts and flags whose range the protocol bounds (Z fits in a uint8)
+    count     other counters, the smallest unsigned type holding the values seen
+    float32   durations and round trip times
+    intern    repeated but open-ended strings (query, server_name, issuer, subject), every
+              distinct value is stored once and shared by the rows holding it
+Columns a schema doesn't mention are left alone, and so is ts.
+"""
+
+import ipaddress
+import sys
+import numpy as np
+import pandas as pd
+
+# Fields present in every log (and the json logger's own fields)
+COMMON = {
+    '@stream': 'category', '@system': 'category', '@proc': 'category',
+    'id_orig_h': 'ip', 'id_resp_h': 'ip',
+    'id_orig_p': 'uint16', 'id_resp_p': 'uint16',
+}
+# Per log type, fields are spelled the json way (id_orig_h), ascii names are looked up the same way
+SCHEMAS = {
+    'conn': {
+        'proto': 'category', 'service': 'category', 'duration': 'float32',
+        'orig_bytes': 'count', 'resp_bytes': 'count', 'conn_state': 'category',
+        'missed_bytes': 'count', 'history': 'intern', 'orig_pkts': 'count',
+        'orig_ip_bytes': 'count', 'resp_pkts': 'count', 'resp_ip_bytes': 'count',
+    },
+    'dns': {
+        'proto': 'category', 'trans_id': 'uint16', 'rtt': 'float32', 'query': 'intern',
+        'qclass': 'uint16', 'qclass_name': 'category', 'qtype': 'uint16', 'qtype_name': 'category',
+        'rcode': 'uint16', 'rcode_name': 'category', 'Z': 'uint8',
+    },
+    'ssl': {
+        'version': 'category', 'cipher': 'category', 'curve': 'category', 'server_name': 'intern',
+        'subject': 'intern', 'issuer': 'intern', 'validation_status': 'category',
+        'next_protocol': 'category',
+    },
+    'x509': {
+        'certificate_version': 'uint8', 'certificate_subject': 'intern', 'certificate_issuer': 'intern',
+        'certificate_key_alg': 'category', 'certificate_sig_alg': 'category',
+        'certificate_key_type': 'category', 'certificate_key_length': 'uint16',
+        'certificate_exponent': 'category', 'certificate_curve': 'category',
+    },
+}
+UNSIGNED = ['uint8', 'uint16', 'uint32', 'uint64']
+
+
+def schema_for(log_type=None):
+    """Field -> kind for a log type, every type's fields when the type isn't known (mixed logs)"""
+    schema = dict(COMMON)
+    for name in ([log_type] if log_type in SCHEMAS else SCHEMAS):
+        schema.update(SCHEMAS[name])
+    return schema
+
+
+def guess_log_type(path):
+    """Log type from a file name like dns.log, ssl.00:00:00-01:00:00.log or x509_1000.json.log"""
+    name = str(path).replace('\\', '/').rsplit('/', 1)[-1]
+    for log_type in SCHEMAS:
+        if name.startswith(log_type):
+            return log_type
+    return None
+
+
+def _category(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    return series.astype('category')
+
+
+def _intern(series):
+    """Share one string object between the rows holding the same value"""
+    if series.dtype != object:
+        return series
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    # sys.intern also shares values across chunks and with other columns
+    shared = np.empty(len(uniques) + 1, dtype=object)
+    shared[:-1] = [sys.intern(value) if isinstance(value, str) else value for value in uniques]
+    shared[-1] = np.nan
+    return pd.Series(shared[codes], index=series.index, name=series.name)
+
+
+def _unsigned(series, kind):
+    """Narrowest unsigned type for the column, or the column unchanged if the values don't fit"""
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series
+    smin, smax = series.min(), series.max()
+    if pd.isna(smin) or smin < 0:
+        return series
+    if pd.api.types.is_float_dtype(series) and not (series.dropna() % 1 == 0).all():
+        return series
+    if kind == 'count':
+        kind = next(dtype for dtype in UNSIGNED if smax <= np.iinfo(dtype).max)
+    elif smax > np.iinfo(kind).max:
+        return series
+    # Missing values (and columns that were already nullable, like ascii counts) stay nullable
+    if series.hasnans or pd.api.types.is_extension_array_dtype(series):
+        kind = 'U' + kind[1:].capitalize()
+    return series.astype(kind)
+
+
+def _float32(series):
+    return series.astype('float32') if series.dtype == np.float64 else series
+
+
+def pack_ips(series):
+    """IPv4 addresses packed into uint32, columns with IPv6 or missing addresses become categories"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if (codes < 0).any():
+        return _category(series)
+    try:
+        packed = np.array([int(ipaddress.IPv4Address(str(value))) for value in uniques], dtype=np.uint32)
+    except ValueError:
+        return _category(series)
+    return pd.Series(packed[codes], index=series.index, name=series.name)
+
+
+def unpack_ips(series):
+    """Dotted strings back from pack_ips"""
+    if series.dtype != np.uint32:
+        return series
+    codes, uniques = pd.factorize(series)
+    dotted = np.array([str(ipaddress.IPv4Address(int(value))) for value in uniques], dtype=object)
+    return pd.Series(dotted[codes], index=series.index, name=series.name)
+
+
+def compact(df, log_type=None, ips='category'):
+    """Return the frame with the log type's compact dtypes applied
+    Args:
+        df (DataFrame): Frame or chunk from zeek_loader, ascii or json layout
+        log_type (str): conn, dns, ssl or x509, None applies every type's schema
+        ips (str): 'category' or 'packed' (uint32, see pack_ips)
+    """
+    schema = schema_for(log_type)
+    out = df.copy(deep=False)
+    for column in df.columns:
+        kind = schema.get(column.replace('.', '_'))
+        if kind is None:
+            continue
+        series = df[column]
+        if kind == 'category':
+            out[column] = _category(series)
+        elif kind == 'ip':
+            out[column] = pack_ips(series) if ips == 'packed' else _category(series)
+        elif kind == 'intern':
+            out[column] = _intern(series)
+        elif kind == 'float32':
+            out[column] = _float32(series)
+        else:
+            out[column] = _unsigned(series, kind)
+    return out
+
+
+def unify_categories(frames):
+    """Give a column the same categories in every frame so pd.concat keeps it categorical
+    (concatenating categoricals with different categories falls back to object)
+    """
+    columns = set.intersection(*(set(frame.columns) for frame in frames)) if frames else set()
+    frames = list(frames)
+    for column in columns:
+        if not all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            continue
+        categories = pd.Index(np.concatenate([frame[column].cat.categories.to_numpy() for frame in frames])).unique()
+        frames = [frame if frame[column].cat.categories.equals(categories) else
+                  frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    return frames
+
+
+def frame_memory(df):
+    """Bytes held by a frame, counting a string object shared by many rows once
+    (memory_usage(deep=True) counts it once per row, which hides what interning saves)
+    """
+    total = df.index.memory_usage(deep=True)
+    seen = set()
+    for column in df.columns:
+        series = df[column]
+        if series.dtype != object:
+            total += series.memory_usage(index=False, deep=True)
+            continue
+        total += series.memory_usage(index=False, deep=False)
+        for value in series.to_numpy():
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+    return int(total)
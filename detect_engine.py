@@ -0,0 +1,193 @@
+"""Run several detectors over a Zeek log in a single pass
+
+A mixed @stream day log (or a per-type log) is read once, chunk by chunk. Every chunk is split by
+@stream and each part is handed to the detectors registered for that stream, so the dns-length,
+tor/port and cert checks share one parse instead of loading the day three times. Records of
+streams nobody registered for (conn, files, http, ...) are dropped from the raw lines before they
+are decoded.
+
+A detector is anything with:
+    streams   the @stream types it wants, e.g. {'ssl'}
+    fields    the fields it reads, either spelling (id.orig_h or id_orig_h)
+    update(df)  called with every routed part of a chunk, returns text to print right away
+    report()    called once the log is done, returns the summary text
+"""
+
+import sys
+import pandas as pd
+from zeek_loader import iter_log_chunks, list_logs, log_stream
+
+import cert_checker_ascii_json as cert_checker
+import dns_length
+import tor_and_port_counter_ascii_json as tor_counter
+from tor_detect import TorPortStage, format_hits
+from stage_profile import Profiler
+from verdict_cache import VerdictCache
+
+# Column of a mixed json log that tells the streams apart
+STREAM_FIELD = '@stream'
+
+
+class DnsLengthDetector:
+    """dns_length.py's check: dns records whose query or answers are at least length characters"""
+    streams = {'dns'}
+    fields = dns_length.FIELDS
+
+    def __init__(self, length=0):
+        self.length = length
+        self.rows = 0
+        self._hits = []
+
+    def update(self, df):
+        self.rows += len(df)
+        hits = dns_length.long_entries(df.copy(), self.length)
+        if len(hits):
+            self._hits.append(hits)
+        # Printed as one table at the end, like the script does
+        return ''
+
+    def report(self):
+        hits = pd.concat(self._hits) if self._hits else pd.DataFrame(columns=self.fields + ['query_length', 'answer_length'])
+        with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', None):
+            return '\n== dns length >= {:d}: {:d} of {:d} records ==\n{:s}'.format(self.length, len(hits), self.rows, hits.to_string())
+
+
+class TorDetector:
+    """The tor counters' check: Tor-looking ssl issuers/subjects and the port histogram
+    Args:
+        verbose (bool): Add the pair and distinct endpoint sketches to the report (default = False)
+    """
+    streams = {'ssl'}
+    fields = tor_counter.FIELDS
+
+    def __init__(self, verbose=False):
+        self.stage = TorPortStage()
+        self.verbose = verbose
+
+    def update(self, df):
+        hits = self.stage.update(df)
+        return format_hits(hits, timestamps=False) if len(hits) else ''
+
+    def report(self):
+        return '\n== tor ==' + self.stage.report(self.verbose)
+
+
+class CertDetector:
+    """cert_checker_ascii_json.py's check: IOCs, spoofed Let's Encrypt and self-signed certificates
+    Args:
+        ioc_matcher (IOCMatcher): IOCs to look for in the issuer and subject, None for none
+        sink (HitSink): Where the findings are written (default = text on stdout)
+        verdicts (VerdictCache): Verdicts of certificates checked before (default = a new one)
+    """
+    streams = {'x509'}
+    fields = cert_checker.FIELDS
+
+    def __init__(self, ioc_matcher=None, sink=None, verdicts=None):
+        self.ioc_matcher = ioc_matcher
+        self.sink = sink if sink is not None else cert_checker.open_sink(sys.stdout, 'text')
+        self.verdicts = verdicts if verdicts is not None else VerdictCache()
+        self.rows = 0
+
+    def update(self, df):
+        self.rows += len(df)
+        cert_checker.check_certs(df, self.ioc_matcher, self.sink, self.verdicts)
+        return ''
+
+    def report(self):
+        self.sink.close()
+        self.verdicts.save()
+        report = '\n== certs ==\nChecked {:d} certificates, {:d} findings'.format(self.rows, self.sink.rows)
+        # The hit ratio only means something for a cache kept across runs (--verdict-cache)
+        if self.verdicts.path:
+            report += '\n' + self.verdicts.summary()
+        return report
+
+
+class DetectorEngine:
+    """Route the records of a log to the detectors registered for their stream
+    Args:
+        detectors (list): Detector objects, see the module docstring
+        out (file): Where update/report text goes (default = stdout)
+        since (float): Only scan records at or after this ts, epoch seconds (default = None)
+        until (float): Only scan records at or before this ts (default = None)
+        profiler (Profiler): Times reading as load, routing and the detectors as detect and report() as report
+    """
+
+    def __init__(self, detectors, out=sys.stdout, since=None, until=None, profiler=None):
+        self.detectors = list(detectors)
+        self.out = out
+        self.since = since
+        self.until = until
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+        self.routed = {}
+
+    @property
+    def streams(self):
+        return set().union(*(detector.streams for detector in self.detectors))
+
+    @property
+    def fields(self):
+        fields = [STREAM_FIELD, 'ts']
+        for detector in self.detectors:
+            fields += [field for field in detector.fields if field not in fields]
+        return fields
+
+    def _emit(self, text):
+        if text:
+            print(text, file=self.out)
+
+    def update(self, df, stream=None):
+        """Route one chunk
+        Args:
+            df (DataFrame): Chunk of a log, mixed or a single stream
+            stream (str): Stream of the whole chunk when it has no @stream column
+        """
+        if STREAM_FIELD in df.columns:
+            parts = df.groupby(df[STREAM_FIELD].astype(object), sort=False)
+        elif stream is not None:
+            parts = [(stream, df)]
+        else:
+            print('**Skipping a chunk with no @stream and no known log type**')
+            return
+        for name, part in parts:
+            for detector in self.detectors:
+                if name not in detector.streams:
+                    continue
+                # Mixed chunks hold every stream's columns, only pass on the ones the detector reads
+                wanted = {field.replace('.', '_') for field in detector.fields}
+                columns = [column for column in part.columns if column.replace('.', '_') in wanted]
+                self._emit(detector.update(part[columns]))
+            self.routed[name] = self.routed.get(name, 0) + len(part)
+
+    def flush(self):
+        """Write out what the detectors' sinks are holding, after every tailed batch"""
+        for detector in self.detectors:
+            sink = getattr(detector, 'sink', None)
+            if sink is not None:
+                sink.flush()
+        self.out.flush()
+
+    def scan(self, path, json_format=None):
+        """Read a log once, routing every chunk"""
+        stream = log_stream(path)
+        if stream is not None and stream not in self.streams:
+            print('**Skipping {:s}, no detector reads {:s} logs**'.format(path, stream))
+            return
+        chunks = iter_log_chunks(path, json_format=json_format, fields=self.fields, streams=self.streams,
+                                 since=self.since, until=self.until)
+        for chunk in self.profiler.iterate('load', chunks):
+            with self.profiler.stage('detect', len(chunk)):
+                self.update(chunk, stream)
+
+    def scan_directory(self, path, json_format=None):
+        """Scan every log in a directory, one file after the other"""
+        for log in list_logs(path):
+            try:
+                self.scan(log, json_format)
+            except (OSError, ValueError) as err:
+                print('**Skipping {:s} ({:s})**'.format(log, str(err)))
+
+    def report(self):
+        with self.profiler.stage('report'):
+            for detector in self.detectors:
+                self._emit(detector.report())
@@ -2,147 +2,461 @@
 
 # Commandline arguments
 import argparse
-import os
-# Entropy Calculation
-import math
-from collections import Counter
-# Zeek Log Conversion
-import json
-import pandas as pd
-from zat.log_to_dataframe import LogToDataFrame
-from zat.dataframe_to_matrix import DataFrameToMatrix
-# Anomaly Detection
-from sklearn.ensemble import IsolationForest
-from sklearn.cluster import KMeans
-# Cluster Optimization
-from sklearn.manifold import TSNE
-from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-from sklearn.cluster import DBSCAN
-from sklearn.metrics import silhouette_score
+import pickle
+import struct
+import sys
+from ts_index import parse_time
+# Only the option parsing is imported here so -h starts fast, pandas, zat, the loaders and the
+# model stages are imported by the functions that use them (scikit-learn once a model is built)
+from anomaly_stage import FIT_ROWS, parse_contamination
+from auto_k import CRITERIA, SAMPLE_SIZE, parse_k_range
+from stage_profile import Profiler, add_arguments as add_profile_arguments
+
+# Only these fields are decoded from the dns log
+FIELDS = ['ts', 'Z', 'proto', 'qtype_name', 'query', 'answers']
+# Z: "A reserved field that is usually zero in queries and responses."
+FEATURES = ['Z', 'proto', 'qtype_name', 'query_length', 'answer_length', 'entropy']
+# When tailing, the normalization is learned from this many records before clustering starts
+WARMUP_ROWS = 5000
 
 def parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-j', '--json_format',
-            help='Import zeek log in json string format',
+            help='Import zeek log in json string format (detected automatically if not set)',
             action='store_true')
     parser.add_argument('-a', '--anomaly',
             help='Perform clustering on anomalies',
             action='store_true')
+    parser.add_argument('--contamination',
+            help='Expected fraction of anomalies for -a, or auto, default=0.2',
+            type=parse_contamination,
+            default=0.2)
+    parser.add_argument('--threshold',
+            help='Keep rows whose anomaly score (0-1, higher is odder) is at least this, overrides --contamination',
+            type=float,
+            default=None)
     parser.add_argument('-d', '--directory',
             help='Import zeek logs from directory',
             action='store_true')
+    parser.add_argument('-w', '--workers',
+            help='Number of processes used to parse a directory of logs, default=number of cores',
+            type=int,
+            default=None)
     parser.add_argument('-c', '--clusters',
             help='Number of clusters to divide data, default=4',
             type=int,
             default=4)
+    parser.add_argument('--no-dedup',
+            help='Fit and score every record instead of every distinct feature row weighted by its count',
+            dest='dedup',
+            action='store_false')
+    parser.add_argument('--auto-k',
+            help='Pick the number of clusters by scoring candidate K values on a sample (overrides -c)',
+            action='store_true')
+    parser.add_argument('--k-range',
+            help='Candidate K values for --auto-k, e.g. 2-16 or 4,8,12, default=2-16',
+            default='2-16')
+    parser.add_argument('--score',
+            help='Criterion for --auto-k, default=silhouette',
+            choices=sorted(CRITERIA),
+            default='silhouette')
+    parser.add_argument('--sample',
+            help='Rows in the stratified sample --auto-k scores on, default={:d}'.format(SAMPLE_SIZE),
+            type=int,
+            default=SAMPLE_SIZE)
+    parser.add_argument('--seed',
+            help='Seed for KMeans, the anomaly stage and the samples so a run can be repeated, default=0',
+            type=int,
+            default=0)
+    parser.add_argument('-s', '--stream',
+            help='Cluster incrementally chunk by chunk (MiniBatchKMeans) so memory stays bounded',
+            action='store_true')
+    parser.add_argument('-t',
+            action='store_true',
+            default=False,
+            help='Tail a live dns.log and cluster it incrementally as records arrive')
+    parser.add_argument('--checkpoint',
+            help='Offset checkpoint file used with -t, default=one per log under ~/.cache/zat_logs/tail',
+            default=None)
+    parser.add_argument('--save-model',
+            help='Save the fitted normalizer, anomaly model and clusters to this file',
+            default=None)
+    parser.add_argument('--model',
+            help='Load a model saved with --save-model and only assign records to its clusters, no fitting',
+            default=None)
+    parser.add_argument('--cache',
+            help='Reuse parsed logs from the on-disk parse cache (clear with parse_cache.py --clear)',
+            action='store_true')
+    parser.add_argument('--since',
+            help='Only records at or after this time, epoch seconds or a UTC date like "2020-04-30 00:10"',
+            type=parse_time,
+            default=None)
+    parser.add_argument('--until',
+            help='Only records at or before this time, see --since',
+            type=parse_time,
+            default=None)
+    add_profile_arguments(parser)
     parser.add_argument('zeek_log_path',
             type=str,
             help='Type in location of zeek log')
     args = parser.parse_args()
-    if args.json_format:
-        if args.directory:
-            print('**Importing zeek logs from directory in json format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            '''
-            df = import_json(zeek_logs[0])
-            for log in zeek_logs[1:]:
-                print('**Appending log**')
-                df = df.append(import_json(log))
-            '''
-            logs = []
-            for log in zeek_logs:
-                logs.append(import_json(log))
-            df = pd.concat(logs)
-        else:
-            print('**Importing zeek log in json format**')
-            df = import_json(args.zeek_log_path)
-    else:
+    if args.t and args.directory:
+        parser.error('-t tails a single live log, it cannot be combined with -d')
+    if args.model and (args.save_model or args.auto_k):
+        parser.error('--model only assigns records to saved clusters, it cannot be combined with --save-model or --auto-k')
+    args.profiler = Profiler.from_args(args)
+    if args.stream or args.t or args.model:
+        # Streaming modes and inference read the logs themselves, see stream(), tail() and score()
+        return None, args
+    from zeek_loader import load_log, load_directory
+    # ascii or json is detected from the start of each log, -j just skips the check
+    json_format = True if args.json_format else None
+    with args.profiler.stage('load') as run:
         if args.directory:
-            print('**Importing zeek logs from directory in ascii format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            logs = []
-            log_to_df = LogToDataFrame()
-            for log in zeek_logs:
-                logs.append(log_to_df.create_dataframe(log))
-            df = pd.concat(logs)
+            print('**Importing zeek logs from directory**')
+            df = load_directory(args.zeek_log_path, json_format=json_format, workers=args.workers, log_type='dns', cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
         else:
-            print('**Importing zeek log in ascii format**')
-            print('**If this hangs for longer than a 17 sec, high chance you are trying to import a log in json format instead, use -j**')
-            log_to_df = LogToDataFrame()
-            df = log_to_df.create_dataframe(args.zeek_log_path)
-    return df, args.anomaly, args.clusters
-
-def import_json(path):
-    # list of json strings, each log entry is a string
-    with open(path) as json_file:
-        lines = json_file.readlines()
-    # json.loads converts a json string into a dict
-    # this is run on each line
-    # a dataframe is created from a sequence of dicts using from_records
-    df = pd.DataFrame.from_records(map(json.loads, lines))
+            print('**Importing zeek log**')
+            df = load_log(args.zeek_log_path, json_format=json_format, cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
+        run.rows = len(df)
+    return df, args
+
+def add_features(df):
+    from dns_features import batch_entropy
+    from parse_cache import list_lengths
+    # lengths and entropy will be calculated and added to the dataframe
+    df['query_length'] = df['query'].str.len()
+    df['answer_length'] = list_lengths(df['answers'])
+    # one vectorized pass over the whole column, see dns_features.py for the per-query reference
+    df['entropy'] = batch_entropy(df['query'])
     return df
 
-def entropy(string):
-    p, lns = Counter(string), float(len(string))
-    return -sum(count/lns * math.log(count/lns, 2) for count in p.values())
+def report_columns(args):
+    # anomaly scores are shown with -a so rows can be ranked
+    return FEATURES + ['query'] + (['anomaly_score'] if args.anomaly else []) + ['cluster']
 
-def main():
-    df, anomaly, n_clusters = parser()
+def new_summary(args):
+    from stream_cluster import ClusterSummary
+    return ClusterSummary(rank_by='anomaly_score' if args.anomaly else None)
+
+def anomalies(odd_clf, to_matrix, chunk):
+    # Score every row of a chunk and keep the anomalous ones along with their scores
+    scores = odd_clf.score(to_matrix.transform(chunk[FEATURES]))
+    keep = odd_clf.is_anomaly(scores)
+    chunk = chunk[keep].copy()
+    chunk['anomaly_score'] = scores[keep]
+    return chunk
+
+def pick_k(matrix, args):
+    from auto_k import choose_k
+    # K candidates run in parallel (-w workers) on the sample, stopping once the scores plateau
+    print('**Scoring K = {:s} on {:d} sampled rows ({:s})**'.format(args.k_range, len(matrix), args.score))
+    k, table = choose_k(matrix, parse_k_range(args.k_range), args.score, workers=args.workers, random_state=args.seed)
+    print(table.to_string(index=False))
+    print('**Using {:d} clusters**'.format(k))
+    return k
+
+def log_chunks(args):
+    from zeek_loader import iter_log_chunks, iter_directory_chunks
+    json_format = True if args.json_format else None
+    if args.directory:
+        chunks = iter_directory_chunks(args.zeek_log_path, json_format=json_format, log_type='dns', fields=FIELDS,
+                                       since=args.since, until=args.until)
+    else:
+        chunks = iter_log_chunks(args.zeek_log_path, json_format=json_format, fields=FIELDS, since=args.since, until=args.until)
+    # Reading every chunk counts as load, once per pass
+    return args.profiler.iterate('load', chunks)
+
+def stream(args):
+    import pandas as pd
+    from anomaly_stage import AnomalyStage
+    from auto_k import StratifiedReservoir
+    from dns_model import ClusterModel
+    from stream_cluster import StreamingMatrix, StreamingKMeans
+    # Every pass holds a single chunk in memory, the log is read once per pass
+    profiler = args.profiler
+    print('**Pass 1: learning the feature normalization**')
+    to_matrix = StreamingMatrix()
+    # Samples stratified by qtype, for --auto-k and for training the anomaly stage
+    reservoir = StratifiedReservoir(args.sample, random_state=args.seed) if args.auto_k else None
+    odd_reservoir = StratifiedReservoir(FIT_ROWS, random_state=args.seed) if args.anomaly else None
+    rows = 0
+    for chunk in log_chunks(args):
+        with profiler.stage('featurize', len(chunk)):
+            to_matrix.partial_fit(add_features(chunk)[FEATURES])
+        with profiler.stage('fit', len(chunk)):
+            for sampler in (reservoir, odd_reservoir):
+                if sampler:
+                    sampler.update(chunk[FEATURES], chunk['qtype_name'])
+        rows += len(chunk)
+    if not rows:
+        print('No dns records found')
+        return
+    with profiler.stage('featurize'):
+        to_matrix.finish()
+    odd_clf = None
+    with profiler.stage('fit'):
+        if odd_reservoir:
+            odd_clf = AnomalyStage(contamination=args.contamination, threshold=args.threshold, random_state=args.seed)
+            odd_clf.fit(to_matrix.transform(odd_reservoir.sample()))
+        num_clusters = min(rows, args.clusters)
+        if reservoir:
+            sample = reservoir.sample()
+            if odd_clf:
+                sample = anomalies(odd_clf, to_matrix, sample)
+            num_clusters = pick_k(to_matrix.transform(sample[FEATURES]), args)
+
+    print('**Pass 2: fitting clusters**')
+    kmeans = StreamingKMeans(num_clusters, to_matrix, random_state=args.seed)
+    for chunk in log_chunks(args):
+        with profiler.stage('featurize', len(chunk)):
+            add_features(chunk)
+        if odd_clf:
+            with profiler.stage('detect', len(chunk)):
+                chunk = anomalies(odd_clf, to_matrix, chunk)
+        with profiler.stage('fit', len(chunk)):
+            kmeans.partial_fit(chunk[FEATURES])
+    if args.save_model:
+        save_model(args.save_model, ClusterModel(FEATURES, to_matrix, kmeans.kmeans, anomaly=odd_clf))
+
+    print('**Pass 3: assigning clusters**')
+    summary = new_summary(args)
+    offset = 0
+    for chunk in log_chunks(args):
+        with profiler.stage('featurize', len(chunk)):
+            add_features(chunk)
+        # json chunks each count rows from 0, number them across the whole log instead
+        if not isinstance(chunk.index, pd.DatetimeIndex):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        with profiler.stage('detect', len(chunk)):
+            if odd_clf:
+                chunk = anomalies(odd_clf, to_matrix, chunk)
+            chunk['cluster'] = kmeans.predict(chunk[FEATURES]) if len(chunk) else []
+        with profiler.stage('report', len(chunk)):
+            summary.update(chunk[report_columns(args)], chunk['cluster'])
+    with profiler.stage('report'):
+        print(summary.report())
+
+def save_model(path, model):
+    model.save(path)
+    print('**Saved model ({:d} clusters) to {:s}**'.format(model.n_clusters, path))
+
+def load_model(args):
+    from dns_model import ClusterModel
+    try:
+        model = ClusterModel.load(args.model, FEATURES)
+    except (OSError, ValueError, EOFError, KeyError, IndexError, pickle.UnpicklingError, struct.error) as err:
+        # A truncated or corrupt file fails somewhere inside the unpickler, with whichever of these
+        print('Could not load model: {:s}'.format(str(err)))
+        sys.exit(1)
+    if args.anomaly and model.anomaly is None:
+        print('{:s} was not fitted with -a, it has no anomaly model'.format(args.model))
+        sys.exit(1)
+    print('**Loaded model ({:d} clusters) from {:s}**'.format(model.n_clusters, args.model))
+    return model
+
+def assign(model, chunk, args):
+    # Run a chunk through a saved model, returns the report rows and their clusters
+    keep, labels, scores = model.predict(chunk, anomaly=args.anomaly)
+    chunk = chunk[keep].copy()
+    if args.anomaly:
+        chunk['anomaly_score'] = scores
+    chunk['cluster'] = labels
+    return chunk[report_columns(args)], chunk['cluster']
+
+def score(args, model):
+    import pandas as pd
+    # Inference only, a chunk at a time: transform, keep anomalies (-a) and assign saved clusters
+    profiler = args.profiler
+    summary = new_summary(args)
+    offset = 0
+    for chunk in log_chunks(args):
+        with profiler.stage('featurize', len(chunk)):
+            add_features(chunk)
+        if not isinstance(chunk.index, pd.DatetimeIndex):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        with profiler.stage('detect', len(chunk)):
+            hits = assign(model, chunk, args)
+        with profiler.stage('report', len(hits[0])):
+            summary.update(*hits)
+    with profiler.stage('report'):
+        print(summary.report())
+
+def tail(args, model=None):
+    import pandas as pd
+    from anomaly_stage import AnomalyStage
+    from auto_k import StratifiedReservoir
+    from dns_model import ClusterModel
+    from stream_cluster import StreamingMatrix, StreamingKMeans
+    from zeek_tail import LogTailer
+    tailer = LogTailer(args.zeek_log_path, fields=FIELDS, checkpoint=args.checkpoint, since=args.since, until=args.until)
+    profiler = args.profiler
+    to_matrix = StreamingMatrix()
+    kmeans = None
+    odd_clf = None
+    summary = new_summary(args)
+    warmup = []
+    rows = 0
+    print('**Tailing {:s}, Ctrl-C to stop**'.format(args.zeek_log_path))
+    try:
+        # load includes the time spent waiting for the log to grow
+        for batch in profiler.iterate('load', tailer.batches()):
+            with profiler.stage('featurize', len(batch)):
+                add_features(batch)
+            batch.index = pd.RangeIndex(rows, rows + len(batch))
+            rows += len(batch)
+            if model is not None:
+                # Saved model, nothing to fit
+                with profiler.stage('detect', len(batch)):
+                    batch, _ = assign(model, batch, args)
+            elif kmeans is None:
+                # Learn the normalization from the first records, later values are scaled with it
+                warmup.append(batch)
+                with profiler.stage('featurize'):
+                    to_matrix.partial_fit(batch[FEATURES])
+                if rows < max(WARMUP_ROWS, args.clusters):
+                    continue
+                batch = pd.concat(warmup)
+                with profiler.stage('fit', len(batch)):
+                    to_matrix.finish()
+                    if args.anomaly:
+                        odd_clf = AnomalyStage(contamination=args.contamination, threshold=args.threshold, random_state=args.seed)
+                        odd_clf.fit(to_matrix.transform(batch[FEATURES]))
+                    num_clusters = args.clusters
+                    if args.auto_k:
+                        sample = StratifiedReservoir(args.sample, random_state=args.seed).update(batch[FEATURES], batch['qtype_name']).sample()
+                        if odd_clf:
+                            sample = anomalies(odd_clf, to_matrix, sample)
+                        num_clusters = pick_k(to_matrix.transform(sample[FEATURES]), args)
+                    kmeans = StreamingKMeans(num_clusters, to_matrix, random_state=args.seed)
+                warmup = None
+            if model is None:
+                if odd_clf:
+                    with profiler.stage('detect', len(batch)):
+                        batch = anomalies(odd_clf, to_matrix, batch)
+                if not len(batch):
+                    tailer.commit()
+                    continue
+                with profiler.stage('fit', len(batch)):
+                    kmeans.partial_fit(batch[FEATURES])
+                with profiler.stage('detect', len(batch)):
+                    batch['cluster'] = kmeans.predict(batch[FEATURES])
+            with profiler.stage('report', len(batch)):
+                summary.update(batch[report_columns(args)], batch['cluster'])
+                sizes = batch['cluster'].value_counts().sort_index()
+                print('**{:d} records, cluster sizes: {:s}**'.format(
+                    len(batch), ' '.join('{:d}={:d}'.format(key, count) for key, count in sizes.items())), flush=True)
+            tailer.commit()
+    except KeyboardInterrupt:
+        pass
+    if model is None and kmeans is None:
+        print('Only {:d} records seen, not enough to cluster'.format(rows))
+        return
+    if args.save_model and kmeans is not None:
+        save_model(args.save_model, ClusterModel(FEATURES, to_matrix, kmeans.kmeans, anomaly=odd_clf))
+    with profiler.stage('report'):
+        print(summary.report())
+
+def cluster(df, args):
+    import numpy as np
+    import pandas as pd
+    from zat.dataframe_to_matrix import DataFrameToMatrix
+    from anomaly_stage import AnomalyStage
+    from auto_k import StratifiedReservoir
+    from dns_features import dedup
+    from dns_model import ClusterModel
+    profiler = args.profiler
+    anomaly, n_clusters = args.anomaly, args.clusters
 
     ######## Preprocessing
-    # lengths and entropy will be calculated and added to the dataframe
-    df['query_length'] = df['query'].str.len()
-    df['answer_length'] = df['answers'].str.len()
-    df['entropy'] = df['query'].map(lambda x: entropy(x))
-    # Z: "A reserved field that is usually zero in queries and responses."
-    features = ['Z', 'proto', 'qtype_name', 'query_length', 'answer_length', 'entropy']
-    # normalizes and cleans data for use by models
-    to_matrix = DataFrameToMatrix()
-    zeek_matrix = to_matrix.fit_transform(df[features])
+    with profiler.stage('featurize', len(df)):
+        add_features(df)
+        features = list(FEATURES)
+        # popular queries repeat the same feature row over and over, the models see every distinct
+        # row once and its count (how many records it stands for) is the sample weight
+        if args.dedup:
+            distinct, counts, inverse = dedup(df[features])
+            print('**{:d} records, {:d} distinct feature rows**'.format(len(df), len(distinct)))
+        else:
+            distinct, counts, inverse = df[features], np.ones(len(df), dtype=np.int64), np.arange(len(df))
+        # normalizes and cleans data for use by models
+        # (min-max scaling and sorted categories, the distinct rows give the same matrix rows)
+        to_matrix = DataFrameToMatrix()
+        zeek_matrix = to_matrix.fit_transform(distinct)
 
     ######## Clustering with KMeans
     if anomaly:
         ######## Anomaly Classifer
-        # might be worth changing this parameter around to 0.25?
-        # leaving blank allows "auto"... hmmm
-        odd_clf = IsolationForest(contamination=0.2)
-        odd_clf.fit(zeek_matrix)
-        predictions = odd_clf.predict(zeek_matrix)
-        # create new dataframe with predictions added in
-        odd_df = df[features][predictions == -1]
-        # select only those that are anomalous
-        df = df[predictions == -1].copy()
-        zeek_matrix = to_matrix.fit_transform(odd_df)
-
-    num_clusters = min(len(df), n_clusters)
+        # trained on a subsample with every core, then every row is scored in chunks
+        # --contamination auto or --threshold replace the fixed 20% cut
+        with profiler.stage('fit', len(df)):
+            odd_clf = AnomalyStage(contamination=args.contamination, threshold=args.threshold, random_state=args.seed).fit(zeek_matrix, counts)
+        with profiler.stage('detect', len(df)):
+            # a row's score only depends on its features, each distinct row is scored once
+            scores = odd_clf.score(zeek_matrix)
+            odd = odd_clf.is_anomaly(scores)
+            predictions = odd[inverse]
+            print('**{:d} of {:d} records have an anomaly score of at least {:.3f}**'.format(
+                int(predictions.sum()), len(df), odd_clf.cut))
+            # select only those that are anomalous, they keep the normalization fitted above
+            df = df[predictions].copy()
+            df['anomaly_score'] = scores[inverse[predictions]]
+            zeek_matrix, counts = zeek_matrix[odd], counts[odd]
+            inverse = (np.cumsum(odd) - 1)[inverse[predictions]]
+        if df.empty:
+            print('No anomalies found')
+            return
+
+    num_clusters = min(len(zeek_matrix), n_clusters)
 
     '''
     ######## DBScan to pick K
+    from sklearn.cluster import DBSCAN
     df['cluster_db'] = DBSCAN().fit_predict(zeek_matrix)
     #print('Number of Clusters: {:d}'.format(df['cluster_db'].nunique()))
     '''
 
-    '''
-    scores = []
-    clusters = range(2, min(len(df), 16))
-    for K in clusters:
-        clusterer = KMeans(n_clusters=K)
-        cluster_labels = clusterer.fit_predict(zeek_matrix)
-        score = silhouette_score(zeek_matrix, cluster_labels)
-        scores.append(score)
-    print(pd.DataFrame({'Num Clusters':clusters, 'Score':scores}))
-    '''
+    with profiler.stage('fit', len(df)):
+        if args.auto_k:
+            rows = pd.DataFrame({'row': np.arange(len(df))})
+            sample = StratifiedReservoir(args.sample, random_state=args.seed).update(rows, df['qtype_name'].to_numpy()).sample()
+            num_clusters = min(pick_k(zeek_matrix[inverse[sample['row'].to_numpy()]], args), len(zeek_matrix))
 
-    df['cluster'] = KMeans(n_clusters=num_clusters).fit_predict(zeek_matrix)
-    # try number of different clusters with silhouette testing
-    features += ['query']
-    cluster_groups = df[features+['cluster']].groupby('cluster')
-    for key, group in cluster_groups:
-        print('\nCluster {:d}: {:d} observations'.format(key, len(group)))
-        # print(group.head())
-        print(group)
+        from sklearn.cluster import KMeans
+        # Seeded so a rerun gives the same clusters, a distinct row weighted by its count pulls
+        # the centers exactly like that many copies of it would
+        kmeans = KMeans(n_clusters=num_clusters, random_state=args.seed)
+        kmeans.fit(zeek_matrix, sample_weight=counts)
+        # every record gets the label of its distinct row
+        df['cluster'] = kmeans.labels_[inverse]
+    if args.save_model:
+        save_model(args.save_model, ClusterModel(FEATURES, to_matrix, kmeans, anomaly=odd_clf if anomaly else None))
+    with profiler.stage('report', len(df)):
+        cluster_groups = df[report_columns(args)].groupby('cluster')
+        for key, group in cluster_groups:
+            print('\nCluster {:d}: {:d} observations'.format(key, len(group)))
+            # print(group.head())
+            if anomaly:
+                # most anomalous first
+                group = group.sort_values('anomaly_score', ascending=False)
+            print(group)
     return
 
+def main():
+    df, args = parser()
+    model = load_model(args) if args.model else None
+    if args.t:
+        tail(args, model)
+    elif model is not None:
+        score(args, model)
+    elif args.stream:
+        stream(args)
+    else:
+        cluster(df, args)
+    args.profiler.report()
+
 
 if __name__ == "__main__":
     main()
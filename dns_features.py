@@ -0,0 +1,135 @@
+"""Vectorized per-query features for DNS logs
+
+Every query in a column is laid out end to end in one uint32 code point array (a single
+utf-32 encode) and per-row character histograms are built with bincount over the row offsets,
+a block of rows at a time. Entropy, character-class ratios and label statistics all come out of
+that one pass instead of a Python Counter per query.
+"""
+
+import math
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# Rows per histogram block, each block holds a rows x alphabet count matrix
+CHUNK_ROWS = 16384
+
+FEATURES = ['entropy', 'digit_ratio', 'alpha_ratio', 'upper_ratio', 'special_ratio',
+            'label_count', 'longest_label']
+
+
+def entropy(string):
+    """Shannon entropy (bits per character) of a single string, the reference for batch_entropy"""
+    p, lns = Counter(string), float(len(string))
+    return -sum(count/lns * math.log(count/lns, 2) for count in p.values())
+
+
+def _block_features(codes, lengths, out, rows):
+    """Fill the feature arrays in out for one block of rows
+    Args:
+        codes (ndarray): uint32 code points of every query in the block, end to end
+        lengths (ndarray): Length of each query in the block
+        out (dict): Feature name -> output array
+        rows (slice): Where this block lands in the output arrays
+    """
+    num_rows = len(lengths)
+    if not len(codes):
+        for name in FEATURES:
+            out[name][rows] = 0.0
+        for name in ['digit_ratio', 'alpha_ratio', 'upper_ratio', 'special_ratio']:
+            out[name][rows] = np.nan
+        return
+    row_ids = np.repeat(np.arange(num_rows), lengths)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    nonempty = lengths > 0
+
+    # Remap code points onto the alphabet actually present in the block (a few dozen for DNS)
+    present = np.bincount(codes) > 0
+    alphabet = np.flatnonzero(present)
+    remap = np.cumsum(present) - 1
+    width = len(alphabet)
+    hist = np.bincount(row_ids * width + remap[codes], minlength=num_rows * width).reshape(num_rows, width)
+
+    # H = log2(L) - sum(n * log2(n)) / L, with n * log2(n) looked up from a table
+    max_count = int(lengths.max())
+    table = np.arange(max_count + 1, dtype=np.float64)
+    table[1:] *= np.log2(table[1:])
+    size = lengths.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ent = np.log2(size) - table[hist].sum(axis=1) / size
+    ent[~nonempty] = 0.0
+    out['entropy'][rows] = ent
+
+    # Character classes of the alphabet, summed per row with one matrix product
+    classes = np.stack([
+        (alphabet >= 48) & (alphabet <= 57),
+        (alphabet >= 65) & (alphabet <= 90),
+        (alphabet >= 97) & (alphabet <= 122),
+        alphabet == 46,
+    ], axis=1).astype(np.float64)
+    digits, upper, lower, dots = (hist @ classes).T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['digit_ratio'][rows] = digits / size
+        out['alpha_ratio'][rows] = (upper + lower) / size
+        out['upper_ratio'][rows] = upper / size
+        out['special_ratio'][rows] = (size - digits - upper - lower - dots) / size
+
+    # Labels: a new segment starts at every row start and after every dot
+    is_dot = codes == 46
+    starts = np.zeros(len(codes), dtype=bool)
+    starts[offsets[nonempty]] = True
+    starts[1:] |= is_dot[:-1]
+    seg = np.cumsum(starts) - 1
+    seg_len = np.bincount(seg, weights=~is_dot)
+    # Segments never cross rows, so each non-empty row owns a contiguous run of them
+    first = seg[offsets[nonempty]]
+    longest = np.zeros(num_rows)
+    labels = np.zeros(num_rows)
+    longest[nonempty] = np.maximum.reduceat(seg_len, first)
+    labels[nonempty] = np.add.reduceat(seg_len > 0, first)
+    out['longest_label'][rows] = longest
+    out['label_count'][rows] = labels
+
+
+def query_features(queries, chunk_rows=CHUNK_ROWS):
+    """Compute entropy, character-class ratios and label statistics for a column of queries
+    Args:
+        queries (Series): DNS queries, anything that isn't a string gets NaN features
+        chunk_rows (int): Rows per histogram block
+    Returns:
+        DataFrame with a column per name in FEATURES, same index as queries
+    """
+    queries = pd.Series(queries)
+    out = {name: np.full(len(queries), np.nan) for name in FEATURES}
+    is_str = np.fromiter((isinstance(query, str) for query in queries), dtype=bool, count=len(queries))
+    positions = np.flatnonzero(is_str)
+    strings = queries.to_numpy()[positions].tolist()
+
+    block = {name: np.empty(len(strings)) for name in FEATURES}
+    for start in range(0, len(strings), chunk_rows):
+        part = strings[start:start + chunk_rows]
+        lengths = np.fromiter(map(len, part), dtype=np.int64, count=len(part))
+        # utf-32 gives exactly one code unit per character, matching len() and Counter
+        codes = np.frombuffer(''.join(part).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        _block_features(codes, lengths, block, slice(start, start + len(part)))
+
+    for name in FEATURES:
+        out[name][positions] = block[name]
+    return pd.DataFrame(out, index=queries.index)
+
+
+def batch_entropy(queries, chunk_rows=CHUNK_ROWS):
+    """Shannon entropy for a whole column of queries, matches entropy() row for row"""
+    return query_features(queries, chunk_rows)['entropy']
+
+
+def dedup(features):
+    """Collapse identical feature rows, popular queries repeat the same row over and over
+    Returns:
+        (DataFrame of the distinct rows in order of first appearance, how many records each of them
+        stands for, the distinct row of every record) so that distinct.iloc[inverse] is the input again
+    """
+    inverse = features.groupby(list(features.columns), sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    counts = np.bincount(inverse)
+    _, first = np.unique(inverse, return_index=True)
+    return features.iloc[first].reset_index(drop=True), counts, inverse
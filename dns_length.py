@@ -2,68 +2,100 @@
 
 # Commandline arguments
 import argparse
-# Zeek Log Conversion
-import json
-import pandas as pd
-from zat.log_to_dataframe import LogToDataFrame
-from zat.dataframe_to_matrix import DataFrameToMatrix
+import contextlib
+# Zeek Log Conversion, pandas and the loader are imported where they are used so -h starts fast
+from ts_index import parse_time
+from hit_sink import HitSink, FORMATS, status_stream
+from stage_profile import Profiler, add_arguments as add_profile_arguments
+
+# Only these fields are decoded from the dns log, either spelling (id.orig_h/id_orig_h) works
+FIELDS = ['id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p', 'query', 'answers']
 
 def parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-j', '--json_format',
-            help='Import zeek log in json string format',
+            help='Import zeek log in json string format (detected automatically if not set)',
             action='store_true')
     parser.add_argument('-l', '--length',
             help='Filter queries that have characters greater than this length',
             type=int,
             default=0)
+    parser.add_argument('--cache',
+            help='Reuse parsed logs from the on-disk parse cache (clear with parse_cache.py --clear)',
+            action='store_true')
+    parser.add_argument('--since',
+            help='Only records at or after this time, epoch seconds or a UTC date like "2020-04-30 00:10"',
+            type=parse_time,
+            default=None)
+    parser.add_argument('--until',
+            help='Only records at or before this time, see --since',
+            type=parse_time,
+            default=None)
+    parser.add_argument('-f', '--format',
+            help='Output format: {:s}, default=text (one table, compact is much faster on large outputs)'.format(', '.join(FORMATS)),
+            choices=FORMATS,
+            default='text')
+    parser.add_argument('-o', '--output',
+            help='File the entries are written to, default=stdout',
+            default='-')
+    add_profile_arguments(parser)
     parser.add_argument('zeek_log_path',
             type=str,
             help='Type in location of zeek log')
     args = parser.parse_args()
-    if args.json_format:
-        print('**Importing zeek log in json format**')
-        df = import_json(args.zeek_log_path)
-    else:
-        print('**Importing zeek log in ascii format**')
-        print('**If this hangs for longer than a 17 sec, high chance you are trying to import a log in json format instead, use -j**')
-        log_to_df = LogToDataFrame()
-        df = log_to_df.create_dataframe(args.zeek_log_path)
-    return df, args.length
+    args.profiler = Profiler.from_args(args)
+    # jsonl/csv/parquet entries on stdout are piped into other tools, status lines go to stderr then
+    args.status = status_stream(args.output, args.format)
+    from zeek_loader import load_log
+    # ascii or json is detected from the start of the log, -j just skips the check
+    with contextlib.redirect_stdout(args.status), args.profiler.stage('load') as run:
+        print('**Importing zeek log**')
+        df = load_log(args.zeek_log_path, json_format=True if args.json_format else None, cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
+        run.rows = len(df)
+    return df, args
 
-def import_json(path):
-    # list of json strings, each log entry is a string
-    with open(path) as json_file:
-        lines = json_file.readlines()
-    # json.loads converts a json string into a dict
-    # this is run on each line
-    # a dataframe is created from a sequence of dicts using from_records
-    df = pd.DataFrame.from_records(map(json.loads, lines))
-    return df
+def long_entries(df, length):
+    from parse_cache import list_lengths, python_lists
+    # entries whose query or answers are at least length characters long
+    df['query_length'] = df['query'].str.len()
+    df['answer_length'] = list_lengths(df['answers'])
+    # A cache hit keeps answers as Arrow lists, only the hits are printed so only they are converted
+    return python_lists(df[(df['query_length'] >= length) | (df['answer_length'] >= length)])
 
-def main():
-    df, length = parser()
+def format_table(hits):
+    import pandas as pd
+    # options to change if you want to see everything, otherwise will be cut off in terminal
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', None):
+        #pd.set_option('display.max_colwidth', None)
+        return str(hits) + '\n'
 
-    df['query_length'] = df['query'].str.len()
-    df['answer_length'] = df['answers'].str.len()
+def main():
+    df, args = parser()
 
-    # full list of possible columns to print, choose wisely
+    # full list of possible columns to print, choose wisely, and add them to FIELDS
     '''
     display_df = df['id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p',
             'proto', 'trans_id', 'rtt', 'query', 'qclass', 'qclass_name',
             'qtype', 'qtype_name', 'rcode', 'rcode_name', 'AA', 'TC', 'RD',
             'RA', 'Z', 'answers', 'TTLs', 'rejected', 'query_length', 'answer_length']
     '''
-    display_df = df[['id_orig_h', 'id_orig_p', 'id_resp_h', 'id_resp_p', 'query', 'answers',
-            'query_length', 'answer_length']]
-
-    # options to change if you want to see everything, otherwise will be cut off in terminal
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.max_columns', None)
-    pd.set_option('display.width', None)
-    #pd.set_option('display.max_colwidth', None)
+    # only FIELDS were loaded, in the log's own spelling (id.orig_h for ascii, id_orig_h for json)
+    with args.profiler.stage('detect', len(df)):
+        display_df = long_entries(df, args.length)
 
-    print(display_df[(display_df['query_length'] >= length) | (display_df['answer_length'] >= length)])
+    try:
+        sink = HitSink(args.output, args.format, text=format_table)
+    except (OSError, ValueError) as err:
+        print('Could not open the output: {:s}'.format(str(err)))
+        return
+    # text renders one aligned table, slow for large outputs, compact/jsonl/csv/parquet are much cheaper
+    with args.profiler.stage('report', len(display_df)):
+        sink.write(display_df)
+        sink.close()
+    with contextlib.redirect_stdout(args.status):
+        if display_df.empty:
+            print('No queries or answers of at least {:d} characters'.format(args.length))
+        args.profiler.report()
     return
 
 if __name__ == "__main__":
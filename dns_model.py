@@ -0,0 +1,103 @@
+"""Fitted dns_clustering models saved to disk and used for inference only
+
+A model file holds everything a run fits: the normalizer, the anomaly stage (when the model was
+fitted with -a) and the KMeans clusters, together with the feature schema they were fitted on and a
+format version. Loading one skips fitting entirely, new logs are only transformed, filtered and
+assigned to the saved clusters, a chunk at a time.
+"""
+
+import contextlib
+import io
+import time
+import numpy as np
+
+# Bump when the saved layout changes, older files are refused instead of misread
+MODEL_VERSION = 2
+# Rows transformed and scored at once during inference
+PREDICT_ROWS = 65536
+
+
+# scikit-learn (and joblib) take a second to import, they are only loaded once a model is saved or loaded
+def sklearn_version():
+    import sklearn
+    return sklearn.__version__
+
+
+class ClusterModel:
+    """Everything needed to assign new DNS records to clusters fitted earlier
+    Args:
+        features (list): Feature columns the models were fitted on, in order
+        normalizer: Fitted DataFrameToMatrix or StreamingMatrix, shared by both stages
+        kmeans: Fitted KMeans or MiniBatchKMeans
+        anomaly: Fitted AnomalyStage, None if the model wasn't fitted on anomalies
+    """
+
+    def __init__(self, features, normalizer, kmeans, anomaly=None):
+        self.features = list(features)
+        self.normalizer = normalizer
+        self.kmeans = kmeans
+        self.anomaly = anomaly
+
+    @property
+    def n_clusters(self):
+        return len(self.kmeans.cluster_centers_)
+
+    def save(self, path):
+        state = {
+            'version': MODEL_VERSION,
+            'features': self.features,
+            'n_features': self.kmeans.cluster_centers_.shape[1],
+            'sklearn': sklearn_version(),
+            'created': time.time(),
+            'normalizer': self.normalizer,
+            'anomaly': self.anomaly,
+            'kmeans': self.kmeans,
+        }
+        import joblib
+        joblib.dump(state, path)
+
+    @classmethod
+    def load(cls, path, features=None):
+        """Load a saved model, refusing other format versions or a different feature schema"""
+        import joblib
+        state = joblib.load(path)
+        if not isinstance(state, dict) or state.get('version') != MODEL_VERSION:
+            version = state.get('version') if isinstance(state, dict) else None
+            raise ValueError('{:s} is a version {} model, this version reads version {:d}'.format(path, version, MODEL_VERSION))
+        if features is not None and list(features) != state['features']:
+            raise ValueError('{:s} was fitted on features {}, not {}'.format(path, state['features'], list(features)))
+        if state['sklearn'] != sklearn_version():
+            print('**{:s} was saved with scikit-learn {:s}, running {:s}**'.format(path, state['sklearn'], sklearn_version()))
+        return cls(state['features'], state['normalizer'], state['kmeans'], state['anomaly'])
+
+    @staticmethod
+    def _transform(normalizer, df):
+        # DataFrameToMatrix.transform prints a line per column, don't repeat it for every chunk
+        with contextlib.redirect_stdout(io.StringIO()):
+            return normalizer.transform(df)
+
+    def predict(self, df, anomaly=False, predict_rows=PREDICT_ROWS):
+        """Assign records to the saved clusters, predict_rows at a time
+        Args:
+            df (DataFrame): Records with every column in self.features
+            anomaly (bool): Only keep the records the saved anomaly stage flags
+        Returns:
+            (boolean mask of the rows kept, cluster labels of the kept rows, anomaly scores of the
+            kept rows or None without anomaly)
+        """
+        keep = np.ones(len(df), dtype=bool)
+        labels = []
+        scores = []
+        for start in range(0, len(df), predict_rows):
+            matrix = self._transform(self.normalizer, df[self.features].iloc[start:start + predict_rows])
+            if anomaly:
+                part_scores = self.anomaly.score(matrix)
+                odd = self.anomaly.is_anomaly(part_scores)
+                keep[start:start + len(matrix)] = odd
+                matrix = matrix[odd]
+                scores.append(part_scores[odd])
+            if len(matrix):
+                labels.append(self.kmeans.predict(matrix))
+        labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int32)
+        scores = (np.concatenate(scores) if scores else np.empty(0)) if anomaly else None
+        return keep, labels, scores
@@ -0,0 +1,196 @@
+"""Buffered, structured output for the hits the scripts report
+
+Scripts hand a HitSink the hits they find, a DataFrame per chunk (or a single record), instead of
+printing them one by one. The sink holds on to them until batch_rows have piled up and then writes
+the whole batch with one call, as:
+    text     the script's own human readable rendering, what it always printed
+    compact  one tab separated line per hit under a single header line
+    jsonl    one JSON object per hit (JSON Lines), ts as an ISO timestamp whatever the log's format
+    csv      comma separated, with a header line
+    parquet  one row group per batch (needs pyarrow)
+Files the sink opens itself are written through a large buffer. When tailing, call flush() after
+every micro-batch so hits don't wait for the batch to fill up. Anything but text written to stdout
+is meant to be piped into another tool, scripts then send their status lines and reports to
+stderr (see status_stream).
+
+Every script imports this module for its -f choices, pandas and pyarrow are only imported once
+there are hits to write so -h starts without them.
+"""
+
+import importlib.util
+import sys
+import time
+
+FORMATS = ['text', 'compact', 'jsonl', 'csv', 'parquet']
+# Hits buffered before they are written
+BATCH_ROWS = 10000
+# Write buffer of files opened by the sink
+BUFFER_BYTES = 1024 * 1024
+# Hits never wait longer than this for the batch to fill, checked whenever hits are added
+FLUSH_SECONDS = 1.0
+
+
+def compact_text(hits, header=True):
+    """One tab separated line per hit, missing values as '-' like in Zeek's own logs"""
+    return hits.to_csv(sep='\t', index=False, header=header, na_rep='-')
+
+
+def _arrow_ready(hits):
+    """Give object and categorical columns types that stay the same from one batch to the next"""
+    import pandas as pd
+    out = hits.copy(deep=False)
+    for column in hits.columns:
+        series = hits[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(object)
+        if series.dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(series, skipna=True)
+        if kind == 'integer':
+            out[column] = pd.to_numeric(series).astype('Int64')
+        elif kind in ('floating', 'mixed-integer-float'):
+            out[column] = pd.to_numeric(series).astype('float64')
+        else:
+            out[column] = series.astype('string')
+    return out
+
+
+def status_stream(outfile, fmt):
+    """Where a script's status lines and reports go: stderr when structured hits go to stdout, stdout otherwise
+    Args:
+        outfile (str or file): The sink's output, see HitSink
+        fmt (str): The sink's format
+    """
+    if fmt != 'text' and (outfile is None or outfile == '-' or outfile is sys.stdout):
+        return sys.stderr
+    return sys.stdout
+
+
+def _iso_ts(hits):
+    """Epoch seconds ts (json logs) as the timestamp ascii logs' ts is written as, to the microsecond
+    Zeek logs it with. pandas writes floats with 10 decimals, which doesn't give back the value in the log.
+    """
+    import pandas as pd
+    if 'ts' not in hits.columns or not pd.api.types.is_float_dtype(hits['ts']):
+        return hits
+    # Through integer microseconds, to_datetime on floats can be a microsecond off
+    micros = (hits['ts'] * 1e6).round().astype('Int64')
+    return hits.assign(ts=pd.to_datetime(micros, unit='us'))
+
+
+class HitSink:
+    """Collect hits and write them out in batches
+    Args:
+        outfile (str or file): Path or open file the hits go to, '-' or None for stdout
+        fmt (str): One of FORMATS (default = 'text')
+        text (callable): Renders a DataFrame of hits as a string for the text format (default = compact_text)
+        batch_rows (int): Write once this many hits are buffered
+        flush_seconds (float): Also write once the oldest buffered hit has waited this long, 0 writes every time
+    """
+
+    def __init__(self, outfile=None, fmt='text', text=None, batch_rows=BATCH_ROWS, flush_seconds=FLUSH_SECONDS):
+        if fmt not in FORMATS:
+            raise ValueError('unknown output format {:s}, use one of {:s}'.format(fmt, ', '.join(FORMATS)))
+        if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            raise ValueError('parquet output needs pyarrow')
+        self.fmt = fmt
+        self.text = text
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+        self._oldest = None
+        self._header = True
+        self._writer = None
+        binary = fmt == 'parquet'
+        if outfile is None or outfile == '-':
+            outfile = sys.stdout
+        if isinstance(outfile, str):
+            self._file = open(outfile, 'wb' if binary else 'w', buffering=BUFFER_BYTES)
+            self._owned = True
+        else:
+            # parquet is bytes, write it to the binary side of a text stream like stdout
+            self._file = outfile.buffer if binary and hasattr(outfile, 'buffer') else outfile
+            self._owned = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, hits):
+        """Add hits, a DataFrame or a single record (dict)"""
+        if isinstance(hits, dict):
+            count = 1
+        else:
+            count = len(hits)
+            if not count:
+                return
+        self._buffer.append(hits)
+        self._buffered += count
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if self._buffered >= self.batch_rows or time.monotonic() - self._oldest >= self.flush_seconds:
+            self.flush()
+
+    def _frames(self):
+        """Buffered hits as DataFrames, runs of single records become one frame"""
+        import pandas as pd
+        frames, records = [], []
+        for item in self._buffer:
+            if isinstance(item, dict):
+                records.append(item)
+                continue
+            if records:
+                frames.append(pd.DataFrame.from_records(records))
+                records = []
+            frames.append(item)
+        if records:
+            frames.append(pd.DataFrame.from_records(records))
+        return frames
+
+    def flush(self):
+        """Write whatever is buffered"""
+        if self._buffer:
+            import pandas as pd
+            frames = self._frames()
+            self._buffer, self._buffered, self._oldest = [], 0, None
+            if self.fmt == 'text' and self.text is not None:
+                # Each frame is rendered on its own, renderers may rely on a frame's index
+                self._file.write(''.join(self.text(frame) for frame in frames))
+            else:
+                self._write_batch(pd.concat(frames, sort=False) if len(frames) > 1 else frames[0])
+            self.rows += sum(len(frame) for frame in frames)
+        self._file.flush()
+
+    def _write_batch(self, batch):
+        if self.fmt in ('text', 'compact'):
+            self._file.write(compact_text(batch, self._header))
+        elif self.fmt == 'csv':
+            self._file.write(batch.to_csv(index=False, header=self._header))
+        elif self.fmt == 'jsonl':
+            self._file.write(_iso_ts(batch).to_json(orient='records', lines=True, date_format='iso', date_unit='us',
+                                                    double_precision=15, default_handler=str))
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(_arrow_ready(batch), preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self._file, table.schema)
+            else:
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        self._header = False
+
+    def close(self):
+        """Write what's left and close the output (files passed in are only flushed)"""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
@@ -0,0 +1,122 @@
+"""Multi-pattern substring matching (Aho-Corasick) for IOC lists
+
+The automaton is built once from the IOC list and then scans each string in a single pass,
+no matter how many patterns there are. pyahocorasick is used when it's installed, otherwise a
+pure Python automaton with the same behaviour.
+"""
+
+import hashlib
+from collections import deque
+import numpy as np
+import pandas as pd
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def read_iocs(lines):
+    """Clean up IOC lines: strip whitespace, drop blanks and comments, keep the first of duplicates"""
+    iocs = (line.strip() for line in lines)
+    return list(dict.fromkeys(ioc for ioc in iocs if ioc and not ioc.startswith('#')))
+
+
+class IOCMatcher:
+    """Aho-Corasick automaton over a set of patterns
+    Args:
+        patterns (iterable): Substrings to look for (case sensitive, like the `in` checks it replaces)
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for index, pattern in enumerate(self.patterns):
+                self._automaton.add_word(pattern, index)
+            if self.patterns:
+                self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    @property
+    def digest(self):
+        """sha1 of the pattern set, changes whenever a pattern is added or removed"""
+        return hashlib.sha1('\n'.join(sorted(self.patterns)).encode()).hexdigest()
+
+    def _build(self):
+        """Pure Python fallback: trie of goto dicts plus failure and dictionary suffix links"""
+        self._goto = [{}]
+        self._term = [-1]
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._term.append(-1)
+                node = next_node
+            self._term[node] = index
+
+        # Breadth first so every node's failure link points at an already finished node
+        self._fail = [0] * len(self._goto)
+        self._dict_link = [-1] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                # Nearest terminal node along the failure chain
+                self._dict_link[child] = fail if self._term[fail] != -1 else self._dict_link[fail]
+                queue.append(child)
+
+    def iter_matches(self, text):
+        """Yield (end index, pattern) for every occurrence of every pattern in text"""
+        if not self.patterns:
+            return
+        if self._automaton is not None:
+            for end, index in self._automaton.iter(text):
+                yield end, self.patterns[index]
+            return
+        goto, fail, term, dict_link = self._goto, self._fail, self._term, self._dict_link
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if term[node] != -1 else dict_link[node]
+            while match != -1:
+                yield position, self.patterns[term[match]]
+                match = dict_link[match]
+
+    def first(self, text):
+        """The first pattern found in text (earliest end position), or None"""
+        for _, pattern in self.iter_matches(text):
+            return pattern
+        return None
+
+    def find_all(self, text):
+        """Every distinct pattern found in text, in the order they were found"""
+        return list(dict.fromkeys(pattern for _, pattern in self.iter_matches(text)))
+
+    def match_column(self, values):
+        """first() over a column, scanning each distinct value once
+        Returns:
+            object ndarray holding the matched pattern or None per row, missing values never match
+        """
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        found = np.empty(len(uniques) + 1, dtype=object)
+        found[:-1] = [self.first(str(value)) for value in uniques]
+        # Code -1 (missing) indexes the extra slot at the end
+        found[-1] = None
+        return found[codes]
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""On-disk cache of parsed zeek logs
+
+Each parsed log is stored as an uncompressed Arrow IPC (feather) file so a warm run can memory map
+it instead of parsing the raw log again. Entries are keyed on the log's path, size, mtime and the
+loader options, so editing, rotating or re-loading a log with other options misses the cache.
+
+List columns of json logs (answers, TTLs, ...) come back from a hit as Arrow lists (pd.ArrowDtype)
+instead of a Python list per row, list_lengths() and python_lists() handle them where it matters.
+
+Usage:
+    python3 parse_cache.py --stats
+    python3 parse_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Bump when the on-disk layout changes so old entries are never read back
+CACHE_VERSION = 1
+CACHE_DIR = os.path.expanduser(os.environ.get('ZAT_CACHE_DIR', '~/.cache/zat_logs'))
+# Size cap for the whole cache, least recently used entries are evicted past this
+MAX_BYTES = int(os.environ.get('ZAT_CACHE_MAX_MB', 4096)) * 1024 * 1024
+SUFFIX = '.arrow'
+
+_warned = False
+
+
+def available():
+    """The cache needs pyarrow, without it every lookup just misses"""
+    global _warned
+    if pa is None and not _warned:
+        print('**pyarrow is not installed, parse cache disabled**')
+        _warned = True
+    return pa is not None
+
+
+def cache_key(path, options):
+    """Key a log on its identity (path, size, mtime) plus the options it was loaded with"""
+    stat = os.stat(path)
+    identity = {
+        'version': CACHE_VERSION,
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'options': options,
+    }
+    return hashlib.sha1(json.dumps(identity, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _entry_path(key, cache_dir):
+    return os.path.join(cache_dir, key + SUFFIX)
+
+
+def load(path, options, cache_dir=CACHE_DIR):
+    """Return the cached DataFrame for a log, or None on a miss"""
+    if not available():
+        return None
+    entry = _entry_path(cache_key(path, options), cache_dir)
+    try:
+        # Memory map the file, numeric columns without nulls come back without a copy
+        table = pa.ipc.open_file(pa.memory_map(entry)).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    # Touch the entry so eviction treats it as recently used
+    os.utime(entry)
+    # List columns stay in the mapped Arrow buffers, converting them costs a Python list per row
+    return table.to_pandas(split_blocks=True, types_mapper=_arrow_list)
+
+
+def _arrow_list(arrow_type):
+    return pd.ArrowDtype(arrow_type) if pa.types.is_list(arrow_type) else None
+
+
+def is_arrow_list(dtype):
+    """A list column as load() returns it"""
+    return pa is not None and isinstance(dtype, pd.ArrowDtype) and pa.types.is_list(dtype.pyarrow_dtype)
+
+
+def list_lengths(column):
+    """column.str.len() that also works on Arrow list columns, missing lists are NaN either way"""
+    if not is_arrow_list(column.dtype):
+        return column.str.len()
+    import pyarrow.compute as pc
+    return pd.Series(pc.list_value_length(pa.array(column)).to_numpy(zero_copy_only=False), index=column.index)
+
+
+def python_lists(df):
+    """The Arrow list columns of a frame as Python lists (None when missing), like a fresh parse has them
+    Meant for the rows that get printed or written, a whole cache hit is better left in Arrow.
+    """
+    columns = {name: pd.Series(pa.array(df[name]).to_pylist(), index=df.index, dtype=object)
+               for name, dtype in df.dtypes.items() if is_arrow_list(dtype)}
+    return df.assign(**columns) if columns else df
+
+
+def store(path, options, df, cache_dir=CACHE_DIR):
+    """Write a parsed DataFrame to the cache, unsupported frames are silently left uncached"""
+    if not available():
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = _entry_path(cache_key(path, options), cache_dir)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as err:
+        print('**Not caching {:s}: {:s}**'.format(path, str(err)))
+        return
+    # Write to a temp file and rename so concurrent workers never see a partial entry
+    tmp = '{:s}.{:d}.tmp'.format(entry, os.getpid())
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, entry)
+    evict(cache_dir=cache_dir)
+
+
+def cached_load(path, options, loader, cache_dir=CACHE_DIR):
+    """Load a log through the cache
+    Args:
+        path (str): Path to the raw zeek log
+        options (dict): Loader options that change the parsed result, part of the key
+        loader (callable): Called with no arguments to parse the log on a miss
+    """
+    df = load(path, options, cache_dir)
+    if df is not None:
+        return df
+    df = loader()
+    store(path, options, df, cache_dir)
+    return df
+
+
+def entries(cache_dir=CACHE_DIR):
+    """List (path, size, mtime) for every cache entry, least recently used first"""
+    if not os.path.isdir(cache_dir):
+        return []
+    found = []
+    for file in os.listdir(cache_dir):
+        if not file.endswith(SUFFIX):
+            continue
+        full_path = os.path.join(cache_dir, file)
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            continue
+        found.append((full_path, stat.st_size, stat.st_mtime))
+    return sorted(found, key=lambda entry: entry[2])
+
+
+def evict(max_bytes=MAX_BYTES, cache_dir=CACHE_DIR):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    found = entries(cache_dir)
+    total = sum(size for _, size, _ in found)
+    for full_path, size, _ in found:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            # Another worker evicted it first
+            pass
+        total -= size
+    return total
+
+
+def clear(cache_dir=CACHE_DIR):
+    """Remove every cache entry, returns the number removed"""
+    found = entries(cache_dir)
+    for full_path, _, _ in found:
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+    return len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clear',
+            help='Remove every cached log',
+            action='store_true')
+    parser.add_argument('--stats',
+            help='Print the number and size of cached logs',
+            action='store_true')
+    parser.add_argument('--dir',
+            help='Cache directory, default=$ZAT_CACHE_DIR or ~/.cache/zat_logs',
+            default=CACHE_DIR)
+    args = parser.parse_args()
+    if args.clear:
+        print('Removed {:d} cached logs from {:s}'.format(clear(args.dir), args.dir))
+    else:
+        found = entries(args.dir)
+        total = sum(size for _, size, _ in found)
+        print('{:d} cached logs, {:.1f} MB of {:.1f} MB in {:s}'.format(
+            len(found), total / 1024 / 1024, MAX_BYTES / 1024 / 1024, args.dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Per-stage timing behind the scripts' --profile flag
+
+Every script splits its work into the same stages:
+    load       reading and parsing the log (every chunk, in the streaming modes)
+    featurize  derived columns and the feature matrix
+    fit        training models: normalization, IsolationForest, K selection, KMeans
+    detect     scoring, filtering and assigning records: the checks, anomaly scores, cluster labels
+    report     rendering and writing the results
+A stage may run many times (once per chunk or tailed batch), its wall time, CPU time and rows
+add up. Peak RSS is the process' peak at the end of the stage's last run. benchmark.py measures
+its stages with the same Profiler, so both report the same numbers.
+
+With --profile the scripts print a table of the stages when they are done and save it as JSON
+(--profile-out). --profile-stage also runs cProfile over one stage and saves the stats next to
+the report, read them with python3 -m pstats.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+STAGES = ['load', 'featurize', 'fit', 'detect', 'report']
+PROFILE_OUT = 'profile.json'
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def add_arguments(parser):
+    """The --profile options, shared by every script"""
+    parser.add_argument('--profile',
+            help='Time every stage ({:s}), print a table and save it as JSON'.format(', '.join(STAGES)),
+            action='store_true')
+    parser.add_argument('--profile-out',
+            help='JSON report written by --profile, default={:s}'.format(PROFILE_OUT),
+            default=PROFILE_OUT)
+    parser.add_argument('--profile-stage',
+            help='With --profile, also run cProfile over this stage and save it as <stage>.prof next to the report',
+            choices=STAGES,
+            default=None)
+
+
+class _Run:
+    """Handed out by Profiler.stage, set rows to what the run processed"""
+
+    def __init__(self, rows=0):
+        self.rows = rows
+
+
+class Profiler:
+    """Wall time, CPU time, rows and peak RSS per stage
+    Args:
+        enabled (bool): Measure anything at all, a disabled profiler costs next to nothing
+        out (str): Where report() saves the JSON report, None to only print the table
+        cprofile_stage (str): Run cProfile over this stage (default = None)
+    """
+
+    def __init__(self, enabled=True, out=None, cprofile_stage=None):
+        self.enabled = enabled
+        self.out = out
+        self.cprofile_stage = cprofile_stage if enabled else None
+        self.stages = {}
+        self._cprofile = cProfile.Profile() if self.cprofile_stage else None
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.profile, args.profile_out, args.profile_stage)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=0):
+        """Time the body as a run of stage name, the yielded object's rows can be set inside"""
+        run = _Run(rows)
+        if not self.enabled:
+            yield run
+            return
+        profiled = name == self.cprofile_stage
+        if profiled:
+            self._cprofile.enable()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield run
+        finally:
+            seconds, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            if profiled:
+                self._cprofile.disable()
+            stats = self.stages.setdefault(name, {'stage': name, 'calls': 0, 'seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0})
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['cpu_seconds'] += cpu
+            stats['rows'] += int(run.rows or 0)
+            stats['peak_rss_mb'] = peak_rss_mb()
+
+    def iterate(self, name, chunks):
+        """Yield from chunks, timing the production of every chunk (reading a log lazily) as stage name"""
+        if not self.enabled:
+            yield from chunks
+            return
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name) as run:
+                chunk = next(chunks, None)
+                run.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    def results(self):
+        """One dict per stage, in STAGES order, with rounded numbers and rows_per_sec"""
+        order = {name: i for i, name in enumerate(STAGES)}
+        results = []
+        for stats in sorted(self.stages.values(), key=lambda stats: order.get(stats['stage'], len(order))):
+            seconds = stats['seconds']
+            results.append({
+                'stage': stats['stage'],
+                'calls': stats['calls'],
+                'seconds': round(seconds, 4),
+                'cpu_seconds': round(stats['cpu_seconds'], 4),
+                'rows': stats['rows'],
+                'rows_per_sec': round(stats['rows'] / seconds, 1) if seconds > 0 and stats['rows'] else None,
+                'peak_rss_mb': round(stats['peak_rss_mb'], 1),
+            })
+        return results
+
+    def report(self):
+        """Print the stage table, save the JSON report and the cProfile stats"""
+        if not self.enabled:
+            return
+        results = self.results()
+        total = {
+            'seconds': round(time.perf_counter() - self._start, 4),
+            'cpu_seconds': round(time.process_time() - self._cpu_start, 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+        # Only here, every script imports this module and pandas is most of a -h start
+        import pandas as pd
+        print('\n**Profile**')
+        table = pd.DataFrame(results + [dict(stage='total', **total)], dtype=object).fillna('')
+        with pd.option_context('display.width', None):
+            print(table.to_string(index=False))
+        if self._cprofile:
+            path = os.path.join(os.path.dirname(self.out or '') or '.', '{:s}.prof'.format(self.cprofile_stage))
+            self._cprofile.dump_stats(path)
+            print('**cProfile of {:s} saved to {:s} (python3 -m pstats {:s})**'.format(self.cprofile_stage, path, path))
+        if self.out:
+            with open(self.out, 'w') as outfile:
+                json.dump({
+                    'script': os.path.basename(sys.argv[0]),
+                    'argv': sys.argv[1:],
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'stages': results,
+                    'total': total,
+                }, outfile, indent=2)
+            print('**Saved the profile to {:s}**'.format(self.out))
@@ -0,0 +1,207 @@
+"""Incremental clustering for logs that don't fit in memory
+
+StreamingMatrix learns the same normalization DataFrameToMatrix does (min-max for numeric columns,
+one-hot for categorical ones, NaNs as -999 / a 'NaN' category) from a stream of chunks, so the
+matrix layout is known before the first chunk is clustered. StreamingKMeans feeds chunks to
+MiniBatchKMeans and ClusterSummary keeps the per-cluster counts and a bounded sample of rows for
+the grouped report, so memory stays at one chunk no matter how long the log is.
+"""
+
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# Same cut off DataFrameToMatrix uses for turning object columns into categories
+MAX_CATEGORIES = 100
+# Same as DataFrameToMatrix's nan_replace
+NAN_REPLACE = -999
+# Rows per MiniBatchKMeans update, chunks are split into batches of this size
+BATCH_SIZE = 4096
+
+
+class StreamingMatrix:
+    """Incremental counterpart of zat's DataFrameToMatrix
+    Notes:
+        partial_fit: Fold a chunk into the column ranges and category sets
+        transform: Convert a chunk to a float32 matrix using everything fitted so far
+    """
+
+    def __init__(self, max_categories=MAX_CATEGORIES, nan_replace=NAN_REPLACE):
+        self.max_categories = max_categories
+        self.nan_replace = nan_replace
+        self.column_names = None
+        self.norm_map = {}
+        self.categories = {}
+        self.dropped = set()
+        self._ranges = {}
+
+    def partial_fit(self, df):
+        if self.column_names is None:
+            self.column_names = list(df.columns)
+        for column in self.column_names:
+            if column in self.dropped:
+                continue
+            series = df[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                self._fit_numeric(column, series)
+            else:
+                self._fit_categorical(column, series)
+        return self
+
+    def _fit_numeric(self, column, series):
+        smin, smax = series.min(), series.max()
+        if pd.isna(smin):
+            return
+        if column in self._ranges:
+            old_min, old_max = self._ranges[column]
+            smin, smax = min(smin, old_min), max(smax, old_max)
+        self._ranges[column] = (float(smin), float(smax))
+
+    def _fit_categorical(self, column, series):
+        seen = self.categories.setdefault(column, set())
+        seen.update(str(value) for value in series.dropna().unique())
+        if series.isnull().any():
+            seen.add('NaN')
+        if len(seen) >= self.max_categories and not isinstance(series.dtype, pd.CategoricalDtype):
+            print('Dropping {:s} column...'.format(column))
+            self.dropped.add(column)
+            del self.categories[column]
+
+    def finish(self):
+        """Lock the layout once every chunk has been seen, constant columns aren't normalized"""
+        self.norm_map = {}
+        for column, (smin, smax) in self._ranges.items():
+            if smax - smin == 0:
+                print('Cannot normalize series (div by 0) so not normalizing...')
+                continue
+            self.norm_map[column] = (smin, smax)
+        self.categories = {column: sorted(values) for column, values in self.categories.items()}
+        return self
+
+    @property
+    def numeric_columns(self):
+        return [column for column in self.column_names if column in self._ranges and column not in self.dropped]
+
+    @property
+    def feature_names(self):
+        """Matrix column names, numeric columns first and then one per category like get_dummies"""
+        names = list(self.numeric_columns)
+        for column in self.column_names:
+            for category in self.categories.get(column, []):
+                names.append('{:s}_{:s}'.format(column, category))
+        return names
+
+    def transform(self, df):
+        """Convert a chunk to a float32 matrix, unseen categories encode as all zeros"""
+        blocks = []
+        for column in self.numeric_columns:
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            if column in self.norm_map:
+                smin, smax = self.norm_map[column]
+                values = (values - smin) / (smax - smin)
+            blocks.append(np.where(np.isnan(values), self.nan_replace, values)[:, None])
+        for column in self.column_names:
+            if column not in self.categories:
+                continue
+            categories = self.categories[column]
+            values = df[column].astype(object).where(df[column].notnull(), 'NaN').astype(str)
+            codes = pd.Categorical(values, categories=categories).codes
+            one_hot = np.zeros((len(df), len(categories)), dtype=np.float32)
+            rows = np.flatnonzero(codes >= 0)
+            one_hot[rows, codes[rows]] = 1
+            blocks.append(one_hot)
+        if not blocks:
+            return np.empty((len(df), 0), dtype=np.float32)
+        return np.hstack(blocks).astype(np.float32)
+
+
+class ClusterSummary:
+    """Per-cluster counts plus the first and last rows of each cluster, the same rows pandas shows
+    when it prints a long group
+    Args:
+        max_rows (int): Clusters up to this size are printed in full (pandas' display.max_rows)
+        edge_rows (int): Rows kept from each end of a bigger cluster
+        rank_by (str): Order each cluster by this column, highest first, instead of arrival order
+    """
+
+    def __init__(self, max_rows=60, edge_rows=5, rank_by=None):
+        self.max_rows = max_rows
+        self.edge_rows = edge_rows
+        self.rank_by = rank_by
+        self.counts = Counter()
+        self._head = {}
+        self._tail = {}
+
+    def update(self, df, labels):
+        for key, group in df.groupby(np.asarray(labels), sort=False):
+            key = int(key)
+            self.counts[key] += len(group)
+            head, tail = self._head.get(key), self._tail.get(key)
+            if self.rank_by:
+                # Top rows and bottom rows by the ranking column so far
+                top = group.nlargest(self.max_rows, self.rank_by)
+                bottom = group.nsmallest(self.edge_rows, self.rank_by)
+                self._head[key] = top if head is None else pd.concat([head, top]).nlargest(self.max_rows, self.rank_by)
+                self._tail[key] = bottom if tail is None else pd.concat([tail, bottom]).nsmallest(self.edge_rows, self.rank_by)
+                continue
+            if head is None:
+                self._head[key] = group.head(self.max_rows)
+            elif len(head) < self.max_rows:
+                self._head[key] = pd.concat([head, group.head(self.max_rows - len(head))])
+            edge = group.tail(self.edge_rows)
+            self._tail[key] = edge if tail is None else pd.concat([tail, edge]).tail(self.edge_rows)
+
+    def report(self):
+        """The grouped output dns_clustering prints, as one string"""
+        lines = []
+        for key in sorted(self.counts):
+            count = self.counts[key]
+            lines.append('\nCluster {:d}: {:d} observations'.format(key, count))
+            if count <= self.max_rows:
+                lines.append(self._head[key].to_string())
+                continue
+            tail = self._tail[key]
+            if self.rank_by:
+                tail = tail.sort_values(self.rank_by, ascending=False)
+            shown = pd.concat([self._head[key].head(self.edge_rows), tail]).to_string().split('\n')
+            # Header plus the first rows, a gap, then the last rows
+            cut = len(shown) - self.edge_rows
+            lines += shown[:cut] + ['...'] + shown[cut:]
+            lines.append('\n[{:d} rows x {:d} columns]'.format(count, self._head[key].shape[1]))
+        return '\n'.join(lines)
+
+
+class StreamingKMeans:
+    """MiniBatchKMeans over a stream of feature chunks
+    Args:
+        n_clusters (int): Number of clusters
+        to_matrix (StreamingMatrix): A finished normalizer
+        batch_size (int): Rows per MiniBatchKMeans update
+    """
+
+    def __init__(self, n_clusters, to_matrix, batch_size=BATCH_SIZE, random_state=None):
+        self.n_clusters = n_clusters
+        self.to_matrix = to_matrix
+        # The first update places the centers, so a batch has to hold at least n_clusters rows
+        self.batch_size = max(batch_size, n_clusters)
+        from sklearn.cluster import MiniBatchKMeans
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=self.batch_size, n_init=3, random_state=random_state)
+        self.fitted = False
+        self._pending = None
+
+    def partial_fit(self, features):
+        """Update the clusters with a chunk of features (a DataFrame the normalizer was fitted on)"""
+        matrix = self.to_matrix.transform(features)
+        if self._pending is not None:
+            matrix = np.vstack([self._pending, matrix])
+            self._pending = None
+        if not self.fitted and len(matrix) < self.n_clusters:
+            self._pending = matrix
+            return self
+        for start in range(0, len(matrix), self.batch_size):
+            self.kmeans.partial_fit(matrix[start:start + self.batch_size])
+            self.fitted = True
+        return self
+
+    def predict(self, features):
+        return self.kmeans.predict(self.to_matrix.transform(features))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from anomaly_stage import AnomalyStage
+
+pytest.importorskip('sklearn')
+
+
+def _matrix(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.normal(size=(rows, 4))
+    # A few far away rows for the forest to find
+    matrix[:20] += 8
+    return matrix
+
+
+def test_chunked_scores_equal_unchunked_scores():
+    matrix = _matrix()
+    stage = AnomalyStage(fit_rows=1000, random_state=0).fit(matrix)
+    whole = stage.score(matrix, score_rows=len(matrix))
+    np.testing.assert_array_equal(stage.score(matrix, score_rows=777), whole)
+    np.testing.assert_array_equal(whole, -stage.forest.score_samples(matrix))
+
+
+def test_subsampled_fit_still_finds_the_outliers():
+    matrix = _matrix()
+    sub = AnomalyStage(fit_rows=1000, random_state=0).fit(matrix)
+    full = AnomalyStage(fit_rows=len(matrix), random_state=0).fit(matrix)
+    top = set(np.argsort(-sub.score(matrix))[:20])
+    assert top == set(range(20))
+    assert top == set(np.argsort(-full.score(matrix))[:20])
+
+
+def test_weighted_fit_equals_fit_on_the_expanded_rows():
+    rng = np.random.default_rng(1)
+    distinct = rng.normal(size=(300, 3))
+    counts = rng.integers(1, 30, size=len(distinct))
+    expanded = np.repeat(distinct, counts, axis=0)
+    assert len(expanded) > 2000
+    weighted = AnomalyStage(fit_rows=2000, random_state=0).fit(distinct, counts)
+    plain = AnomalyStage(fit_rows=2000, random_state=0).fit(expanded)
+    np.testing.assert_array_equal(weighted.score(distinct), plain.score(distinct))
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from auto_k import StratifiedReservoir
+
+
+def _chunk(ts, strata):
+    index = pd.DatetimeIndex(pd.to_datetime(ts, unit='s'), name='ts')
+    return pd.DataFrame({'value': np.arange(len(strata), dtype=float)}, index=index), strata
+
+
+def test_reservoir_keeps_each_row_once_with_duplicated_datetime_index():
+    # ascii chunks are indexed on ts, several records can share one
+    df, strata = _chunk([0, 0, 0, 1, 1, 1], ['A', 'A', 'B', 'A', 'B', 'A'])
+    reservoir = StratifiedReservoir(size=100, random_state=0).update(df, strata)
+    assert reservoir.counts == {'A': 4, 'B': 2}
+    assert {stratum: len(kept) for stratum, kept in reservoir._kept.items()} == {'A': 4, 'B': 2}
+    sample = reservoir.sample()
+    assert len(sample) == 6
+    assert sorted(sample['value']) == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_reservoir_bounds_every_stratum_across_chunks():
+    reservoir = StratifiedReservoir(size=3, random_state=0)
+    for start in range(0, 20, 5):
+        df, strata = _chunk([start] * 5, ['A', 'A', 'A', 'B', 'B'])
+        reservoir.update(df, strata)
+    assert reservoir.counts == {'A': 12, 'B': 8}
+    assert all(len(kept) <= 3 for kept in reservoir._kept.values())
+    # Every kept row is a distinct record
+    kept = pd.concat(reservoir._kept.values())
+    assert not kept.duplicated(subset=['value', '_key']).any()
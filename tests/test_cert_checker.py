@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+import cert_checker_ascii_json as cert_checker
+from ioc_matcher import IOCMatcher
+from zeek_loader import load_log
+
+HEADER = [
+    '#separator \\x09',
+    '#set_separator\t,',
+    '#empty_field\t(empty)',
+    '#unset_field\t-',
+    '#path\tx509',
+    '#open\t2020-04-30-00-00-00',
+    '#fields\tts\tid\tcertificate.subject\tcertificate.issuer',
+    '#types\ttime\tstring\tstring\tstring',
+]
+# ts, id, subject, issuer
+ROWS = [
+    ('1588204800.000951', 'F1', 'CN=www.paypal.com', "CN=R3,O=Let's Encrypt,C=US"),
+    ('1588204801.000000', 'F2', 'CN=selfsigned.local', 'CN=selfsigned.local'),
+    ('1588204802.000000', 'F3', 'CN=evil.example.net', 'CN=DigiCert SHA2 Secure Server CA'),
+    ('1588204803.000000', 'F4', 'CN=crl.msn.com', 'CN=DigiCert SHA2 Secure Server CA'),
+]
+
+
+@pytest.fixture
+def ascii_x509(tmp_path):
+    path = tmp_path / 'x509.log'
+    path.write_text('\n'.join(HEADER + ['\t'.join(row) for row in ROWS] + ['#close\t2020-04-30-01-00-00']) + '\n')
+    return str(path)
+
+
+def test_ascii_issuer_and_subject_load_as_different_categoricals(ascii_x509):
+    df = load_log(ascii_x509, fields=cert_checker.FIELDS)
+    assert isinstance(df.index, pd.DatetimeIndex)
+    assert isinstance(df['certificate.issuer'].dtype, pd.CategoricalDtype)
+    assert list(df['certificate.issuer'].cat.categories) != list(df['certificate.subject'].cat.categories)
+
+
+def test_check_pairs_ascii(ascii_x509):
+    df = load_log(ascii_x509, fields=cert_checker.FIELDS)
+    spoofed, self_signed, iocs = cert_checker.check_pairs(df['certificate.issuer'], df['certificate.subject'],
+                                                          IOCMatcher(['evil']))
+    assert spoofed.tolist() == [True, False, False, False]
+    assert self_signed.tolist() == [False, True, False, False]
+    assert iocs.tolist() == [None, None, 'evil', None]
+
+
+def test_find_certs_ascii(ascii_x509):
+    df = load_log(ascii_x509, fields=cert_checker.FIELDS)
+    hits = cert_checker.find_certs(df, IOCMatcher(['evil']))
+    assert list(zip(hits['id'], hits['finding'])) == [('F1', 'spoofed'), ('F2', 'self_signed'), ('F3', 'ioc')]
+    assert hits['ioc'].tolist() == [None, None, 'evil']
+
+
+def test_format_findings_ascii_timestamps(ascii_x509):
+    df = load_log(ascii_x509, fields=cert_checker.FIELDS)
+    text = cert_checker.format_findings(cert_checker.find_certs(df, None))
+    timestamps = [line for line in text.splitlines() if line.startswith('Timestamp:')]
+    # Printed the way the baseline printed the DatetimeIndex, no numpy T separator
+    assert timestamps[0].startswith('Timestamp:  2020-04-30 00:00:00.000951')
+    assert all('T' not in line[len('Timestamp:'):] for line in timestamps)
+
+
+def test_ioc_only_on_the_ioc_finding(ascii_x509):
+    # F1 is spoofed and matches an IOC, F2 is self-signed and matches one
+    df = load_log(ascii_x509, fields=cert_checker.FIELDS)
+    hits = cert_checker.find_certs(df, IOCMatcher(['paypal', 'selfsigned']))
+    assert list(zip(hits['id'], hits['finding'], hits['ioc'])) == [
+        ('F1', 'spoofed', None), ('F1', 'ioc', 'paypal'),
+        ('F2', 'self_signed', None), ('F2', 'ioc', 'selfsigned'),
+    ]
@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# -h prints the options and exits, none of these should be loaded for it
+HEAVY = ['pandas', 'numpy', 'pyarrow', 'sklearn', 'zat', 'zeek_loader']
+# Runs a script's -h and prints the heavy modules it ended up importing
+PROBE = '''
+import runpy, sys
+sys.argv = [sys.argv[1], '-h']
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+print(' '.join(name for name in {heavy!r} if name in sys.modules), file=sys.stderr)
+'''.format(heavy=HEAVY)
+
+
+@pytest.mark.parametrize('script', ['dns_clustering.py', 'dns_length.py', 'tor_and_port_counter_ascii_json.py',
+                                    'tor_and_port_counter_ascii_json_d.py', 'cert_checker_ascii_json.py',
+                                    'zeek_detect.py', 'zeek_to_pandas.py', 'zat_cli.py'])
+def test_help_does_not_import_the_heavy_modules(script):
+    done = subprocess.run([sys.executable, '-c', PROBE, os.path.join(REPO, script)], cwd=REPO,
+                          env=dict(os.environ, PYTHONPATH=REPO), capture_output=True, text=True, check=True)
+    assert 'usage:' in done.stdout
+    assert done.stderr.strip() == ''
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import zeek_gen
+from compact_dtypes import compact, pack_ips, unpack_ips
+from zeek_loader import load_log
+
+
+def _values(series):
+    return [None if pd.isna(value) else value for value in series.astype(object)]
+
+
+def test_compact_keeps_values_including_missing_ints():
+    df = pd.DataFrame({
+        'id_orig_p': [53, 443, np.nan],         # json int column with a missing value comes out float
+        'id_resp_p': pd.array([80, None, 65535], dtype='Int64'),
+        'orig_bytes': [0, 70000, 12],
+        'resp_bytes': [5.0, np.nan, 4294967296.0],
+        'missed_bytes': [-1, 0, 1],             # negative, left alone
+        'Z': [0, 1, 300],                       # doesn't fit the uint8 the schema asks for
+        'proto': ['udp', 'tcp', None],
+        'history': ['ShADadFf', 'ShADadFf', None],
+        'duration': [0.5, np.nan, 1e-3],
+    })
+    out = compact(df)
+    assert str(out['id_orig_p'].dtype) == 'UInt16'
+    assert str(out['id_resp_p'].dtype) == 'UInt16'
+    assert out['orig_bytes'].dtype == np.uint32
+    assert str(out['resp_bytes'].dtype) == 'UInt64'
+    assert out['missed_bytes'].dtype == df['missed_bytes'].dtype
+    assert out['Z'].dtype == df['Z'].dtype
+    assert isinstance(out['proto'].dtype, pd.CategoricalDtype)
+    assert out['duration'].dtype == np.float32
+    for column in df.columns.drop('duration'):
+        assert _values(out[column]) == _values(df[column]), column
+    np.testing.assert_allclose(out['duration'], df['duration'], rtol=1e-6)
+    # Interned strings are shared between the rows holding them
+    assert out['history'][0] is out['history'][1]
+
+
+def test_packed_ips_round_trip():
+    ips = pd.Series(['10.0.0.1', '192.168.1.20', '10.0.0.1', '255.255.255.255'])
+    packed = pack_ips(ips)
+    assert packed.dtype == np.uint32
+    assert unpack_ips(packed).tolist() == ips.tolist()
+    # IPv6 or missing addresses fall back to categories
+    assert isinstance(pack_ips(pd.Series(['10.0.0.1', '::1'])).dtype, pd.CategoricalDtype)
+    assert isinstance(pack_ips(pd.Series(['10.0.0.1', None])).dtype, pd.CategoricalDtype)
+
+
+def test_compact_load_equals_plain_load(tmp_path):
+    for json_format in (True, False):
+        path = str(tmp_path / 'conn_{:d}.log'.format(json_format))
+        zeek_gen.generate('conn', 3000, path, json_format=json_format, seed=0)
+        plain = load_log(path, compact=False)
+        small = load_log(path)
+        assert list(small.columns) == list(plain.columns)
+        assert small.index.equals(plain.index)
+        for column in plain.columns:
+            if small[column].dtype == np.float32:
+                np.testing.assert_allclose(small[column], plain[column], rtol=1e-6)
+            else:
+                assert _values(small[column]) == _values(plain[column]), column
@@ -0,0 +1,51 @@
+import gzip
+
+import pandas as pd
+import pytest
+
+import zeek_gen
+import zeek_loader
+from zeek_loader import compression, iter_log_chunks, load_log
+
+
+def _compress(path, kind):
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if kind == 'gzip':
+        out, packed = path + '.gz', gzip.compress(data)
+    else:
+        zstandard = pytest.importorskip('zstandard')
+        out, packed = path + '.zst', zstandard.ZstdCompressor().compress(data)
+    with open(out, 'wb') as outfile:
+        outfile.write(packed)
+    return out
+
+
+@pytest.fixture(scope='module', params=[True, False], ids=['json', 'ascii'])
+def plain_log(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('logs') / 'ssl.log')
+    zeek_gen.generate('ssl', 5000, path, json_format=request.param, seed=0)
+    return path
+
+
+@pytest.mark.parametrize('kind', ['gzip', 'zstd'])
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_compressed_load_equals_plain_load(plain_log, kind, prefetch):
+    packed = _compress(plain_log, kind)
+    assert compression(packed) == kind
+    pd.testing.assert_frame_equal(load_log(packed, prefetch=prefetch), load_log(plain_log))
+
+
+@pytest.mark.parametrize('kind', ['gzip', 'zstd'])
+def test_compressed_chunks_equal_plain_chunks(plain_log, kind):
+    packed = _compress(plain_log, kind)
+    fields = ['ts', 'id.orig_h', 'id.resp_p', 'issuer']
+    streamed = pd.concat(list(iter_log_chunks(packed, fields=fields)))
+    pd.testing.assert_frame_equal(streamed, pd.concat(list(iter_log_chunks(plain_log, fields=fields))))
+
+
+def test_zstd_without_zstandard_is_a_clear_error(plain_log, monkeypatch):
+    packed = _compress(plain_log, 'zstd')
+    monkeypatch.setattr(zeek_loader, 'zstandard', None)
+    with pytest.raises(ValueError, match='install zstandard'):
+        load_log(packed)
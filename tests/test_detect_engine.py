@@ -0,0 +1,66 @@
+import io
+
+import pandas as pd
+
+import zeek_gen
+from detect_engine import DetectorEngine, DnsLengthDetector
+from zeek_loader import load_log
+
+
+class Recorder:
+    """Detector that keeps every part it is handed"""
+
+    def __init__(self, streams, fields):
+        self.streams = set(streams)
+        self.fields = fields
+        self.parts = []
+
+    def update(self, df):
+        self.parts.append(df)
+        return ''
+
+    def report(self):
+        return '{:d} rows'.format(sum(len(part) for part in self.parts))
+
+
+def _mixed(tmp_path, rows=6000):
+    path = str(tmp_path / 'mixed.log')
+    zeek_gen.generate('mixed', rows, path, json_format=True, seed=0)
+    # The stream each record belongs to, from the full parse
+    return path, load_log(path, compact=False)
+
+
+def test_each_stream_goes_only_to_its_detectors(tmp_path):
+    path, full = _mixed(tmp_path)
+    counts = full['@stream'].value_counts().to_dict()
+    dns = Recorder({'dns'}, ['query', 'id.orig_h'])
+    certs = Recorder({'ssl', 'x509'}, ['certificate_issuer', 'issuer'])
+    out = io.StringIO()
+    engine = DetectorEngine([dns, certs], out=out)
+    engine.scan(path)
+    engine.report()
+
+    assert sum(len(part) for part in dns.parts) == counts['dns']
+    assert sum(len(part) for part in certs.parts) == counts['ssl'] + counts['x509']
+    # conn records are dropped before decoding, nobody asked for them
+    assert engine.routed == {'dns': counts['dns'], 'ssl': counts['ssl'], 'x509': counts['x509']}
+    # A detector only sees the columns it reads, in either spelling
+    assert all(set(part.columns) <= {'query', 'id_orig_h'} for part in dns.parts)
+    assert all(set(part.columns) <= {'certificate_issuer', 'issuer'} for part in certs.parts)
+    # Rows are the same records the full parse has for that stream
+    queries = pd.concat(dns.parts)['query'].astype(object).tolist()
+    assert queries == full.loc[full['@stream'] == 'dns', 'query'].astype(object).tolist()
+    assert out.getvalue().split('\n')[:2] == ['{:d} rows'.format(counts['dns']),
+                                             '{:d} rows'.format(counts['ssl'] + counts['x509'])]
+
+
+def test_per_type_log_routes_by_file_name(tmp_path):
+    path = str(tmp_path / 'dns.log')
+    zeek_gen.generate('dns', 2000, path, json_format=False, seed=0)
+    dns = DnsLengthDetector(length=40)
+    other = Recorder({'ssl'}, ['issuer'])
+    engine = DetectorEngine([dns, other], out=io.StringIO())
+    engine.scan(path)
+    assert dns.rows == 2000
+    assert other.parts == []
+    assert engine.routed == {'dns': 2000}
@@ -0,0 +1,94 @@
+import argparse
+import contextlib
+import io
+
+import joblib
+import numpy as np
+import pytest
+
+import dns_clustering
+import zeek_gen
+from dns_features import dedup
+from stage_profile import Profiler
+from zeek_loader import load_log
+
+
+def _load(path):
+    return dns_clustering.load_model(argparse.Namespace(model=str(path), anomaly=False))
+
+
+@pytest.fixture
+def saved(tmp_path):
+    path = tmp_path / 'saved.joblib'
+    joblib.dump({'version': 0, 'centers': np.arange(1000.0).reshape(100, 10)}, path)
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize('fraction', [0, 0.001, 0.01, 0.1, 0.5, 0.99])
+def test_load_model_reports_truncated_file(tmp_path, capsys, saved, fraction):
+    path = tmp_path / 'model.joblib'
+    path.write_bytes(saved[:int(len(saved) * fraction)])
+    with pytest.raises(SystemExit) as exit_info:
+        _load(path)
+    assert exit_info.value.code == 1
+    assert 'Could not load model' in capsys.readouterr().out
+
+
+def test_load_model_reports_corrupt_file(tmp_path, capsys):
+    path = tmp_path / 'model.joblib'
+    path.write_bytes(b'\x80\x04\x95' + b'\x00' * 100)
+    with pytest.raises(SystemExit):
+        _load(path)
+    assert 'Could not load model' in capsys.readouterr().out
+
+
+def test_load_model_reports_missing_file(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        _load(tmp_path / 'missing.joblib')
+    assert 'Could not load model' in capsys.readouterr().out
+
+
+@pytest.fixture(scope='module')
+def dns_log(tmp_path_factory):
+    pytest.importorskip('sklearn')
+    path = str(tmp_path_factory.mktemp('logs') / 'dns.log')
+    zeek_gen.generate('dns', 20000, path, json_format=True, seed=0)
+    return path
+
+
+def _cluster(path, dedup, seed=0):
+    args = argparse.Namespace(anomaly=False, clusters=4, dedup=dedup, auto_k=False, save_model=None, seed=seed,
+                              profiler=Profiler(enabled=False), contamination=0.2, threshold=None,
+                              sample=dns_clustering.SAMPLE_SIZE, workers=1)
+    df = load_log(path, fields=dns_clustering.FIELDS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        dns_clustering.cluster(df, args)
+    return df['cluster'].to_numpy()
+
+
+def test_weighted_clustering_equals_expanded_rows(dns_log):
+    from sklearn.cluster import KMeans, kmeans_plusplus
+    from zat.dataframe_to_matrix import DataFrameToMatrix
+    df = dns_clustering.add_features(load_log(dns_log, fields=dns_clustering.FIELDS))
+    distinct, counts, inverse = dedup(df[dns_clustering.FEATURES])
+    assert len(distinct) < len(df) / 2
+    with contextlib.redirect_stdout(io.StringIO()):
+        matrix = DataFrameToMatrix().fit_transform(distinct).astype(np.float64)
+    expanded = matrix[inverse]
+    # Same starting centers for both, from there every iteration should move them identically
+    init, _ = kmeans_plusplus(matrix, 4, sample_weight=counts, random_state=0)
+    weighted = KMeans(n_clusters=4, init=init, n_init=1).fit(matrix, sample_weight=counts)
+    full = KMeans(n_clusters=4, init=init, n_init=1).fit(expanded)
+    np.testing.assert_array_equal(weighted.labels_[inverse], full.labels_)
+    np.testing.assert_allclose(weighted.cluster_centers_, full.cluster_centers_, atol=1e-9)
+    assert weighted.inertia_ == pytest.approx(full.inertia_)
+
+
+def test_cluster_is_repeatable_with_a_seed(dns_log):
+    np.testing.assert_array_equal(_cluster(dns_log, dedup=True), _cluster(dns_log, dedup=True))
+
+
+def test_cluster_dedup_matches_no_dedup(dns_log):
+    from sklearn.metrics import adjusted_rand_score
+    # Label numbers may differ between the two, the partitions should not
+    assert adjusted_rand_score(_cluster(dns_log, dedup=False), _cluster(dns_log, dedup=True)) == 1.0
@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import zeek_gen
+from hit_sink import HitSink
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _jsonl(hits):
+    out = io.StringIO()
+    with HitSink(out, 'jsonl') as sink:
+        sink.write(hits)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_jsonl_ts_round_trips_the_logged_value():
+    # ts the way Zeek logs it, six decimals
+    logged = ['1588207244.736422', '1588207244.000001', '1588293643.999999', '1588207250.100000']
+    hits = pd.DataFrame({'ts': [float(ts) for ts in logged], 'duration': [0.1, 0.000123, 12.000001, np.nan]})
+    records = _jsonl(hits)
+    micros = [pd.Timestamp(record['ts']).value // 1000 for record in records]
+    assert micros == [int(ts.replace('.', '')) for ts in logged]
+    assert [record['duration'] for record in records] == [0.1, 0.000123, 12.000001, None]
+
+
+def test_jsonl_ts_is_the_same_for_ascii_and_json_frames():
+    epoch = pd.Series([1588207244.736422, np.nan])
+    ascii_ts = pd.to_datetime(pd.Series([1588207244736422, None], dtype='Int64'), unit='us')
+    assert _jsonl(pd.DataFrame({'ts': epoch})) == _jsonl(pd.DataFrame({'ts': ascii_ts}))
+    assert _jsonl(pd.DataFrame({'ts': epoch}))[0]['ts'] == '2020-04-30T00:40:44.736422'
+
+
+def _run(script, *args):
+    env = dict(os.environ, PYTHONPATH=REPO)
+    return subprocess.run([sys.executable, os.path.join(REPO, script)] + list(args), env=env,
+                          capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize('script, log_type, args', [
+    ('tor_and_port_counter_ascii_json_d.py', 'ssl', ['-f', 'jsonl', '-o', '-']),
+    ('tor_and_port_counter_ascii_json.py', 'ssl', ['-f', 'jsonl']),
+    ('dns_length.py', 'dns', ['-l', '30', '-f', 'jsonl']),
+    ('cert_checker_ascii_json.py', 'x509', ['-f', 'jsonl', os.devnull, '-']),
+    ('zeek_detect.py', 'mixed', ['-f', 'jsonl', '--detectors', 'tor,cert,dns_length']),
+])
+def test_jsonl_on_stdout_is_pure_jsonl(tmp_path, script, log_type, args):
+    path = str(tmp_path / '{:s}.log'.format(log_type))
+    zeek_gen.generate(log_type, 3000, path, json_format=True, seed=0)
+    done = _run(script, *args, path)
+    records = [json.loads(line) for line in done.stdout.splitlines()]
+    assert records
+    # Status lines and the reports went to stderr instead
+    assert '**' in done.stderr
+
+
+def test_text_output_keeps_the_report_on_stdout(tmp_path):
+    path = str(tmp_path / 'ssl.log')
+    zeek_gen.generate('ssl', 3000, path, json_format=True, seed=0)
+    done = _run('tor_and_port_counter_ascii_json_d.py', path)
+    assert '**Importing zeek log**' in done.stdout
+    assert 'Possible Tor connection found' in done.stdout
@@ -0,0 +1,61 @@
+import json
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import parse_cache
+from zeek_loader import load_log
+
+
+def _lists(column):
+    # A missing list is None or NaN depending on how the log spells it
+    return [value if isinstance(value, list) else None for value in column]
+
+
+@pytest.fixture
+def dns_json(tmp_path):
+    # answers is a list field in json dns logs, missing on some records
+    path = tmp_path / 'dns.log'
+    with open(path, 'w') as log_file:
+        for row in range(20000):
+            record = {'ts': 1588204800.0 + row, 'query': 'host{:d}.example.com'.format(row % 50)}
+            if row % 3:
+                record['answers'] = ['10.0.0.{:d}'.format(row % 7)] * (row % 3)
+            log_file.write(json.dumps(record) + '\n')
+    return str(path)
+
+
+def test_hit_keeps_list_columns_in_arrow(dns_json, tmp_path):
+    fresh = load_log(dns_json)
+    parse_cache.store(dns_json, {}, fresh, str(tmp_path / 'cache'))
+    cached = parse_cache.load(dns_json, {}, str(tmp_path / 'cache'))
+    assert parse_cache.is_arrow_list(cached['answers'].dtype)
+    # Converted only when asked for, then the same as a fresh parse
+    assert parse_cache.python_lists(cached)['answers'].tolist() == _lists(fresh['answers'])
+    assert parse_cache.list_lengths(cached['answers']).equals(fresh['answers'].str.len())
+
+
+def test_hit_is_faster_than_a_fresh_parse(dns_json, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    start = time.perf_counter()
+    fresh = load_log(dns_json)
+    parse_seconds = time.perf_counter() - start
+    parse_cache.store(dns_json, {}, fresh, cache_dir)
+    start = time.perf_counter()
+    cached = parse_cache.load(dns_json, {}, cache_dir)
+    hit_seconds = time.perf_counter() - start
+    assert len(cached) == len(fresh)
+    # About 10x on this log, the margin keeps a busy machine from failing it
+    assert hit_seconds < parse_seconds / 2
+
+
+def test_dns_length_hits_match_a_fresh_parse(dns_json, tmp_path):
+    import dns_length
+    fresh = dns_length.long_entries(load_log(dns_json), 2)
+    parse_cache.store(dns_json, {}, load_log(dns_json), str(tmp_path / 'cache'))
+    cached = dns_length.long_entries(parse_cache.load(dns_json, {}, str(tmp_path / 'cache')), 2)
+    assert cached['answers'].tolist() == _lists(fresh['answers'])
+    pd.testing.assert_frame_equal(cached.drop(columns='answers'), fresh.drop(columns='answers'))
@@ -0,0 +1,60 @@
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import dns_clustering
+import zeek_gen
+from stream_cluster import StreamingKMeans, StreamingMatrix
+from zeek_loader import iter_json_chunks, load_log
+
+pytest.importorskip('sklearn')
+
+
+@pytest.fixture(scope='module')
+def dns_log(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('logs') / 'dns.log')
+    zeek_gen.generate('dns', 20000, path, json_format=True, seed=0)
+    return path
+
+
+def _chunks(path):
+    # Small chunks so the stream really is folded in one piece at a time (about 40 of them)
+    return [dns_clustering.add_features(chunk)[dns_clustering.FEATURES]
+            for chunk in iter_json_chunks(path, chunk_bytes=256 * 1024, fields=dns_clustering.FIELDS)]
+
+
+def _batch_matrix(path):
+    from zat.dataframe_to_matrix import DataFrameToMatrix
+    df = dns_clustering.add_features(load_log(path, fields=dns_clustering.FIELDS))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DataFrameToMatrix().fit_transform(df[dns_clustering.FEATURES])
+
+
+def test_streaming_matrix_matches_dataframe_to_matrix(dns_log):
+    chunks = _chunks(dns_log)
+    assert len(chunks) > 10
+    to_matrix = StreamingMatrix()
+    for chunk in chunks:
+        to_matrix.partial_fit(chunk)
+    to_matrix.finish()
+    matrix = np.vstack([to_matrix.transform(chunk) for chunk in chunks])
+    np.testing.assert_allclose(matrix, _batch_matrix(dns_log), atol=1e-6)
+
+
+def test_mini_batch_clusters_agree_with_batch_kmeans(dns_log):
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import adjusted_rand_score
+    chunks = _chunks(dns_log)
+    to_matrix = StreamingMatrix()
+    for chunk in chunks:
+        to_matrix.partial_fit(chunk)
+    to_matrix.finish()
+    kmeans = StreamingKMeans(4, to_matrix, random_state=0)
+    for chunk in chunks:
+        kmeans.partial_fit(chunk)
+    streamed = np.concatenate([kmeans.predict(chunk) for chunk in chunks])
+    batch = KMeans(n_clusters=4, n_init=3, random_state=0).fit_predict(_batch_matrix(dns_log))
+    # Label numbers differ between the two, the partitions should not
+    assert adjusted_rand_score(batch, streamed) > 0.9
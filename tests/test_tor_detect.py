@@ -0,0 +1,43 @@
+import pandas as pd
+
+from tor_detect import TorPortStage
+
+
+def _ssl():
+    return pd.DataFrame({
+        'ts': [1.0, 2.0, 3.0, 4.0],
+        'id_orig_h': ['10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.3'],
+        'id_resp_h': ['1.1.1.1', '2.2.2.2', '1.1.1.1', '3.3.3.3'],
+        'id_resp_p': [443, 9001, 443, 443],
+        'issuer': ['CN=www.abcdef.com', 'CN=www.tortor.com', 'CN=Example CA', None],
+        'subject': ['CN=www.ghijk.net', 'CN=www.torrelay.net', 'CN=example.org', None],
+    })
+
+
+# What the tor scripts printed before the sketches, downstream consumers parse it
+BASELINE = '\n'.join(['', 'Total number of possible Tor connections found: 2', '', 'Port statistics', '443     3', '9001    1'])
+
+
+def test_default_report_matches_the_baseline():
+    stage = TorPortStage()
+    stage.update(_ssl())
+    assert stage.report() == BASELINE
+
+
+def test_verbose_report_adds_the_sketches():
+    stage = TorPortStage()
+    stage.update(_ssl())
+    report = stage.report(verbose=True)
+    assert report.startswith(BASELINE + '\n\nTop 10 source/dest pairs')
+    assert 'Distinct sources: ~3, distinct destinations: ~3' in report
+    assert report.endswith('Verdict cache: 0 hits, 4 misses (0.0% hit ratio), 4 certificates cached')
+
+
+def test_ports_with_missing_values_in_a_nullable_column():
+    # A directory of ascii and json logs concatenates into a nullable integer port column
+    df = _ssl()
+    df['id_resp_p'] = pd.array([443, 9001, None, 443], dtype='UInt16')
+    stage = TorPortStage()
+    stage.update(df)
+    assert stage.port_counts() == [(443, 2), (9001, 1)]
+    assert stage.stats.rows == 4
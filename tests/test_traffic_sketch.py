@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from traffic_sketch import PortCounter
+
+
+def test_update_skips_missing_values_in_a_nullable_column():
+    # ascii and json logs concatenated give a nullable integer column with pd.NA in it
+    counter = PortCounter()
+    counter.update(pd.array([443, None, 9001, 443, None], dtype='UInt16'))
+    assert counter.most_common() == [(443, 2), (9001, 1)]
+    assert counter.rows == 5
+
+
+def test_add_per_row_matches_update():
+    ports = [443, '-', 9001, np.nan, 80, pd.NA, 9001, 70000, 443, '8080', None, 80]
+    rows = PortCounter()
+    for port in ports:
+        rows.add(port)
+    column = PortCounter()
+    column.update(ports)
+    assert rows.most_common() == column.most_common() == [(443, 2), (9001, 2), (80, 2), (8080, 1)]
+    assert rows.rows == column.rows == len(ports)
+    np.testing.assert_array_equal(rows.first, column.first)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import ts_index
+import zeek_gen
+from ts_index import TsIndex, in_window, parse_time
+from zeek_loader import load_log
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ts_index, 'INDEX_DIR', str(tmp_path / 'index'))
+
+
+def _ts(df):
+    return df['ts'].to_numpy(dtype=np.float64) if 'ts' in df.columns else df.index.asi8 / 1e9
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time('1588205199.8') == 1588205199.8
+    assert parse_time('2020-04-30 00:10:00') == 1588205400.0
+    assert parse_time('2020-04-30T02:10+02:00') == 1588205400.0
+
+
+@pytest.mark.parametrize('json_format', [True, False])
+def test_window_boundaries_are_inclusive(tmp_path, json_format):
+    path = str(tmp_path / 'dns.log')
+    zeek_gen.generate('dns', 20000, path, json_format=json_format, seed=0)
+    full = load_log(path, compact=False)
+    ts = np.sort(_ts(full))
+    # Window edges sit exactly on records
+    since, until = ts[len(ts) // 3], ts[2 * len(ts) // 3]
+    window = load_log(path, compact=False, since=since, until=until)
+    expected = full[(_ts(full) >= since) & (_ts(full) <= until)]
+    assert len(window) == len(expected)
+    assert (_ts(window) == since).any() and (_ts(window) == until).any()
+    assert window['query'].tolist() == expected['query'].tolist()
+
+
+def test_byte_range_covers_the_window_with_small_strides(tmp_path):
+    path = str(tmp_path / 'dns.log')
+    zeek_gen.generate('dns', 5000, path, json_format=True, seed=1)
+    index = TsIndex.open(path, index_file=False, stride=4096)
+    assert len(index.offsets) > 100
+    with open(path, 'rb') as log_file:
+        data = log_file.read()
+    times = [index._ts(line) for line in data.splitlines()]
+    for since, until in [(times[1000], times[1500]), (times[0], times[10]), (times[-10], None), (None, times[20])]:
+        start, end = index.byte_range(since, until, slack=0)
+        inside = [ts for ts in times if (since is None or ts >= since) and (until is None or ts <= until)]
+        read = [index._ts(line) for line in data[start:end].splitlines()]
+        assert sorted(ts for ts in read if ts in inside) == sorted(inside)
+        assert len(read) < len(times) or (since is None and until is None)
+
+
+def test_in_window_keeps_the_edges():
+    df = pd.DataFrame({'ts': [1.0, 2.0, 3.0, 4.0]})
+    assert in_window(df, 2.0, 3.0)['ts'].tolist() == [2.0, 3.0]
+    assert in_window(df, since=4.0)['ts'].tolist() == [4.0]
+    assert in_window(df) is df
@@ -0,0 +1,105 @@
+import argparse
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import cert_checker_ascii_json as cert_checker
+import dns_length
+import zeek_gen
+from ioc_matcher import IOCMatcher, read_iocs
+from tor_detect import TorPortStage
+from zeek_daemon import Daemon, QueryHandler
+from zeek_loader import load_log
+
+IOC_LINES = ['  paypal ', '', '# a comment', 'selfsigned', 'paypal']
+
+
+@pytest.fixture(scope='module')
+def logs(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('logs')
+    paths = {}
+    for log_type in ['dns', 'ssl', 'x509']:
+        paths[log_type] = str(directory / '{:s}.log'.format(log_type))
+        zeek_gen.generate(log_type, 4000, paths[log_type], json_format=True, seed=0)
+    return paths
+
+
+@pytest.fixture(scope='module')
+def url(logs):
+    args = argparse.Namespace(anomaly=False, contamination=0.2, threshold=None, clusters=3)
+    daemon = Daemon(None, args)
+    for path in logs.values():
+        daemon.add_log(path)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QueryHandler)
+    server.daemon, server.verbose = daemon, False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{:d}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url, body=None):
+    try:
+        with urllib.request.urlopen(url, data=body.encode() if body is not None else None) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as err:
+        return err.code, json.loads(err.read())
+
+
+def test_status(url):
+    status, result = _get(url + '/status')
+    assert status == 200
+    assert {log_type: logs['rows'] for log_type, logs in result['logs'].items()} == {'dns': 4000, 'ssl': 4000, 'x509': 4000}
+    assert result['model'] == {'clusters': 3, 'anomaly': False}
+
+
+def test_length_matches_dns_length(url, logs):
+    expected = dns_length.long_entries(load_log(logs['dns'], fields=dns_length.FIELDS), 40)
+    status, result = _get(url + '/length?length=40&limit=5')
+    assert status == 200
+    assert result['count'] == len(expected)
+    assert len(result['hits']) == min(5, len(expected))
+    assert [hit['query'] for hit in result['hits']] == expected['query'].head(5).tolist()
+
+
+def test_cluster_sizes_cover_every_record(url):
+    status, result = _get(url + '/cluster')
+    assert status == 200
+    assert sum(result['clusters'].values()) + result['unclustered'] == 4000
+    biggest = max(result['clusters'], key=result['clusters'].get)
+    status, members = _get(url + '/cluster?id={:s}&limit=3'.format(biggest))
+    assert members['count'] == result['clusters'][biggest]
+    assert {hit['cluster'] for hit in members['hits']} == {int(biggest)}
+
+
+def test_tor_matches_the_tor_stage(url, logs):
+    stage = TorPortStage()
+    hits = stage.update(load_log(logs['ssl']))
+    status, result = _get(url + '/tor?limit=1000')
+    assert status == 200
+    assert result['rows'] == 4000
+    assert result['count'] == len(hits)
+    assert [port for port, _ in result['ports']] == [int(port) for port, _ in stage.port_counts()[:1000]]
+
+
+def test_certs_cleans_up_query_iocs_like_the_cli(url, logs):
+    # What cert_checker_ascii_json.py finds with the same IOC file
+    expected = cert_checker.find_certs(load_log(logs['x509'], fields=cert_checker.FIELDS),
+                                       IOCMatcher(read_iocs(IOC_LINES)))
+    query = '&'.join('ioc=' + urllib.request.quote(line) for line in IOC_LINES)
+    _, by_params = _get(url + '/certs?limit=0&' + query)
+    _, by_body = _get(url + '/certs?limit=0', '\n'.join(IOC_LINES))
+    assert by_params['iocs'] == by_body['iocs'] == 2
+    assert by_params['count'] == by_body['count'] == len(expected)
+    assert by_params['findings'] == by_body['findings'] == expected['finding'].value_counts().to_dict()
+    assert by_params['findings']['ioc'] > 0
+
+
+def test_errors(url):
+    assert _get(url + '/nothing')[0] == 404
+    assert _get(url + '/length?length=long')[0] == 400
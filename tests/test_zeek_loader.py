@@ -0,0 +1,49 @@
+import json
+
+import pandas as pd
+
+from zeek_loader import iter_json_chunks, load_log, project_records
+
+
+def _write(path, records):
+    with open(path, 'w') as log_file:
+        for record in records:
+            log_file.write(json.dumps(record) + '\n')
+    return str(path)
+
+
+RECORDS = [
+    {'ts': 1.0, 'id_orig_h': '10.0.0.1', 'query': 'a.example.com', 'answers': ['1.1.1.1'], 'big': list(range(50))},
+    {'ts': 2.0, 'id_orig_h': '10.0.0.2', 'query': 'b.example.com', 'big': list(range(50))},
+    {'ts': 3.0, 'id_orig_h': '10.0.0.3', 'answers': None, 'big': list(range(50))},
+]
+
+
+def test_only_requested_fields_are_built(tmp_path):
+    path = _write(tmp_path / 'dns.log', RECORDS)
+    chunks = list(iter_json_chunks(path, fields=['ts', 'id.orig_h', 'answers', 'qtype_name']))
+    df = chunks[0]
+    # big is never turned into a column, qtype_name is in no record so it is left out
+    assert list(df.columns) == ['ts', 'id_orig_h', 'answers']
+    assert df['answers'].tolist()[0] == ['1.1.1.1']
+    assert df['answers'].isna().tolist() == [False, True, True]
+
+
+def test_projection_matches_the_full_frame(tmp_path):
+    records = [{'ts': float(row), 'id_resp_p': row % 7 or None, 'proto': 'udp' if row % 2 else 'tcp', 'uid': str(row)}
+               for row in range(1000)]
+    fields = ['ts', 'id.resp_p', 'proto']
+    expected = pd.DataFrame.from_records(records)[['ts', 'id_resp_p', 'proto']]
+    pd.testing.assert_frame_equal(project_records(records, fields), expected)
+
+
+def test_projection_without_any_field_keeps_the_row_count():
+    df = project_records([{'a': 1}, {'a': 2}], ['b'])
+    assert df.shape == (2, 0)
+
+
+def test_load_log_fields(tmp_path):
+    path = _write(tmp_path / 'dns.log', RECORDS)
+    df = load_log(path, fields=['query'])
+    assert list(df.columns) == ['query']
+    assert df['query'].isna().tolist() == [False, False, True]
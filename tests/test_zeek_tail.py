@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+
+from zeek_tail import LogTailer
+
+
+def _records(start, count):
+    return [{'ts': 1588204800.0 + row, 'uid': 'C{:d}'.format(row)} for row in range(start, start + count)]
+
+
+def _append(path, records, tail=b''):
+    with open(path, 'ab') as log_file:
+        for record in records:
+            log_file.write(json.dumps(record).encode() + b'\n')
+        log_file.write(tail)
+
+
+def _tailer(path, checkpoint):
+    return LogTailer(str(path), checkpoint=str(checkpoint), poll_interval=0.01)
+
+
+def _take(batches, tailer, rows):
+    """Batches until rows records came out, committing each like the scripts do"""
+    uids = []
+    while len(uids) < rows:
+        uids += next(batches)['uid'].tolist()
+        tailer.commit()
+    return uids
+
+
+@pytest.fixture
+def log(tmp_path):
+    return tmp_path / 'ssl.log', tmp_path / 'checkpoint.json'
+
+
+def test_restart_resumes_at_the_checkpoint(log):
+    path, checkpoint = log
+    _append(path, _records(0, 3))
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 3) == ['C0', 'C1', 'C2']
+    batches.close()
+
+    _append(path, _records(3, 2))
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 2) == ['C3', 'C4']
+    batches.close()
+
+
+def test_restart_after_rotation_drains_the_rotated_file(log):
+    path, checkpoint = log
+    _append(path, _records(0, 3))
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 3) == ['C0', 'C1', 'C2']
+    batches.close()
+
+    # Written and rotated away while nothing was tailing, then a new log under the old name
+    _append(path, _records(3, 2))
+    os.rename(path, path.with_name('ssl.log.1'))
+    _append(path, _records(5, 2))
+
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 4) == ['C3', 'C4', 'C5', 'C6']
+    batches.close()
+
+    # The checkpoint now points into the new log
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    _append(path, _records(7, 1))
+    assert _take(batches, tailer, 1) == ['C7']
+    batches.close()
+
+
+def test_partial_line_is_not_checkpointed(log):
+    path, checkpoint = log
+    partial = json.dumps(_records(2, 1)[0]).encode()
+    _append(path, _records(0, 2), tail=partial[:10])
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 2) == ['C0', 'C1']
+    batches.close()
+    with open(checkpoint) as checkpoint_file:
+        assert json.load(checkpoint_file)['offset'] == os.path.getsize(path) - 10
+
+    # The writer finishes the line while nothing is tailing, it comes out once and whole
+    with open(path, 'ab') as log_file:
+        log_file.write(partial[10:] + b'\n')
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 1) == ['C2']
+    batches.close()
+
+
+def test_ascii_restart_after_rotation_reads_the_rotated_header(log):
+    path, checkpoint = log
+    header = '#separator \\x09\n#fields\tts\tuid\n#types\ttime\tstring\n'
+
+    def rows(start, count):
+        return ''.join('{:.6f}\tC{:d}\n'.format(1588204800.0 + row, row) for row in range(start, start + count))
+
+    path.write_text(header + rows(0, 2))
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 2) == ['C0', 'C1']
+    batches.close()
+
+    with open(path, 'a') as log_file:
+        log_file.write(rows(2, 1))
+    os.rename(path, path.with_name('ssl.2020-04-30-00-00-00.log'))
+    path.write_text(header + rows(3, 1))
+
+    tailer = _tailer(path, checkpoint)
+    batches = tailer.batches()
+    assert _take(batches, tailer, 2) == ['C2', 'C3']
+    batches.close()
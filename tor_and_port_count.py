@@ -4,10 +4,10 @@ import os
 import sys
 import argparse
 import re
-from collections import Counter
 
 # Local imports
 from zat import zeek_log_reader
+from traffic_sketch import PortCounter
 
 if __name__ == '__main__':
     # Example to check for potential Tor connections and give a summary of different ports
@@ -45,12 +45,12 @@ if __name__ == '__main__':
         reader = zeek_log_reader.ZeekLogReader(args.zeek_log, tail=args.t)
         # Just a counter to keep an eye on how many possible Tor connections we identify
         number = 0
-        # A empty list to use for the port statistics
-        ports = []
+        # Ports go straight into a fixed size counter, so tailing doesn't grow a list forever
+        portcount = PortCounter()
 
         for row in reader.readrows():
-            # Add the destination port to the list of ports
-            ports.append(row['id.resp_p'])
+            # Count the destination port
+            portcount.add(row['id.resp_p'])
             # Pull out the Certificate Issuer
             try:
                 issuer = row['issuer']
@@ -75,8 +75,7 @@ if __name__ == '__main__':
         if not args.t:
             # First let's print (if any) the number of possible Tor connections that were found
             print('\nTotal number of possible Tor connections found: {:d}'.format(number))
-            # Now let's do the stats on and printing of the port count
-            portcount = Counter(ports)
+            # Now let's print the port count
             print('\nPort statistics')
             for port, count in portcount.most_common():
                 print('{:<7} {:d}'.format(port, count))
@@ -3,16 +3,17 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-import re
-from collections import Counter
+import contextlib
 from pprint import pprint
 
-# Local imports
-import json
-import pandas as pd
-from zat.log_to_dataframe import LogToDataFrame
-from zat.dataframe_to_matrix import DataFrameToMatrix
-from zat import zeek_log_reader
+# Local imports, the loaders and the detection stage (pandas) are imported where they are used
+# so -h starts fast
+from ts_index import parse_time
+from hit_sink import HitSink, FORMATS, status_stream
+from stage_profile import Profiler, add_arguments as add_profile_arguments
+
+# Only these fields are decoded from the ssl log
+FIELDS = ['ts', 'id.orig_h', 'id.resp_h', 'id.resp_p', 'issuer', 'subject']
 
     # Example to check for potential Tor connections and give a summary of different ports
     # used for SSL connections. Please note that your Zeek installation must stamp the
@@ -23,11 +24,34 @@ from zat import zeek_log_reader
 def parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('-j', '--json_format',
-            help='Import zeek log in json string format',
+            help='Import zeek log in json string format (detected automatically if not set)',
             action='store_true')
     parser.add_argument('-d', '--directory',
             help='Import zeek logs from directory',
             action='store_true')
+    parser.add_argument('-w', '--workers',
+            help='Number of processes used to parse a directory of logs, default=number of cores',
+            type=int,
+            default=None)
+    parser.add_argument('--cache',
+            help='Reuse parsed logs from the on-disk parse cache (clear with parse_cache.py --clear)',
+            action='store_true')
+    parser.add_argument('--since',
+            help='Only records at or after this time, epoch seconds or a UTC date like "2020-04-30 00:10"',
+            type=parse_time,
+            default=None)
+    parser.add_argument('--until',
+            help='Only records at or before this time, see --since',
+            type=parse_time,
+            default=None)
+    parser.add_argument('-f', '--format',
+            help='Output format of the possible Tor connections: {:s}, default=text'.format(', '.join(FORMATS)),
+            choices=FORMATS,
+            default='text')
+    parser.add_argument('-o', '--output',
+            help='File the possible Tor connections are written to, default=stdout',
+            default='-')
+    add_profile_arguments(parser)
     parser.add_argument('zeek_log_path',
             type=str,
             help='Type in location of zeek log')
@@ -35,116 +59,132 @@ def parser():
             action='store_true',
             default=False,
             help='Sets the program to tail a live Zeek log')
+    parser.add_argument('--checkpoint',
+            help='Offset checkpoint file used with -t, default=one per log under ~/.cache/zat_logs/tail',
+            default=None)
+    parser.add_argument('--stats',
+            help='Save the port, source/dest pair and distinct endpoint statistics to this .npz file (merge them with traffic_sketch.py), with -t after every batch and resuming from it',
+            default=None)
+    parser.add_argument('-v', '--verbose',
+            help='Also print the top source/dest pairs, distinct endpoint counts and verdict cache hits under the port statistics',
+            action='store_true')
     args, commands = parser.parse_known_args()
     # Check for unknown args
     if commands:
         print('Unrecognized args: %s' % commands)
         sys.exit(1)
-    # Sanity check that this is a ssl log
-    if 'ssl' not in args.zeek_log_path:
+    # Sanity check that this is a ssl log, directories are filtered down to ssl logs when loading
+    if not args.directory and 'ssl' not in args.zeek_log_path:
         print('This example only works with Zeek ssl.log files..')
         sys.exit(1)
     # File may have a tilde in it
     if args.zeek_log_path:
         args.zeek_log_path = os.path.expanduser(args.zeek_log_path)
-    # Determine json or ascii format
-    if args.json_format:
+    args.profiler = Profiler.from_args(args)
+    # jsonl/csv/parquet hits on stdout are piped into other tools, status lines go to stderr then
+    args.status = status_stream(args.output, args.format)
+    # ascii or json is detected from the start of each log, -j just skips the check
+    if args.t:
         if args.directory:
-            print('**Importing zeek logs from directory in json format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            logs = []
-            for log in zeek_logs:
-                logs.append(import_json(log))
-            df = pd.concat(logs)
-        else:
-            print('**Importing zeek log in json format**')
-            df = import_json(args.zeek_log_path)
-    else:
+            print('-t tails a single live log, it cannot be combined with -d')
+            sys.exit(1)
+        # Tailing reads the log itself in micro-batches, see tail()
+        return None, args
+    from zeek_loader import load_log, load_directory
+    json_format = True if args.json_format else None
+    with contextlib.redirect_stdout(args.status), args.profiler.stage('load') as run:
         if args.directory:
-            print('**Importing zeek logs from directory in ascii format**')
-            zeek_logs = [os.path.join(args.zeek_log_path, file) for file in os.listdir(args.zeek_log_path)]
-            logs = []
-            log_to_df = LogToDataFrame()
-            for log in zeek_logs:
-                logs.append(log_to_df.create_dataframe(log))
-            df = pd.concat(logs)
+            print('**Importing zeek logs from directory**')
+            df = load_directory(args.zeek_log_path, json_format=json_format, workers=args.workers, log_type='ssl', cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
         else:
-            print('**Importing zeek log in ascii format**')
-            print('**Hanging? High chance you are trying to import a log in json format, use -j**')
-            log_to_df = LogToDataFrame()
-            df = log_to_df.create_dataframe(args.zeek_log_path)
-    return df
+            print('**Importing zeek log**')
+            df = load_log(args.zeek_log_path, json_format=json_format, cache=args.cache, fields=FIELDS, since=args.since, until=args.until)
+        run.rows = len(df)
+    return df, args
 
 
-def import_json(path):
-    # list of json strings, each log entry is a string
-    with open(path) as json_file:
-        lines = json_file.readlines()
-    # json.loads converts a json string into a dict
-    # this is run on each line
-    # a dataframe is created from a sequence of dicts using from_records
-    df = pd.DataFrame.from_records(map(json.loads, lines))
-    return df
+def open_sink(args):
+    from tor_detect import hits_text
+    try:
+        return HitSink(args.output, args.format, text=hits_text(timestamps=True))
+    except (OSError, ValueError) as err:
+        print('Could not open the output: {:s}'.format(str(err)))
+        sys.exit(1)
 
 
-def main():
-    df = parser()
-    # A counter for possible Tor connections
-    number = 0
-    # A empty list to use for the port statistics
-    ports = []
-
-    # Set up the regex search that is used against the issuer field
-    issuer_regex = re.compile('CN=www.\w+.com')
-    # Set up the regex search that is used against the subject field
-    subject_regex = re.compile('CN=www.\w+.net')
-
-    # Need to figure out what to do with the tail argument here
-    # Run the zeek reader on the ssl.log file looking for potential Tor connections
-    # reader = zeek_log_reader.ZeekLogReader(args.zeek_log, tail=args.t)
-
-    # Test to make sure ssl.log is stamped with issuer/subject fields
+def load_stats(args):
+    from traffic_sketch import TrafficStats
+    # A tail restarted from its checkpoint keeps adding to the statistics it saved
+    if not (args.t and args.stats and os.path.exists(args.stats)):
+        return None
     try:
-        issuer_test = df['issuer']
-    except KeyError:
-        print('Could not find the issuer field in your ssl.log. Please verify your log file.')
+        stats = TrafficStats.load(args.stats)
+    except (OSError, ValueError, KeyError) as err:
+        print('Could not load the statistics: {:s}'.format(str(err)))
         sys.exit(1)
+    print('**Resuming the statistics of {:d} records from {:s}**'.format(stats.rows, args.stats))
+    return stats
+
+
+def tail(args, sink):
+    from tor_detect import TorPortStage
+    from zeek_tail import LogTailer
+    # Follow the live ssl.log, every micro-batch goes through the same detection stage
+    stage = TorPortStage(stats=load_stats(args))
+    profiler = args.profiler
+    tailer = LogTailer(args.zeek_log_path, fields=FIELDS, checkpoint=args.checkpoint, since=args.since, until=args.until)
+    print('**Tailing {:s}, Ctrl-C to stop**'.format(args.zeek_log_path))
     try:
-        subject_test = df['subject']
-    except KeyError:
-        print('Could not find the subject field in your ssl.log. Please verify your log file.')
-        sys.exit(1)
+        # load includes the time spent waiting for the log to grow
+        for batch in profiler.iterate('load', tailer.batches()):
+            with profiler.stage('detect', len(batch)):
+                hits = stage.update(batch)
+            with profiler.stage('report', len(hits)):
+                sink.write(hits)
+                sink.flush()
+                # Saved before the offset, a crash in between counts the batch twice rather than never
+                if args.stats:
+                    stage.stats.save(args.stats)
+            tailer.commit()
+    except KeyboardInterrupt:
+        pass
+    with profiler.stage('report'):
+        sink.close()
+        print(stage.report(args.verbose))
+    profiler.report()
 
-    # Change syntax of fields based off ascii and json formats
-    if '@stream' in df.columns:
-        field_list = zip(df['ts'], df['id_orig_h'], df['id_resp_h'], df['id_resp_p'], df['issuer'], df['subject'])
-    else:
-        field_list = zip(df.index, df['id.orig_h'], df['id.resp_h'],  df['id.resp_p'], df['issuer'], df['subject'])
-
-    for timestamp, source, dest, port, issuer, subject in field_list:
-        # Add the destination port to the list of ports
-        ports.append(port)
-        # Pull out the Certificate Issuer
-        # Check if the issuer matches the known Tor format
-        # print(df.columns)
-        # print(df.index)
-        if issuer_regex.match(str(issuer)):
-            if subject_regex.match(str(subject)):
-            # Check if the subject and issuer match the known Tor format
-                print('\nPossible Tor connection found')
-                print('From: {:s} To: {:s} Port: {:d}'.format(source, dest, port))
-                print('Timestamp: ', timestamp)
-                number += 1
-
-        # If we are not tailing a live log file, let's print some stats.
-        # if not args.t:
-    # First let's print (if any) the number of possible Tor connections that were found
-    print('\nTotal number of possible Tor connections found: {:d}'.format(number))
-    # Now let's do the stats on and printing of the port count
-    portcount = Counter(ports)
-    print('\nPort statistics')
-    for port, count in portcount.most_common():
-        print('{:<7} {:d}'.format(port, count))
+
+def main():
+    df, args = parser()
+    sink = open_sink(args)
+    with contextlib.redirect_stdout(args.status):
+        if args.t:
+            tail(args, sink)
+            return
+
+        # Test to make sure ssl.log is stamped with issuer/subject fields
+        if 'issuer' not in df.columns:
+            print('Could not find the issuer field in your ssl.log. Please verify your log file.')
+            sys.exit(1)
+        if 'subject' not in df.columns:
+            print('Could not find the subject field in your ssl.log. Please verify your log file.')
+            sys.exit(1)
+
+        # Match the issuer/subject regexes and count ports over the whole frame at once
+        from tor_detect import TorPortStage
+        stage = TorPortStage()
+        with args.profiler.stage('detect', len(df)):
+            hits = stage.update(df)
+        with args.profiler.stage('report', len(hits)):
+            sink.write(hits)
+            sink.close()
+
+            # Print (if any) the number of possible Tor connections that were found and the port count
+            print(stage.report(args.verbose))
+            if args.stats:
+                stage.stats.save(args.stats)
+                print('**Saved the statistics to {:s}**'.format(args.stats))
+        args.profiler.report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+"""Columnar Tor detection and SSL port statistics for ssl.log DataFrames
+
+TorPortStage works on whole DataFrames (or one chunk of a stream at a time): the issuer and
+subject regexes run once per distinct (issuer, subject) pair, remembered across chunks in a
+VerdictCache (verdict_cache.py), instead of once per row, and the port histogram, top
+(source, dest) pairs and distinct endpoint counts are kept in fixed size sketches
+(traffic_sketch.py) that are merged across chunks, so tailing a log for days does not grow them.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+from traffic_sketch import TrafficStats
+from verdict_cache import VerdictCache, certificate_keys, rules_digest
+
+# Set up the regex search that is used against the issuer field
+ISSUER_REGEX = re.compile(r'CN=www.\w+.com')
+# Set up the regex search that is used against the subject field
+SUBJECT_REGEX = re.compile(r'CN=www.\w+.net')
+
+
+def _column(df, field):
+    """Grab a field in either the ascii (id.orig_h) or json (id_orig_h) spelling"""
+    if field in df.columns:
+        return df[field]
+    return df[field.replace('.', '_')]
+
+
+def match_unique(values, regex):
+    """regex.match over a column, evaluated once per distinct value
+    Issuers and subjects repeat heavily, so this is a handful of regex calls per chunk.
+    Missing values are matched as the string 'nan', like str(issuer) did.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    matched = np.fromiter((bool(regex.match(str(value))) for value in uniques), dtype=bool, count=len(uniques))
+    # Code -1 (missing) indexes the extra slot at the end
+    matched = np.append(matched, bool(regex.match('nan')))
+    return matched[codes]
+
+
+class TorPortStage:
+    """Tor detection plus running traffic statistics, fed one DataFrame (chunk) at a time
+    Args:
+        stats (TrafficStats): Statistics to keep adding to, e.g. loaded from a checkpoint (default = new ones)
+        verdicts (VerdictCache): Tor verdicts of the certificates seen so far (default = a new one)
+    """
+
+    def __init__(self, issuer_regex=ISSUER_REGEX, subject_regex=SUBJECT_REGEX, stats=None, verdicts=None):
+        self.issuer_regex = issuer_regex
+        self.subject_regex = subject_regex
+        self.hit_count = 0
+        self.rows = 0
+        self.stats = stats if stats is not None else TrafficStats()
+        self.verdicts = verdicts if verdicts is not None else VerdictCache()
+
+    def update(self, df):
+        """Run detection on a chunk and fold it into the traffic statistics
+        Returns:
+            DataFrame of hits with ts, source, dest and port columns
+        """
+        self.stats.update(df)
+        # A micro-batch where no record carried issuer/subject simply has no such column
+        missing = pd.Series(np.nan, index=df.index, dtype=object)
+        issuers, subjects = df.get('issuer', missing), df.get('subject', missing)
+        codes, first, keys = certificate_keys(issuers, subjects)
+
+        def compute(positions):
+            rows = first[positions]
+            matched = match_unique(issuers.iloc[rows], self.issuer_regex)
+            # Only subjects of certificates whose issuer matched need checking
+            if matched.any():
+                matched[matched] = match_unique(subjects.iloc[rows][matched], self.subject_regex)
+            return matched.tolist()
+
+        self.verdicts.bind(rules_digest(self.issuer_regex.pattern, self.subject_regex.pattern))
+        mask = np.array(self.verdicts.lookup(keys, compute), dtype=bool)[codes]
+        timestamps = df['ts'] if 'ts' in df.columns else df.index.to_series()
+        hits = pd.DataFrame({
+            'ts': timestamps.to_numpy()[mask],
+            'source': _column(df, 'id.orig_h').to_numpy()[mask],
+            'dest': _column(df, 'id.resp_h').to_numpy()[mask],
+            'port': _column(df, 'id.resp_p').to_numpy()[mask],
+        })
+        self.hit_count += len(hits)
+        self.rows += len(df)
+        return hits
+
+    def port_counts(self):
+        """Ports and counts, most common first (ties in the order the ports were first seen)"""
+        return self.stats.ports.most_common()
+
+    def report(self, verbose=False):
+        """The summary printed after the scan: Tor connection total plus port statistics
+        Args:
+            verbose (bool): Also add the source/dest pair and distinct endpoint sketches and the verdict cache hits (default = False)
+        """
+        # Same lines as the tor scripts always printed, downstream parsers rely on them
+        lines = ['', 'Total number of possible Tor connections found: {:d}'.format(self.hit_count), '', 'Port statistics']
+        lines += ['{:<7} {:d}'.format(port, count) for port, count in self.port_counts()]
+        if verbose:
+            lines.append(self.stats.report(ports=False))
+            lines += ['', self.verdicts.summary()]
+        return '\n'.join(lines)
+
+
+def format_hits(hits, timestamps=True):
+    """Render hits the way the tor scripts always printed them, as one string"""
+    lines = []
+    for ts, source, dest, port in zip(hits['ts'], hits['source'], hits['dest'], hits['port']):
+        lines.append('\nPossible Tor connection found')
+        lines.append('From: {:s} To: {:s} Port: {:d}'.format(source, dest, int(port)))
+        if timestamps:
+            lines.append('Timestamp:  {}'.format(ts))
+    return '\n'.join(lines)
+
+
+def hits_text(timestamps=True):
+    """format_hits as the text renderer of a HitSink, each batch ends with a newline like print did"""
+    return lambda hits: format_hits(hits, timestamps) + '\n'
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""Fixed memory traffic statistics for ssl/conn records: ports, top talker pairs, distinct endpoints
+
+TrafficStats folds DataFrames (whole logs, chunks or tailed batches) into sketches whose size
+does not depend on how much traffic went through them:
+    ports      PortCounter, one exact count per port number (65536 slots, 1 MB)
+    pairs      HeavyHitters, a count-min sketch plus the top k (source, dest) pairs
+    origins    HyperLogLog of the distinct id.orig_h
+    responders HyperLogLog of the distinct id.resp_h
+
+Error bounds, N being the number of records folded in:
+    count-min  width w, depth d: an estimate is never below the true count and is at most
+               e/w * N above it with probability 1 - exp(-d). The defaults (w=16384, d=5, 640 KB)
+               give at most 0.017% of N over, 99.3% of the time.
+    top k      every pair whose true count is above e/w * N ends up in the top k unless k pairs
+               have larger estimates, the counts shown are count-min estimates.
+    hyperloglog 2^p registers: standard error 1.04 / sqrt(2^p), p=14 (16 KB) gives 0.81%.
+               Small cardinalities use linear counting and are close to exact.
+
+Every sketch hashes with pandas' fixed key siphash, so sketches built on different files, workers
+or sensors merge: counts add up, registers take the maximum. save() and load() write them to a
+single .npz file, for checkpoints and for merging on another box.
+
+Usage:
+    python3 traffic_sketch.py sensor1.npz sensor2.npz
+    python3 traffic_sketch.py -k 20 -o merged.npz stats/*.npz
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Bump when the saved layout changes so old files are refused
+SKETCH_VERSION = 1
+CMS_WIDTH = 2 ** 14
+CMS_DEPTH = 5
+TOP_K = 10
+HLL_PRECISION = 14
+PORTS = 65536
+
+
+def _column(df, field):
+    """Grab a field in either the ascii (id.orig_h) or json (id_orig_h) spelling, None if missing"""
+    if field in df.columns:
+        return df[field]
+    return df.get(field.replace('.', '_'))
+
+
+def hash_values(values):
+    """64 bit hashes of a column of values, the same on every machine and run
+    Addresses repeat heavily, so only the distinct values are hashed. Values are hashed as strings,
+    so a categorical, object or numeric column of the same values hashes the same.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    hashes = pd.util.hash_array(np.append(np.asarray(uniques, dtype=object).astype(str), 'nan').astype(object))
+    # Code -1 (missing) indexes the extra 'nan' slot at the end
+    return hashes[codes]
+
+
+def combine_hashes(first, second):
+    """64 bit hashes of pairs, from the hashes of both sides (order matters)"""
+    return first * np.uint64(0x9E3779B97F4A7C15) + second
+
+
+def _bit_length(values):
+    """int.bit_length over a uint64 array, exact (no float rounding)"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+class CountMinSketch:
+    """Count-min sketch over 64 bit key hashes
+    Args:
+        width (int): Counters per row, a power of two (default = 16384)
+        depth (int): Rows, each with its own hash function (default = 5)
+    """
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        if width & (width - 1):
+            raise ValueError('count-min width must be a power of two, got {:d}'.format(width))
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _slots(self, hashes):
+        # Double hashing, row i uses low + i * high (Kirsch and Mitzenmacher)
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        mask = np.uint64(self.width - 1)
+        return [((low + np.uint64(row) * high) & mask).astype(np.intp) for row in range(self.depth)]
+
+    def add(self, hashes, counts):
+        """Add counts to the keys, hashes should be distinct (see HeavyHitters.update)"""
+        for row, slots in enumerate(self._slots(hashes)):
+            self.table[row] += np.bincount(slots, weights=counts, minlength=self.width).astype(np.int64)
+        self.total += int(np.sum(counts))
+
+    def estimate(self, hashes):
+        """Estimated counts of the keys, never below the true counts"""
+        if not len(hashes):
+            return np.zeros(0, dtype=np.int64)
+        return np.min([self.table[row, slots] for row, slots in enumerate(self._slots(hashes))], axis=0)
+
+    @property
+    def error(self):
+        """How far above the true count an estimate may be, with probability 1 - exp(-depth)"""
+        return np.e / self.width * self.total
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('cannot merge count-min sketches of different sizes')
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class HeavyHitters:
+    """The k most frequent keys of a stream, counted in a count-min sketch
+    Args:
+        k (int): How many keys to keep (default = 10)
+        width (int): Count-min width (default = 16384)
+        depth (int): Count-min depth (default = 5)
+    """
+
+    def __init__(self, k=TOP_K, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        # hash -> [key, first seen record], first seen orders ties like Counter.most_common
+        self._top = {}
+
+    def update(self, hashes, key):
+        """Count a batch of keys
+        Args:
+            hashes (ndarray): uint64 hash of every record's key
+            key (callable): key(i) gives record i's key, only asked for the ones that make the top k
+        """
+        if not len(hashes):
+            return
+        seen = self.sketch.total
+        distinct, first, counts = np.unique(hashes, return_index=True, return_counts=True)
+        self.sketch.add(distinct, counts)
+        # Estimates only grow, so a key that belongs in the top k gets in when it shows up
+        estimates = self.sketch.estimate(distinct)
+        if len(distinct) > self.k:
+            best = np.argpartition(-estimates, self.k - 1)[:self.k]
+            distinct, first = distinct[best], first[best]
+        for key_hash, index in zip(distinct.tolist(), first.tolist()):
+            if key_hash not in self._top:
+                self._top[key_hash] = [key(index), seen + index]
+        self._trim()
+
+    def _trim(self):
+        if len(self._top) <= self.k:
+            return
+        hashes = np.fromiter(self._top, dtype=np.uint64, count=len(self._top))
+        estimates = self.sketch.estimate(hashes)
+        order = np.lexsort(([self._top[key_hash][1] for key_hash in hashes.tolist()], -estimates))
+        for key_hash in hashes[order[self.k:]].tolist():
+            del self._top[key_hash]
+
+    def top(self):
+        """[(key, estimated count)] most frequent first"""
+        if not self._top:
+            return []
+        hashes = np.fromiter(self._top, dtype=np.uint64, count=len(self._top))
+        estimates = self.sketch.estimate(hashes)
+        order = np.lexsort(([self._top[key_hash][1] for key_hash in hashes.tolist()], -estimates))
+        return [(self._top[key_hash][0], int(estimates[i])) for i, key_hash in zip(order, hashes[order].tolist())]
+
+    def merge(self, other):
+        # The other side's records come after ours
+        offset = self.sketch.total
+        self.sketch.merge(other.sketch)
+        for key_hash, (key, first) in other._top.items():
+            if key_hash not in self._top:
+                self._top[key_hash] = [key, offset + first]
+        self._trim()
+        return self
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2^precision one byte registers
+    Args:
+        precision (int): log2 of the number of registers, 4-18 (default = 14, 0.81% standard error)
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError('hyperloglog precision must be between 4 and 18, got {:d}'.format(precision))
+        self.precision = precision
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def update(self, hashes):
+        """Add a batch of uint64 value hashes"""
+        if not len(hashes):
+            return
+        hashes = np.unique(hashes)
+        rest_bits = 64 - self.precision
+        slots = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Position of the first 1 bit in the remaining bits, counted from the top
+        ranks = (rest_bits + 1 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, slots, ranks)
+
+    def count(self):
+        """Estimated number of distinct values"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    @property
+    def error(self):
+        """Relative standard error of count()"""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError('cannot merge hyperloglogs of different precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+
+class PortCounter:
+    """Exact per-port counts, there are only 65536 ports so a fixed array holds all of them"""
+
+    def __init__(self):
+        self.counts = np.zeros(PORTS, dtype=np.int64)
+        # Record the port was first seen at, orders ties like Counter.most_common did
+        self.first = np.full(PORTS, np.iinfo(np.int64).max, dtype=np.int64)
+        self.rows = 0
+
+    def update(self, ports):
+        """Count a column of ports, missing and out of range values are skipped but take up a record"""
+        # Nullable integer columns (ascii and json logs concatenated) hold pd.NA, which float can't take
+        values = pd.to_numeric(pd.Series(ports), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        valid = np.flatnonzero((values >= 0) & (values < PORTS))
+        numbers = values[valid].astype(np.intp)
+        self.counts += np.bincount(numbers, minlength=PORTS)
+        distinct, first = np.unique(numbers, return_index=True)
+        np.minimum.at(self.first, distinct, self.rows + valid[first])
+        self.rows += len(values)
+
+    def add(self, port):
+        """Count a single port, for readers that hand over one row at a time (update() per row is slow)"""
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            # Missing ('-', NaN, pd.NA) still takes up a record, like in update()
+            port = -1
+        if 0 <= port < PORTS:
+            self.counts[port] += 1
+            self.first[port] = min(self.first[port], self.rows)
+        self.rows += 1
+
+    def most_common(self):
+        """[(port, count)] most common first, ties in the order the ports were first seen"""
+        ports = np.flatnonzero(self.counts)
+        order = np.lexsort((self.first[ports], -self.counts[ports]))
+        return [(int(port), int(count)) for port, count in zip(ports[order], self.counts[ports[order]])]
+
+    def merge(self, other):
+        seen = other.first < np.iinfo(np.int64).max
+        np.minimum(self.first, np.where(seen, other.first + self.rows, self.first), out=self.first)
+        self.counts += other.counts
+        self.rows += other.rows
+        return self
+
+
+class TrafficStats:
+    """Port counts, top (source, dest) pairs and distinct endpoints of connection records
+    Args:
+        k (int): How many pairs to keep (default = 10)
+        width (int): Count-min width of the pair counts (default = 16384)
+        depth (int): Count-min depth of the pair counts (default = 5)
+        precision (int): HyperLogLog precision of the distinct endpoint counts (default = 14)
+    """
+
+    def __init__(self, k=TOP_K, width=CMS_WIDTH, depth=CMS_DEPTH, precision=HLL_PRECISION):
+        self.ports = PortCounter()
+        self.pairs = HeavyHitters(k, width, depth)
+        self.origins = HyperLogLog(precision)
+        self.responders = HyperLogLog(precision)
+
+    @property
+    def rows(self):
+        return self.ports.rows
+
+    def update(self, df):
+        """Fold a DataFrame (or chunk) with id.orig_h, id.resp_h and id.resp_p in"""
+        ports = _column(df, 'id.resp_p')
+        self.ports.update(ports if ports is not None else np.full(len(df), np.nan))
+        sources, dests = _column(df, 'id.orig_h'), _column(df, 'id.resp_h')
+        if sources is None or dests is None:
+            return
+        source_hashes, dest_hashes = hash_values(sources), hash_values(dests)
+        self.pairs.update(combine_hashes(source_hashes, dest_hashes), lambda i: (sources.iat[i], dests.iat[i]))
+        self.origins.update(source_hashes)
+        self.responders.update(dest_hashes)
+
+    def merge(self, other):
+        """Add another TrafficStats (another file, worker or sensor) into this one"""
+        self.ports.merge(other.ports)
+        self.pairs.merge(other.pairs)
+        self.origins.merge(other.origins)
+        self.responders.merge(other.responders)
+        return self
+
+    def report(self, ports=True):
+        """The pair and distinct endpoint lines, plus the port statistics with ports"""
+        lines = []
+        if ports:
+            lines += ['', 'Port statistics']
+            lines += ['{:<7} {:d}'.format(port, count) for port, count in self.ports.most_common()]
+        lines += ['', 'Top {:d} source/dest pairs (count-min, at most {:.0f} over)'.format(self.pairs.k, self.pairs.sketch.error)]
+        lines += ['{:<15s} {:<15s} {:d}'.format(str(source), str(dest), count) for (source, dest), count in self.pairs.top()]
+        lines += ['', 'Distinct sources: ~{:d}, distinct destinations: ~{:d} (hyperloglog, {:.1%} standard error)'.format(
+            self.origins.count(), self.responders.count(), self.origins.error)]
+        return '\n'.join(lines)
+
+    def save(self, path):
+        """Write the sketches to an .npz file, atomically so a checkpoint is never half written"""
+        top = self.pairs._top
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as out:
+            np.savez(out, version=SKETCH_VERSION, k=self.pairs.k,
+                     port_counts=self.ports.counts, port_first=self.ports.first, rows=self.ports.rows,
+                     cms=self.pairs.sketch.table, cms_total=self.pairs.sketch.total,
+                     top_hashes=np.fromiter(top, dtype=np.uint64, count=len(top)),
+                     top_sources=np.array([str(key[0]) for key, _ in top.values()], dtype=str),
+                     top_dests=np.array([str(key[1]) for key, _ in top.values()], dtype=str),
+                     top_first=np.array([first for _, first in top.values()], dtype=np.int64),
+                     origins=self.origins.registers, responders=self.responders.registers)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read sketches written by save(), ValueError for another layout version"""
+        with np.load(path) as saved:
+            if int(saved['version']) != SKETCH_VERSION:
+                raise ValueError('{:s} has sketch version {:d}, expected {:d}'.format(path, int(saved['version']), SKETCH_VERSION))
+            depth, width = saved['cms'].shape
+            stats = cls(int(saved['k']), width, depth, int(np.log2(len(saved['origins']))))
+            stats.ports.counts[:] = saved['port_counts']
+            stats.ports.first[:] = saved['port_first']
+            stats.ports.rows = int(saved['rows'])
+            stats.pairs.sketch.table[:] = saved['cms']
+            stats.pairs.sketch.total = int(saved['cms_total'])
+            stats.pairs._top = {key_hash: [(source, dest), first] for key_hash, source, dest, first in zip(
+                saved['top_hashes'].tolist(), saved['top_sources'].tolist(), saved['top_dests'].tolist(), saved['top_first'].tolist())}
+            stats.origins.registers[:] = saved['origins']
+            stats.responders.registers[:] = saved['responders']
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge saved traffic statistics and print them')
+    parser.add_argument('-k', '--top',
+            help='How many source/dest pairs to print, default=the k of the first file',
+            type=int,
+            default=None)
+    parser.add_argument('-o', '--output',
+            help='Save the merged statistics to this .npz file',
+            default=None)
+    parser.add_argument('stats',
+            help='.npz files saved with --stats',
+            nargs='+')
+    args = parser.parse_args()
+    merged = None
+    for path in args.stats:
+        stats = TrafficStats.load(path)
+        merged = stats if merged is None else merged.merge(stats)
+    if args.top is not None:
+        merged.pairs.k = args.top
+        merged.pairs._trim()
+    print('**Merged {:d} files, {:d} records**'.format(len(args.stats), merged.rows))
+    print(merged.report())
+    if args.output:
+        merged.save(args.output)
+        print('**Saved the merged statistics to {:s}**'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
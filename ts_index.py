@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Sparse ts index for reading a time window out of a large Zeek log
+
+The index samples the ts of the first record after every STRIDE bytes of a log, so a 10 GB day
+log needs about 10000 samples, and building it is one seek per sample rather than a read of the
+whole file. It lives next to the tail checkpoints under ~/.cache/zat_logs/index (or
+$ZAT_INDEX_DIR), one file per log, and is extended in place when the log has grown since it
+was built (a log that was replaced or truncated is indexed again).
+
+Zeek writes a record when it is done with it, so ts is only roughly ordered in a log (a conn
+record carries the connection's start time). byte_range() therefore binary searches the running
+maximum and the running minimum of the samples and widens the window by SLACK seconds on both
+sides. The loaders then drop the rows outside the exact window after parsing the slice.
+
+Usage:
+    python3 ts_index.py zeek_logs/json/zeek_day1.log
+    python3 ts_index.py --since '2020-04-30 00:10' --until '2020-04-30 00:15' zeek_day1.log
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+
+INDEX_DIR = os.path.expanduser(os.environ.get('ZAT_INDEX_DIR', '~/.cache/zat_logs/index'))
+# Bump when the index layout changes, older index files are rebuilt
+INDEX_VERSION = 1
+# Bytes between samples
+STRIDE = 1024 * 1024
+# Seconds a record may be written out of ts order and still be found
+SLACK = 300.0
+# Bytes hashed from the top of a log to notice it was replaced by another of at least the same size
+HEAD_BYTES = 1024
+TS_REGEX = re.compile(rb'"ts"\s*:\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)')
+
+
+def parse_time(text):
+    """Epoch seconds from '1588205199.8', '2020-04-30 00:10:00' or '2020-04-30T00:10Z' (UTC unless a zone is given)"""
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    # The scripts use this as an argparse type, numpy and pandas are imported where they are
+    # needed so -h doesn't load them
+    import pandas as pd
+    stamp = pd.Timestamp(text)
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize('UTC')
+    return stamp.timestamp()
+
+
+def in_window(df, since=None, until=None):
+    """Rows of a loaded frame or chunk with since <= ts <= until
+    ts is the DatetimeIndex of ascii frames and an epoch seconds column in json ones
+    """
+    import numpy as np
+    import pandas as pd
+    if since is None and until is None:
+        return df
+    if 'ts' in df.columns:
+        ts = pd.to_numeric(df['ts'], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    elif isinstance(df.index, pd.DatetimeIndex):
+        ts = df.index.asi8 / 1e9
+    else:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    if since is not None:
+        keep &= ts >= since
+    if until is not None:
+        keep &= ts <= until
+    return df if keep.all() else df[keep]
+
+
+def default_index(path):
+    """Index file for a log, one per absolute path"""
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(INDEX_DIR, key + '.json')
+
+
+def _head_hash(log_file):
+    log_file.seek(0)
+    return hashlib.sha1(log_file.read(HEAD_BYTES)).hexdigest()
+
+
+class TsIndex:
+    """ts samples at regular byte offsets of a log
+    Args:
+        path (str): Path to the zeek log, ascii or json
+        index_file (str): Where the index is kept, False to keep it in memory only (default = one per log under INDEX_DIR)
+        stride (int): Bytes between samples
+    """
+
+    def __init__(self, path, index_file=None, stride=STRIDE):
+        self.path = path
+        self.index_file = default_index(path) if index_file is None else index_file
+        self.stride = stride
+        self._reset()
+
+    def _reset(self):
+        self.offsets = []
+        self.times = []
+        self.size = 0
+        self.inode = None
+        self.head = None
+        self.ts_column = None
+
+    @classmethod
+    def open(cls, path, index_file=None, stride=STRIDE):
+        """Load the index of a log, building or extending it as needed"""
+        index = cls(path, index_file, stride)
+        index._load()
+        if index.update():
+            index._save()
+        return index
+
+    def _load(self):
+        if not self.index_file or not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file) as infile:
+                state = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if state.get('version') != INDEX_VERSION or state.get('stride') != self.stride:
+            return
+        self.offsets, self.times = state['offsets'], state['times']
+        self.size, self.inode, self.head, self.ts_column = state['size'], state['inode'], state['head'], state['ts_column']
+
+    def _save(self):
+        if not self.index_file:
+            return
+        os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+        tmp = self.index_file + '.tmp'
+        with open(tmp, 'w') as outfile:
+            json.dump({'version': INDEX_VERSION, 'path': os.path.abspath(self.path), 'stride': self.stride,
+                       'size': self.size, 'inode': self.inode, 'head': self.head, 'ts_column': self.ts_column,
+                       'offsets': self.offsets, 'times': self.times}, outfile)
+        os.replace(tmp, self.index_file)
+
+    def update(self):
+        """Sample whatever was written since the index was built, returns True if anything changed"""
+        with open(self.path, 'rb') as log_file:
+            stat = os.fstat(log_file.fileno())
+            head = _head_hash(log_file)
+            if stat.st_size == self.size and stat.st_ino == self.inode:
+                return False
+            # A log that shrank or now starts differently is a different log
+            if stat.st_ino != self.inode or stat.st_size < self.size or (self.size >= HEAD_BYTES and head != self.head):
+                self._reset()
+            self.inode, self.head = stat.st_ino, head
+            position = self.offsets[-1] + self.stride if self.offsets else 0
+            while position < stat.st_size:
+                sample = self._sample(log_file, position)
+                if sample is None:
+                    break
+                offset, ts = sample
+                if not self.offsets or offset > self.offsets[-1]:
+                    self.offsets.append(offset)
+                    self.times.append(ts)
+                position = max(position, offset) + self.stride
+            self.size = stat.st_size
+        return True
+
+    def _sample(self, log_file, position):
+        """(offset, ts) of the first complete record starting at or after position"""
+        log_file.seek(position)
+        if position:
+            # Skip the rest of the line position landed in
+            log_file.readline()
+        while True:
+            offset = log_file.tell()
+            line = log_file.readline()
+            if not line.endswith(b'\n'):
+                # End of the log or a record still being written
+                return None
+            if line.startswith(b'#'):
+                if line.startswith(b'#fields'):
+                    self.ts_column = line.rstrip(b'\r\n').split(b'\t')[1:].index(b'ts')
+                continue
+            ts = self._ts(line)
+            if ts is not None:
+                return offset, ts
+
+    def _ts(self, line):
+        if line.startswith(b'{'):
+            match = TS_REGEX.search(line)
+            return float(match.group(1)) if match else None
+        if self.ts_column is None:
+            return None
+        try:
+            return float(line.split(b'\t')[self.ts_column])
+        except (IndexError, ValueError):
+            return None
+
+    def byte_range(self, since=None, until=None, slack=SLACK):
+        """(start, end) offsets holding every record with since <= ts <= until, end None for the end of the log
+        start is 0 when the window starts before the log, so an ascii header is read along
+        """
+        import numpy as np
+        if not self.offsets:
+            return 0, None
+        times = np.asarray(self.times, dtype=np.float64)
+        start, end = 0, None
+        if since is not None:
+            # Last sample where everything sampled so far is before the window
+            running_max = np.maximum.accumulate(times)
+            i = np.searchsorted(running_max, since - slack, side='left') - 1
+            start = self.offsets[i] if i > 0 else 0
+        if until is not None:
+            # First sample where everything sampled from there on is after the window
+            suffix_min = np.minimum.accumulate(times[::-1])[::-1]
+            j = np.searchsorted(suffix_min, until + slack, side='right')
+            end = self.offsets[j] if j < len(self.offsets) else None
+        if end is not None and end <= start:
+            end = start
+        return start, end
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--since',
+            help='Show the byte range read for records at or after this time (epoch seconds or a UTC date)',
+            default=None)
+    parser.add_argument('--until',
+            help='Show the byte range read for records at or before this time',
+            default=None)
+    parser.add_argument('zeek_log_path',
+            type=str,
+            help='Type in location of zeek log')
+    args = parser.parse_args()
+    path = os.path.expanduser(args.zeek_log_path)
+    index = TsIndex.open(path)
+    print('**{:s}: {:d} samples over {:d} bytes, index at {:s}**'.format(path, len(index.offsets), index.size, index.index_file))
+    if index.times:
+        print('ts {:.6f} .. {:.6f} (sampled)'.format(min(index.times), max(index.times)))
+    if args.since or args.until:
+        start, end = index.byte_range(parse_time(args.since), parse_time(args.until))
+        end = index.size if end is None else end
+        print('Reads bytes {:d}-{:d} ({:.1%} of the log)'.format(start, end, (end - start) / max(index.size, 1)))
+
+
+if __name__ == '__main__':
+    main()
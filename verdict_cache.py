@@ -0,0 +1,153 @@
+"""Memoized certificate verdicts, one per distinct certificate
+
+A few certificates make up most x509 and ssl records, so the certificate checks (Let's Encrypt
+spoofing, self-signed, IOCs, the Tor regexes) run once per distinct certificate, its fingerprint
+when the log has one and its (issuer, subject) pair otherwise. VerdictCache keeps the verdicts in
+a bounded LRU that lives as long as the checker, across tailed micro-batches, and with a cache
+file across runs, so a long tail only checks the certificates it hasn't seen before.
+
+A verdict only holds for the rules it was worked out with, so the cache is bound to a digest of
+them (the IOC set, the spoofed domains, the regexes) and emptied whenever the digest changes.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Bump when the saved layout changes so old cache files are ignored
+CACHE_VERSION = 1
+# Certificates kept, the least recently used go first past this
+MAX_ENTRIES = 100000
+_MISSING = object()
+
+
+def rules_digest(*rules):
+    """Digest of whatever a verdict depends on (lists, strings, None)"""
+    return hashlib.sha1(json.dumps(rules, default=str).encode()).hexdigest()
+
+
+def _values(column, rows):
+    """The values of some rows as strings, missing ones as None (NaN never equals itself, json has no NaN)"""
+    values = pd.Series(column).iloc[rows].to_numpy(dtype=object)
+    missing = pd.isna(values)
+    values[~missing] = values[~missing].astype(str)
+    values[missing] = None
+    return values.tolist()
+
+
+def certificate_keys(issuers, subjects, fingerprints=None):
+    """The distinct certificates of a frame
+    Args:
+        issuers (Series): Issuer of every record
+        subjects (Series): Subject of every record
+        fingerprints (Series): Certificate fingerprints, used where present (default = None)
+    Returns:
+        codes (ndarray): Certificate number of every record
+        first (ndarray): Record of each certificate's first appearance
+        keys (list): (fingerprint,) or (issuer, subject) of each certificate
+    """
+    issuer_codes, _ = pd.factorize(pd.Series(issuers), use_na_sentinel=False)
+    subject_codes, subject_uniques = pd.factorize(pd.Series(subjects), use_na_sentinel=False)
+    combined = issuer_codes.astype(np.int64) * max(len(subject_uniques), 1) + subject_codes
+    if fingerprints is not None:
+        fingerprint_codes, fingerprint_uniques = pd.factorize(pd.Series(fingerprints), use_na_sentinel=True)
+        # Records without a fingerprint fall back to their pair, numbered after the fingerprints
+        combined = np.where(fingerprint_codes >= 0, fingerprint_codes, len(fingerprint_uniques) + combined)
+    codes, _ = pd.factorize(combined)
+    # factorize numbers certificates in order of appearance, a new one is a new running maximum
+    first = np.flatnonzero(np.diff(np.maximum.accumulate(codes), prepend=-1) > 0)
+    keys = list(zip(_values(issuers, first), _values(subjects, first)))
+    if fingerprints is not None:
+        keys = [key if fingerprint is None else (fingerprint,) for key, fingerprint in zip(keys, _values(fingerprints, first))]
+    return codes, first, keys
+
+
+class VerdictCache:
+    """Bounded LRU of certificate verdicts
+    Args:
+        max_entries (int): Certificates to keep (default = 100000)
+        path (str): JSON file the verdicts are read from and save() writes to (default = None, memory only)
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.digest = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Most recently used last, like the daemon's matcher LRU
+        self._entries = {}
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bind(self, digest):
+        """Use the verdicts of these rules, dropping everything worked out with other ones"""
+        if digest == self.digest:
+            return
+        if self._entries:
+            self.invalidations += 1
+            self._entries = {}
+        self.digest = digest
+
+    def lookup(self, keys, compute):
+        """Verdicts of distinct certificates, cached ones from the cache
+        Args:
+            keys (list): Certificate keys, see certificate_keys
+            compute (callable): compute(positions) gives the verdicts of keys[positions] that missed
+        Returns:
+            list of verdicts in the order of keys
+        """
+        verdicts = [None] * len(keys)
+        missing = []
+        for position, key in enumerate(keys):
+            verdict = self._entries.pop(key, _MISSING)
+            if verdict is _MISSING:
+                missing.append(position)
+            else:
+                verdicts[position] = self._entries[key] = verdict
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            for position, verdict in zip(missing, compute(missing)):
+                verdicts[position] = self._entries[keys[position]] = verdict
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        return verdicts
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return 'Verdict cache: {:d} hits, {:d} misses ({:.1%} hit ratio), {:d} certificates cached'.format(
+            self.hits, self.misses, self.hit_ratio, len(self))
+
+    def _load(self):
+        try:
+            with open(self.path) as cache_file:
+                saved = json.load(cache_file)
+        except (OSError, ValueError):
+            # Only a cache, start over
+            return
+        if saved.get('version') != CACHE_VERSION:
+            return
+        self.digest = saved['digest']
+        self._entries = {tuple(key): tuple(verdict) if isinstance(verdict, list) else verdict for key, verdict in saved['entries']}
+
+    def save(self):
+        """Write the verdicts to the cache file, if there is one"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as cache_file:
+            json.dump({'version': CACHE_VERSION, 'digest': self.digest,
+                       'entries': [[list(key), verdict] for key, verdict in self._entries.items()]}, cache_file)
+        os.replace(tmp, self.path)
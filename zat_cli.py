@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""One entry point for the scripts, each tool is a subcommand
+
+Only the module of the chosen subcommand is imported, and the scripts themselves load
+scikit-learn only once they build a model, so `zat_cli.py -h` starts without pandas and a
+`tor` run never pays for scikit-learn. Everything after the subcommand is handed to the script
+as it is, `zat_cli.py dns-length -h` shows the script's own options.
+
+--timing reports on stderr how long the imports took (from the first line of this script) and
+how long the run took. `benchmark.py --cold-start` measures whole processes, interpreter startup
+included, against running the scripts directly.
+
+Usage:
+    python3 zat_cli.py dns-cluster -a zeek_logs/json/dns.log
+    python3 zat_cli.py --timing tor -d zeek_logs/json
+"""
+
+import time
+START = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+
+# subcommand -> (module that runs it, what it does)
+COMMANDS = {
+    'dns-cluster': ('dns_clustering', 'Cluster dns queries, optionally only the anomalous ones'),
+    'dns-length': ('dns_length', 'Report dns queries or answers of at least a given length'),
+    'tor': ('tor_and_port_counter_ascii_json_d', 'Look for Tor certificates in ssl logs and count the ports'),
+    'cert': ('cert_checker_ascii_json', 'Check x509 certificates for IOCs, spoofed Let\'s Encrypt and self-signed ones'),
+    'detect': ('zeek_detect', 'Run the dns-length, tor and cert checks in one pass'),
+    'to-pandas': ('zeek_to_pandas', 'Load a zeek log into a DataFrame and print it'),
+    'serve': ('zeek_daemon', 'Keep logs and models loaded and answer queries over a local HTTP API'),
+}
+
+
+def parser():
+    commands = '\n'.join('  {:<12s}{:s}'.format(name, help) for name, (module, help) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+            description='Run one of the zeek log tools',
+            epilog='commands:\n{:s}\n\nSee zat_cli.py command -h for the options of a command'.format(commands),
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timing',
+            help='Report the import and run times on stderr',
+            action='store_true')
+    parser.add_argument('command',
+            help='One of {:s}'.format(', '.join(COMMANDS)),
+            choices=list(COMMANDS),
+            metavar='command')
+    parser.add_argument('args',
+            help='Options and arguments of the command',
+            nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def main():
+    args = parser()
+    module_name = COMMANDS[args.command][0]
+    import_start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    ran = time.perf_counter()
+    # The script parses sys.argv itself, its usage line shows the subcommand
+    sys.argv = ['{:s} {:s}'.format(os.path.basename(sys.argv[0]), args.command)] + args.args
+    try:
+        module.main()
+    finally:
+        if args.timing:
+            done = time.perf_counter()
+            print('**{:s}: imports {:.3f}s ({:s} {:.3f}s), run {:.3f}s, total {:.3f}s**'.format(
+                args.command, ran - START, module_name, ran - import_start, done - ran, done - START), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
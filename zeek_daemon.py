@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""Keep Zeek logs and fitted models loaded and answer queries over a local HTTP API
+
+The logs are parsed once and the dns clusters (DataFrameToMatrix, KMeans and with -a the
+IsolationForest) are fitted once, or loaded with --model. Everything a query needs is worked out
+when records come in: dns query/answer lengths, features, cluster labels and anomaly scores, tor
+hits and the port histogram. A query only filters what is already in memory, so re-running the
+length filter with another threshold or the cert check with another IOC list takes milliseconds.
+Each IOC list keeps the verdicts of the certificates it was checked against (verdict_cache.py), so
+asking again only checks certificates that came in since.
+With --follow the logs are tailed (zeek_tail.py) and new records go through the same steps.
+
+Records are kept in the json layout (ts in epoch seconds, id_orig_h style names) whatever the log
+format, as segments of SEGMENT_ROWS so appending a batch never copies what is already loaded.
+
+The API listens on 127.0.0.1 (--port) or a Unix socket (--socket), every answer is JSON:
+    GET /status                          loaded logs, rows and the model
+    GET /length?length=50&limit=100      dns queries or answers of at least length characters
+    GET /cluster                         records per cluster
+    GET /cluster?id=2&limit=100          the records of a cluster (most anomalous first with -a)
+    GET /cluster?query=www.example.com   the clusters a query was put in
+    GET /tor?limit=100                   possible Tor connections, the port counts, top pairs and distinct endpoints
+    GET /certs?ioc=evil.com&ioc=bad.net  suspicious certificates, IOCs given as parameters
+    POST /certs                          the same, with an IOC file as the body (one per line)
+
+Usage:
+    python3 zeek_daemon.py --port 8642 zeek_logs/json/dns.log zeek_logs/json/ssl.log zeek_logs/json/x509.log
+    curl 'http://127.0.0.1:8642/length?length=40'
+    python3 zeek_daemon.py --socket /tmp/zat.sock --follow /opt/zeek/logs/current/dns.log
+    curl --unix-socket /tmp/zat.sock --data-binary @iocs.txt http://localhost/certs
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from zeek_loader import (load_log, iter_json_chunks, iter_ascii_chunks, concat_chunks, compression, sniff_format,
+                         log_stream, json_name, to_json_layout)
+from compact_dtypes import compact as compact_frame
+from zeek_tail import LogTailer
+from zat.dataframe_to_matrix import DataFrameToMatrix
+from anomaly_stage import AnomalyStage, parse_contamination
+from dns_model import ClusterModel
+from ioc_matcher import IOCMatcher, read_iocs
+from tor_detect import TorPortStage
+from verdict_cache import VerdictCache
+import cert_checker_ascii_json as cert_checker
+import dns_clustering
+import dns_length
+import tor_and_port_counter_ascii_json as tor_counter
+
+PORT = 8642
+# Rows per segment, only the last (open) segment is copied when a batch is appended
+SEGMENT_ROWS = 100000
+# Records returned per query unless limit says otherwise
+LIMIT = 100
+# IOC lists whose automatons are kept between /certs queries
+MATCHERS = 16
+# Fields loaded per log type, the union of what the queries read
+FIELDS = {
+    'dns': dns_clustering.FIELDS + [field for field in dns_length.FIELDS if field not in dns_clustering.FIELDS],
+    'ssl': tor_counter.FIELDS,
+    'x509': cert_checker.FIELDS,
+}
+
+
+def json_layout(df):
+    """Frames from the loaders and the tailer in one layout: ts an epoch seconds column, id_orig_h names"""
+    if isinstance(df.index, pd.DatetimeIndex):
+        return to_json_layout(df)
+    return df.rename(columns=json_name)
+
+
+def complete_end(path, block=65536):
+    """Offset right after the last complete line of a log, where following it picks up"""
+    with open(path, 'rb') as log_file:
+        end = log_file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - block, 0)
+            log_file.seek(start)
+            data = log_file.read(end - start)
+            cut = data.rfind(b'\n')
+            if cut >= 0:
+                return start + cut + 1
+            end = start
+    return 0
+
+
+def load(path, log_type, follow=False, cache=False):
+    """Load a log in the json layout
+    Returns:
+        (DataFrame, offset where following the log picks up or None)
+    """
+    fields = FIELDS[log_type]
+    if not follow or compression(path) is not None:
+        return json_layout(load_log(path, cache=cache, fields=fields)), None
+    # Read up to a known offset so the tailer neither misses nor repeats a record
+    end = complete_end(path)
+    if sniff_format(path) == 'json':
+        chunks = iter_json_chunks(path, fields=fields, byte_range=(0, end))
+    else:
+        chunks = iter_ascii_chunks(path, fields=fields, byte_range=(0, end))
+    df = concat_chunks((compact_frame(chunk, log_type) for chunk in chunks), ignore_index=False)
+    return json_layout(df).reset_index(drop=True), end
+
+
+def fit_model(df, args):
+    """Fit the normalizer, the anomaly stage (-a) and the clusters on dns records, as dns_clustering.py does"""
+    from sklearn.cluster import KMeans
+    # DataFrameToMatrix prints a line per column
+    with contextlib.redirect_stdout(io.StringIO()):
+        to_matrix = DataFrameToMatrix()
+        matrix = to_matrix.fit_transform(df[dns_clustering.FEATURES])
+    odd_clf = None
+    if args.anomaly:
+        odd_clf = AnomalyStage(contamination=args.contamination, threshold=args.threshold).fit(matrix)
+        matrix = matrix[odd_clf.is_anomaly(odd_clf.score(matrix))]
+    if not len(matrix):
+        print('**No records to cluster, /cluster is disabled**')
+        return None
+    kmeans = KMeans(n_clusters=min(len(matrix), args.clusters)).fit(matrix)
+    return ClusterModel(dns_clustering.FEATURES, to_matrix, kmeans, anomaly=odd_clf)
+
+
+def hits_json(hits, limit):
+    """At most limit hits as a list of records"""
+    return json.loads(hits.head(limit).to_json(orient='records', date_format='iso', default_handler=str))
+
+
+def concat(frames, columns):
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+class LogStore:
+    """The records of one log type, kept as segments so appending never copies what is loaded
+    Args:
+        log_type (str): dns, ssl or x509
+    """
+
+    def __init__(self, log_type):
+        self.log_type = log_type
+        self.paths = []
+        self.rows = 0
+        self.batches = 0
+        self.segments = []
+        self._open = None
+        self._lock = threading.Lock()
+
+    def append(self, df):
+        if not len(df):
+            return
+        with self._lock:
+            rows = len(df)
+            if self._open is not None:
+                df = pd.concat([self._open, df], ignore_index=True, sort=False)
+            if len(df) >= SEGMENT_ROWS:
+                self.segments.append(compact_frame(df, self.log_type))
+                self._open = None
+            else:
+                self._open = df
+            self.rows += rows
+            self.batches += 1
+
+    def frames(self):
+        """The segments as they are now, batches appended later don't change them"""
+        with self._lock:
+            return self.segments + ([self._open] if self._open is not None else [])
+
+
+class Daemon:
+    """The loaded logs, the fitted models and the queries over them
+    Args:
+        model (ClusterModel): Saved dns model, None to fit one on the first dns log
+        args (Namespace): -a, --contamination, --threshold and -c, for fitting the dns model
+    """
+
+    def __init__(self, model=None, args=None):
+        self.model = model
+        self.args = args
+        self.anomaly = bool(args and args.anomaly)
+        self.stores = {}
+        self.tor = TorPortStage()
+        self.tor_hits = []
+        self.started = time.time()
+        self._tor_lock = threading.Lock()
+        self._matchers = {}
+        self._cert_lock = threading.Lock()
+
+    def add_log(self, path, follow=False, cache=False):
+        """Load a log and work out what the queries need, then keep following it with follow"""
+        log_type = log_stream(path)
+        if log_type not in FIELDS:
+            print('**Skipping {:s}, only dns, ssl and x509 logs are served**'.format(path))
+            return None
+        print('**Loading {:s}**'.format(path))
+        df, offset = load(path, log_type, follow, cache)
+        if log_type == 'dns' and self.model is None and len(df):
+            dns_clustering.add_features(df)
+            print('**Fitting the dns model on {:d} records**'.format(len(df)))
+            self.model = fit_model(df, self.args)
+        self.ingest(log_type, df)
+        self.stores[log_type].paths.append(path)
+        if follow and offset is not None:
+            thread = threading.Thread(target=self.follow, args=(path, log_type, offset), daemon=True)
+            thread.start()
+        elif follow:
+            print('**Not following {:s}, compressed logs don\'t grow**'.format(path))
+        return log_type
+
+    def follow(self, path, log_type, offset):
+        tailer = LogTailer(path, fields=FIELDS[log_type], checkpoint=False, offset=offset)
+        for batch in tailer.batches():
+            self.ingest(log_type, json_layout(batch))
+
+    def ingest(self, log_type, df):
+        """Derive what the queries read from new records and add them to their store"""
+        store = self.stores.setdefault(log_type, LogStore(log_type))
+        if not len(df):
+            return
+        if log_type == 'dns':
+            if 'query_length' not in df.columns:
+                dns_clustering.add_features(df)
+            df['cluster'] = -1
+            if self.anomaly:
+                df['anomaly_score'] = np.nan
+            if self.model is not None:
+                keep, labels, scores = self.model.predict(df, anomaly=self.anomaly)
+                df.loc[keep, 'cluster'] = labels
+                if self.anomaly:
+                    df.loc[keep, 'anomaly_score'] = scores
+        elif log_type == 'ssl':
+            with self._tor_lock:
+                hits = self.tor.update(df)
+                if len(hits):
+                    self.tor_hits.append(hits)
+        store.append(df)
+
+    def require(self, log_type):
+        if log_type not in self.stores:
+            raise LookupError('no {:s} log is loaded'.format(log_type))
+
+    def frames(self, log_type):
+        self.require(log_type)
+        return self.stores[log_type].frames()
+
+    # Queries, each takes the query parameters (name -> list of values) and the request body
+    def status(self, params, body=None):
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'logs': {log_type: {'paths': store.paths, 'rows': store.rows, 'batches': store.batches,
+                                'segments': len(store.frames())} for log_type, store in self.stores.items()},
+            'model': None if self.model is None else {'clusters': self.model.n_clusters, 'anomaly': self.anomaly},
+        }
+
+    def length(self, params, body=None):
+        length = int(_param(params, 'length', 50))
+        columns = [json_name(field) for field in dns_length.FIELDS] + ['query_length', 'answer_length']
+        frames, hits = self.frames('dns'), []
+        for frame in frames:
+            # Lengths were worked out when the records came in
+            keep = (frame['query_length'] >= length) | (frame['answer_length'] >= length)
+            hits.append(frame.loc[keep.to_numpy(), [column for column in columns if column in frame.columns]])
+        hits = concat(hits, columns)
+        return {'rows': sum(len(frame) for frame in frames), 'length': length, 'count': len(hits),
+                'hits': hits_json(hits, _limit(params))}
+
+    def cluster(self, params, body=None):
+        if self.model is None:
+            raise LookupError('no dns model, load a dns log or pass --model')
+        frames = self.frames('dns')
+        columns = dns_clustering.FEATURES + ['query'] + (['anomaly_score'] if self.anomaly else []) + ['cluster']
+        if 'id' in params:
+            cluster = int(_param(params, 'id'))
+            members = concat([frame.loc[(frame['cluster'] == cluster).to_numpy(), columns] for frame in frames], columns)
+            if self.anomaly:
+                members = members.sort_values('anomaly_score', ascending=False)
+            return {'cluster': cluster, 'count': len(members), 'hits': hits_json(members, _limit(params))}
+        if 'query' in params:
+            query = _param(params, 'query')
+            found = concat([frame.loc[(frame['query'] == query).to_numpy(), columns] for frame in frames], columns)
+            sizes = found.loc[found['cluster'] >= 0, 'cluster'].value_counts().sort_index()
+            return {'query': query, 'count': len(found), 'clusters': {str(key): int(count) for key, count in sizes.items()},
+                    'hits': hits_json(found, _limit(params))}
+        sizes = pd.Series(0, index=range(self.model.n_clusters))
+        for frame in frames:
+            sizes = sizes.add(frame['cluster'].value_counts(), fill_value=0)
+        # -1 holds the records the anomaly stage didn't flag
+        clusters = {str(key): int(count) for key, count in sizes.items() if key >= 0}
+        return {'rows': sum(len(frame) for frame in frames), 'clusters': clusters, 'unclustered': int(sizes.get(-1, 0))}
+
+    def tor_report(self, params, body=None):
+        self.require('ssl')
+        with self._tor_lock:
+            hits = concat(self.tor_hits, ['ts', 'source', 'dest', 'port'])
+            ports = self.tor.port_counts()
+            stats = self.tor.stats
+            pairs = stats.pairs.top()
+            distinct = {'sources': stats.origins.count(), 'dests': stats.responders.count()}
+            rows = self.tor.rows
+        return {'rows': rows, 'count': len(hits), 'hits': hits_json(hits, _limit(params)),
+                'ports': [[int(port), count] for port, count in ports[:_limit(params)]],
+                'pairs': [[str(source), str(dest), count] for (source, dest), count in pairs], 'distinct': distinct}
+
+    def certs(self, params, body=None):
+        # Cleaned up the same way whether they come as parameters or as a file, like the CLI's -i
+        iocs = read_iocs(params.get('ioc', []) + (body.splitlines() if body else []))
+        frames = self.frames('x509')
+        with self._cert_lock:
+            matcher, verdicts = self.matcher(iocs)
+            hits = concat([cert_checker.find_certs(frame, matcher, verdicts) for frame in frames],
+                          ['ts', 'id', 'issuer', 'subject', 'finding', 'ioc'])
+            cache = {'hits': verdicts.hits, 'misses': verdicts.misses, 'hit_ratio': round(verdicts.hit_ratio, 4),
+                     'certificates': len(verdicts)}
+        return {'rows': sum(len(frame) for frame in frames), 'iocs': len(set(iocs)), 'count': len(hits),
+                'findings': {str(key): int(count) for key, count in hits['finding'].value_counts().items()},
+                'verdict_cache': cache, 'hits': hits_json(hits, _limit(params))}
+
+    def matcher(self, iocs):
+        """IOCMatcher of an IOC list and its VerdictCache, those of the last MATCHERS lists are kept"""
+        key = tuple(sorted(set(iocs)))
+        matcher = self._matchers.pop(key, None) or (IOCMatcher(list(key)), VerdictCache())
+        # Most recently used last, the oldest goes once there are too many
+        self._matchers[key] = matcher
+        while len(self._matchers) > MATCHERS:
+            self._matchers.pop(next(iter(self._matchers)))
+        return matcher
+
+
+def _param(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        if default is None:
+            raise ValueError('missing parameter {:s}'.format(name))
+        return default
+    return values[-1]
+
+
+def _limit(params):
+    return int(_param(params, 'limit', LIMIT))
+
+
+ROUTES = {
+    '/status': Daemon.status,
+    '/length': Daemon.length,
+    '/cluster': Daemon.cluster,
+    '/tor': Daemon.tor_report,
+    '/certs': Daemon.certs,
+}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers the ROUTES with JSON, the daemon is the server's"""
+
+    def do_GET(self):
+        self._answer(None)
+
+    def do_POST(self):
+        size = int(self.headers.get('Content-Length') or 0)
+        self._answer(self.rfile.read(size).decode('utf-8', 'replace'))
+
+    def _answer(self, body):
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path.rstrip('/') or '/status')
+        start = time.perf_counter()
+        if route is None:
+            status, result = 404, {'error': 'unknown query {:s}, use one of {:s}'.format(url.path, ', '.join(ROUTES))}
+        else:
+            try:
+                status, result = 200, route(self.server.daemon, parse_qs(url.query), body)
+            except LookupError as err:
+                status, result = 404, {'error': str(err)}
+            except ValueError as err:
+                status, result = 400, {'error': str(err)}
+        result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        data = json.dumps(result, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(daemon, port=PORT, socket_path=None, verbose=False):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, QueryHandler)
+        where = 'unix socket {:s}'.format(socket_path)
+    else:
+        # Only reachable from this host
+        server = ThreadingHTTPServer(('127.0.0.1', port), QueryHandler)
+        where = 'http://127.0.0.1:{:d}'.format(server.server_address[1])
+    server.daemon, server.verbose = daemon, verbose
+    # kill shuts down like Ctrl-C, so the socket file is removed
+    signal.signal(signal.SIGTERM, _stop)
+    print('**Serving {:s} on {:s}, Ctrl-C to stop**'.format(', '.join(ROUTES), where), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port',
+            help='Serve on this port of 127.0.0.1, default={:d}'.format(PORT),
+            type=int,
+            default=PORT)
+    parser.add_argument('--socket',
+            help='Serve on a Unix socket at this path instead of a port',
+            default=None)
+    parser.add_argument('--follow',
+            help='Keep tailing the logs and add new records as they are written',
+            action='store_true')
+    parser.add_argument('-a', '--anomaly',
+            help='Cluster only the records the anomaly stage flags, like dns_clustering.py -a',
+            action='store_true')
+    parser.add_argument('--contamination',
+            help='Expected fraction of anomalies for -a, or auto, default=0.2',
+            type=parse_contamination,
+            default=0.2)
+    parser.add_argument('--threshold',
+            help='Anomaly score cut for -a, overrides --contamination',
+            type=float,
+            default=None)
+    parser.add_argument('-c', '--clusters',
+            help='Number of dns clusters, default=4',
+            type=int,
+            default=4)
+    parser.add_argument('--model',
+            help='Use a model saved by dns_clustering.py --save-model instead of fitting one',
+            default=None)
+    parser.add_argument('--cache',
+            help='Reuse parsed logs from the on-disk cache (see parse_cache.py), not with --follow',
+            action='store_true')
+    parser.add_argument('-v', '--verbose',
+            help='Log every request',
+            action='store_true')
+    parser.add_argument('zeek_logs',
+            nargs='+',
+            help='dns, ssl and x509 logs to load (ascii or json, compressed ones too)')
+    args = parser.parse_args()
+    args.zeek_logs = [os.path.expanduser(path) for path in args.zeek_logs]
+    return args
+
+
+def main():
+    args = parser()
+    model = dns_clustering.load_model(args) if args.model else None
+    daemon = Daemon(model, args)
+    start = time.perf_counter()
+    for path in args.zeek_logs:
+        try:
+            daemon.add_log(path, follow=args.follow, cache=args.cache)
+        except (OSError, ValueError) as err:
+            print('**Skipping {:s} ({:s})**'.format(path, str(err)))
+    if not daemon.stores:
+        print('No logs loaded')
+        return
+    print('**Loaded {:s} in {:.1f}s**'.format(
+        ', '.join('{:d} {:s}'.format(store.rows, log_type) for log_type, store in daemon.stores.items()),
+        time.perf_counter() - start))
+    serve(daemon, args.port, args.socket, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
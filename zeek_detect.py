@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Run the dns-length, tor/port and cert checks over a Zeek log in one pass (see detect_engine.py)
+
+Usage:
+    python3 zeek_detect.py zeek_logs/json/zeek_day1.log
+    python3 zeek_detect.py --detectors tor,cert -i iocs.txt -d zeek_logs/json
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+# The engine, the loaders and the detectors (pandas) are imported where they are used so -h starts fast
+from ts_index import parse_time
+from hit_sink import FORMATS, status_stream
+from stage_profile import Profiler, add_arguments as add_profile_arguments
+import cert_checker_ascii_json as cert_checker
+
+DETECTORS = ['dns_length', 'tor', 'cert']
+
+
+def parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--json_format',
+            help='Import zeek log in json string format (detected automatically if not set)',
+            action='store_true')
+    parser.add_argument('-d', '--directory',
+            help='Scan every log in a directory',
+            action='store_true')
+    parser.add_argument('--detectors',
+            help='Comma separated detectors to run ({:s}), default=all of them'.format(','.join(DETECTORS)),
+            default=','.join(DETECTORS))
+    parser.add_argument('-l', '--length',
+            help='dns_length: report queries or answers with at least this many characters, default=50',
+            type=int,
+            default=50)
+    parser.add_argument('-i', '--iocs',
+            help='cert: txt file of IOCs, one per line',
+            type=argparse.FileType('r'),
+            default=None)
+    parser.add_argument('-o', '--outfile',
+            help='cert: file the certificate findings are written to, default=stdout',
+            default='-')
+    parser.add_argument('-f', '--format',
+            help='cert: output format of the findings, {:s}, default=text'.format(', '.join(FORMATS)),
+            choices=FORMATS,
+            default='text')
+    parser.add_argument('--verdict-cache',
+            help='cert: keep the verdicts of checked certificates in this file across runs, they are dropped when the IOCs change',
+            default=None)
+    parser.add_argument('--since',
+            help='Only records at or after this time, epoch seconds or a UTC date like "2020-04-30 00:10"',
+            type=parse_time,
+            default=None)
+    parser.add_argument('--until',
+            help='Only records at or before this time, see --since',
+            type=parse_time,
+            default=None)
+    parser.add_argument('-t',
+            action='store_true',
+            default=False,
+            help='Sets the program to tail a live Zeek log')
+    parser.add_argument('--checkpoint',
+            help='Offset checkpoint file used with -t, default=one per log under ~/.cache/zat_logs/tail',
+            default=None)
+    parser.add_argument('-v', '--verbose',
+            help='tor: also print the top source/dest pairs, distinct endpoint counts and verdict cache hits',
+            action='store_true')
+    add_profile_arguments(parser)
+    parser.add_argument('zeek_log_path',
+            type=str,
+            help='Type in location of zeek log')
+    args = parser.parse_args()
+    args.detectors = args.detectors.split(',')
+    unknown = set(args.detectors) - set(DETECTORS)
+    if unknown:
+        parser.error('unknown detectors: {:s}'.format(', '.join(sorted(unknown))))
+    if args.t and args.directory:
+        parser.error('-t tails a single live log, it cannot be combined with -d')
+    args.zeek_log_path = os.path.expanduser(args.zeek_log_path)
+    return args
+
+
+def build_detectors(args):
+    from detect_engine import DnsLengthDetector, TorDetector, CertDetector
+    from ioc_matcher import IOCMatcher, read_iocs
+    from verdict_cache import VerdictCache
+    detectors = []
+    if 'dns_length' in args.detectors:
+        detectors.append(DnsLengthDetector(args.length))
+    if 'tor' in args.detectors:
+        detectors.append(TorDetector(args.verbose))
+    if 'cert' in args.detectors:
+        # Build the IOC automaton once for the whole scan
+        ioc_matcher = IOCMatcher(read_iocs(args.iocs.read().splitlines())) if args.iocs else None
+        detectors.append(CertDetector(ioc_matcher, cert_checker.open_sink(args.outfile, args.format),
+                                      VerdictCache(path=args.verdict_cache)))
+    return detectors
+
+
+def tail(args, engine):
+    from zeek_loader import log_stream
+    from zeek_tail import LogTailer
+    # Every micro-batch of the live log is routed like a chunk
+    tailer = LogTailer(args.zeek_log_path, fields=engine.fields, checkpoint=args.checkpoint,
+                       since=args.since, until=args.until)
+    stream = log_stream(args.zeek_log_path)
+    profiler = engine.profiler
+    print('**Tailing {:s}, Ctrl-C to stop**'.format(args.zeek_log_path))
+    try:
+        # load includes the time spent waiting for the log to grow
+        for batch in profiler.iterate('load', tailer.batches()):
+            with profiler.stage('detect', len(batch)):
+                engine.update(batch, stream)
+            with profiler.stage('report'):
+                engine.flush()
+            tailer.commit()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    args = parser()
+    from detect_engine import DetectorEngine
+    # jsonl/csv/parquet cert findings on stdout are piped into other tools, the reports and status
+    # lines go to stderr then
+    status = status_stream(args.outfile, args.format) if 'cert' in args.detectors else sys.stdout
+    engine = DetectorEngine(build_detectors(args), out=status, since=args.since, until=args.until,
+                            profiler=Profiler.from_args(args))
+    json_format = True if args.json_format else None
+    with contextlib.redirect_stdout(status):
+        if args.t:
+            tail(args, engine)
+        elif args.directory:
+            print('**Scanning zeek logs in directory**')
+            engine.scan_directory(args.zeek_log_path, json_format)
+        else:
+            print('**Scanning zeek log**')
+            engine.scan(args.zeek_log_path, json_format)
+        engine.report()
+        print('\nRecords routed per stream: {}'.format(dict(sorted(engine.routed.items()))))
+        engine.profiler.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""Seeded synthetic Zeek logs for benchmarking
+
+Generates dns, ssl, x509 and conn logs, or a mixed @stream day log, in ascii or json. Values
+follow the shapes seen in the sample logs under zeek_logs/: a few hundred internal hosts, popular
+domains queried far more than the rest, mostly port 443 TLS, and a small share of the oddities
+the scripts look for (long/high entropy queries, Tor-looking certificates, self-signed and
+spoofed Let's Encrypt certificates). The same seed always produces the same log.
+
+Rows are generated and written a block at a time, so 100M row logs only need one block in memory.
+
+Usage:
+    python3 zeek_gen.py dns -n 1000000 -o dns.log
+    python3 zeek_gen.py mixed -n 10000000 -f json -s 7 -o zeek_day.log
+"""
+
+import argparse
+import csv
+import time
+import numpy as np
+import pandas as pd
+
+LOG_TYPES = ['dns', 'ssl', 'x509', 'conn', 'mixed']
+# Share of each stream in a mixed day log
+MIXED_SHARES = {'conn': 0.4, 'dns': 0.3, 'ssl': 0.15, 'x509': 0.15}
+# Rows generated per block
+BLOCK_ROWS = 200000
+# Start of the generated day, rows are spread at RATE rows per second from here
+START_TS = 1588204800.0
+RATE = 2000.0
+SYSTEM = 'bobs.bigwheel.local'
+
+# (field, zeek type) per log, in ascii order, json names swap the dots for underscores
+SCHEMAS = {
+    'dns': [('ts', 'time'), ('uid', 'string'), ('id.orig_h', 'addr'), ('id.orig_p', 'port'),
+            ('id.resp_h', 'addr'), ('id.resp_p', 'port'), ('proto', 'enum'), ('trans_id', 'count'),
+            ('rtt', 'interval'), ('query', 'string'), ('qclass', 'count'), ('qclass_name', 'string'),
+            ('qtype', 'count'), ('qtype_name', 'string'), ('rcode', 'count'), ('rcode_name', 'string'),
+            ('AA', 'bool'), ('TC', 'bool'), ('RD', 'bool'), ('RA', 'bool'), ('Z', 'count'),
+            ('answers', 'vector[string]'), ('TTLs', 'vector[interval]'), ('rejected', 'bool')],
+    'ssl': [('ts', 'time'), ('uid', 'string'), ('id.orig_h', 'addr'), ('id.orig_p', 'port'),
+            ('id.resp_h', 'addr'), ('id.resp_p', 'port'), ('version', 'string'), ('cipher', 'string'),
+            ('curve', 'string'), ('server_name', 'string'), ('resumed', 'bool'), ('established', 'bool'),
+            ('cert_chain_fuids', 'vector[string]'), ('subject', 'string'), ('issuer', 'string'),
+            ('validation_status', 'string')],
+    'x509': [('ts', 'time'), ('id', 'string'), ('certificate.version', 'count'),
+             ('certificate.serial', 'string'), ('certificate.subject', 'string'),
+             ('certificate.issuer', 'string'), ('certificate.not_valid_before', 'time'),
+             ('certificate.not_valid_after', 'time'), ('certificate.key_alg', 'string'),
+             ('certificate.sig_alg', 'string'), ('certificate.key_type', 'string'),
+             ('certificate.key_length', 'count'), ('certificate.exponent', 'string'),
+             ('basic_constraints.ca', 'bool')],
+    'conn': [('ts', 'time'), ('uid', 'string'), ('id.orig_h', 'addr'), ('id.orig_p', 'port'),
+             ('id.resp_h', 'addr'), ('id.resp_p', 'port'), ('proto', 'enum'), ('service', 'string'),
+             ('duration', 'interval'), ('orig_bytes', 'count'), ('resp_bytes', 'count'),
+             ('conn_state', 'string'), ('missed_bytes', 'count'), ('history', 'string'),
+             ('orig_pkts', 'count'), ('orig_ip_bytes', 'count'), ('resp_pkts', 'count'),
+             ('resp_ip_bytes', 'count')],
+}
+
+BASE_DOMAINS = [
+    'google.com', 'googleapis.com', 'gstatic.com', 'microsoft.com', 'windowsupdate.com', 'office.com',
+    'live.com', 'bing.com', 'msn.com', 'azureedge.net', 'cloudfront.net', 'amazonaws.com', 'akamaiedge.net',
+    'facebook.com', 'fbcdn.net', 'apple.com', 'icloud.com', 'github.com', 'slack.com', 'zoom.us',
+    'doubleclick.net', 'google-analytics.com', 'adnxs.com', 'twitter.com', 'linkedin.com', 'yahoo.com',
+    'wikipedia.org', 'reddit.com', 'netflix.com', 'dropbox.com', 'salesforce.com', 'paypal.com',
+    'ebay.com', 'amazon.com', 'digicert.com', 'entrust.net', 'letsencrypt.org', 'dmevals.local',
+]
+SUBDOMAINS = ['www', 'api', 'cdn', 'mail', 'login', 'static', 'img', 'update', 'v10.events.data', 'ocsp',
+              'crl', 'wpad', 'go', 'fp-vp', 'dc._msdcs', '_ldap._tcp', 'stats.g', 'pubads.g', 'tag']
+QTYPES = [('A', 1, 0.6), ('AAAA', 28, 0.2), ('PTR', 12, 0.08), ('SRV', 33, 0.04), ('TXT', 16, 0.03),
+          ('NB', 32, 0.03), ('MX', 15, 0.02)]
+CAS = ["CN=R3,O=Let's Encrypt,C=US", 'CN=DigiCert SHA2 Secure Server CA,O=DigiCert Inc,C=US',
+       'CN=GTS CA 1C3,O=Google Trust Services LLC,C=US', 'CN=Microsoft RSA TLS CA 01,O=Microsoft Corporation,C=US',
+       'CN=Amazon,OU=Server CA 1B,O=Amazon,C=US', 'CN=Sectigo RSA Domain Validation Secure Server CA,O=Sectigo Limited,C=GB']
+SPOOFED = ['paypal', 'gmail', 'google', 'apple', 'ebay', 'amazon']
+CIPHERS = ['TLS_AES_128_GCM_SHA256', 'TLS_AES_256_GCM_SHA384', 'TLS_ECDHE_RSA_WITH_AES_256_GCM_SHA384',
+           'TLS_ECDHE_RSA_WITH_AES_128_GCM_SHA256', 'TLS_CHACHA20_POLY1305_SHA256']
+CONN_STATES = [('SF', 'ShADadFf', 0.55), ('S0', 'S', 0.15), ('RSTO', 'ShADadR', 0.1), ('REJ', 'Sr', 0.08),
+               ('SH', 'ShF', 0.04), ('OTH', 'D', 0.08)]
+ALNUM = np.frombuffer(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789', dtype=np.uint8)
+LOWER = np.frombuffer(b'abcdefghijklmnopqrstuvwxyz0123456789', dtype=np.uint8)
+HEX = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+
+
+def json_name(field):
+    return field.replace('.', '_')
+
+
+def random_strings(rng, n, length, alphabet=ALNUM, prefix=''):
+    """n random strings of a fixed length, built as one byte buffer"""
+    codes = alphabet[rng.integers(0, len(alphabet), size=(n, length))]
+    strings = codes.view('S{:d}'.format(length)).ravel().astype(str)
+    return np.char.add(prefix, strings) if prefix else strings
+
+
+def zipf_choice(rng, values, n, skew=1.1):
+    """Pick from values with Zipf-like popularity, the first values most often"""
+    weights = 1.0 / np.arange(1, len(values) + 1) ** skew
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=weights / weights.sum())]
+
+
+def weighted_choice(rng, choices, n):
+    """choices is a list of tuples whose last item is the weight, returns row indices"""
+    weights = np.array([choice[-1] for choice in choices], dtype=float)
+    return rng.choice(len(choices), size=n, p=weights / weights.sum())
+
+
+class Network:
+    """Hosts and names shared by every log of one seed, so ssl, x509 and conn agree"""
+
+    def __init__(self, seed):
+        rng = np.random.default_rng([seed, 0])
+        self.internal = np.array(['10.0.{:d}.{:d}'.format(i // 250, i % 250 + 2) for i in range(400)], dtype=object)
+        self.resolvers = np.array(['10.0.0.4', '10.0.0.5', '8.8.8.8'], dtype=object)
+        octets = rng.integers(1, 255, size=(5000, 4))
+        self.external = np.array(['.'.join(map(str, row)) for row in octets], dtype=object)
+        subs = rng.choice(SUBDOMAINS, size=4000)
+        bases = zipf_choice(rng, BASE_DOMAINS, 4000, skew=0.8)
+        self.domains = np.unique(np.char.add(np.char.add(subs.astype(str), '.'), bases.astype(str))).astype(object)
+        rng.shuffle(self.domains)
+
+
+def _lists(values):
+    """Object array holding a one item list per value"""
+    out = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        out[i] = [value]
+    return out
+
+
+def _times(rng, n, start):
+    """Sorted timestamps for a block starting at start"""
+    return start + np.sort(rng.random(n)) * (n / RATE)
+
+
+def _uids(rng, n, prefix='C'):
+    return random_strings(rng, n, 17, prefix=prefix).astype(object)
+
+
+def _ips(rng, n, pool, skew=1.05):
+    return zipf_choice(rng, pool, n, skew)
+
+
+def _dns(rng, n, start, net):
+    qtype = weighted_choice(rng, QTYPES, n)
+    query = zipf_choice(rng, net.domains, n)
+    # A small share of odd queries: DGA-looking names and long tunnel-like labels
+    odd = rng.random(n)
+    dga = np.flatnonzero(odd < 0.003)
+    query[dga] = np.char.add(random_strings(rng, len(dga), 16, LOWER), '.com').astype(object)
+    tunnel = np.flatnonzero((odd >= 0.003) & (odd < 0.005))
+    query[tunnel] = np.char.add(random_strings(rng, len(tunnel), 52, LOWER), '.t.updates-cdn.net').astype(object)
+    qtype[tunnel] = 4  # TXT
+    names = np.array([name for name, _, _ in QTYPES], dtype=object)
+    codes = np.array([code for _, code, _ in QTYPES])
+    qtype_name = names[qtype]
+    nb = qtype_name == 'NB'
+    query[nb] = random_strings(rng, int(nb.sum()), 8, ALNUM[:26]).astype(object)
+
+    rcode = np.where(rng.random(n) < 0.05, 3, 0)
+    counts = rng.integers(1, 5, size=n)
+    counts[rcode == 3] = 0
+    answer_pool = rng.choice(net.external, size=counts.sum())
+    ttl_pool = rng.choice([60.0, 300.0, 3600.0, 86400.0], size=counts.sum())
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    answers = np.empty(n, dtype=object)
+    ttls = np.empty(n, dtype=object)
+    for i in np.flatnonzero(counts):
+        answers[i] = list(answer_pool[bounds[i]:bounds[i + 1]])
+        ttls[i] = list(ttl_pool[bounds[i]:bounds[i + 1]])
+    return {
+        'ts': _times(rng, n, start), 'uid': _uids(rng, n), 'id.orig_h': _ips(rng, n, net.internal),
+        'id.orig_p': rng.integers(1024, 65536, size=n), 'id.resp_h': _ips(rng, n, net.resolvers),
+        'id.resp_p': np.where(nb, 137, 53), 'proto': np.where(rng.random(n) < 0.97, 'udp', 'tcp').astype(object),
+        'trans_id': rng.integers(0, 65536, size=n), 'rtt': rng.exponential(0.02, size=n),
+        'query': query, 'qclass': np.ones(n, dtype=np.int64), 'qclass_name': np.full(n, 'C_INTERNET', dtype=object),
+        'qtype': codes[qtype], 'qtype_name': qtype_name, 'rcode': rcode,
+        'rcode_name': np.where(rcode == 3, 'NXDOMAIN', 'NOERROR').astype(object),
+        'AA': rng.random(n) < 0.1, 'TC': np.zeros(n, dtype=bool), 'RD': np.ones(n, dtype=bool),
+        'RA': rng.random(n) < 0.95, 'Z': np.where(nb, 1, 0), 'answers': answers, 'TTLs': ttls,
+        'rejected': np.zeros(n, dtype=bool),
+    }
+
+
+def _certs(rng, n, net):
+    """Subjects and issuers with a few self-signed, Tor-looking and spoofed Let's Encrypt ones"""
+    domains = zipf_choice(rng, net.domains, n).astype(str)
+    subject = np.char.add('CN=', domains).astype(object)
+    issuer = zipf_choice(rng, CAS, n, skew=0.7)
+    odd = rng.random(n)
+    self_signed = odd < 0.02
+    issuer[self_signed] = subject[self_signed]
+    spoof = np.flatnonzero((odd >= 0.02) & (odd < 0.025))
+    spoofs = np.char.add(np.char.add('CN=', rng.choice(SPOOFED, size=len(spoof))), '-secure-login.com')
+    subject[spoof] = spoofs.astype(object)
+    issuer[spoof] = CAS[0]
+    tor = np.flatnonzero((odd >= 0.025) & (odd < 0.035))
+    issuer[tor] = np.char.add(np.char.add('CN=www.', random_strings(rng, len(tor), 12, LOWER)), '.com').astype(object)
+    subject[tor] = np.char.add(np.char.add('CN=www.', random_strings(rng, len(tor), 14, LOWER)), '.net').astype(object)
+    return subject, issuer, self_signed, tor, domains
+
+
+def _ssl(rng, n, start, net):
+    subject, issuer, self_signed, tor, domains = _certs(rng, n, net)
+    port = rng.choice([443, 443, 443, 443, 443, 443, 443, 8443, 993, 465], size=n)
+    port[tor] = rng.choice([9001, 9030, 443], size=len(tor))
+    fuids = _uids(rng, n, prefix='F')
+    return {
+        'ts': _times(rng, n, start), 'uid': _uids(rng, n), 'id.orig_h': _ips(rng, n, net.internal),
+        'id.orig_p': rng.integers(1024, 65536, size=n), 'id.resp_h': _ips(rng, n, net.external, skew=0.9),
+        'id.resp_p': port, 'version': rng.choice(['TLSv12', 'TLSv13'], size=n).astype(object),
+        'cipher': rng.choice(CIPHERS, size=n).astype(object), 'curve': np.full(n, 'x25519', dtype=object),
+        'server_name': domains.astype(object), 'resumed': rng.random(n) < 0.2, 'established': rng.random(n) < 0.97,
+        'cert_chain_fuids': _lists(fuids), 'subject': subject,
+        'issuer': issuer,
+        'validation_status': np.where(self_signed, 'self signed certificate', 'ok').astype(object),
+    }
+
+
+def _x509(rng, n, start, net):
+    subject, issuer, _, _, _ = _certs(rng, n, net)
+    before = START_TS - rng.integers(1, 365, size=n) * 86400.0
+    return {
+        'ts': _times(rng, n, start), 'id': _uids(rng, n, prefix='F'), 'certificate.version': np.full(n, 3),
+        'certificate.serial': random_strings(rng, n, 16, HEX).astype(object),
+        'certificate.subject': subject, 'certificate.issuer': issuer,
+        'certificate.not_valid_before': before, 'certificate.not_valid_after': before + 90 * 86400.0,
+        'certificate.key_alg': np.full(n, 'rsaEncryption', dtype=object),
+        'certificate.sig_alg': np.full(n, 'sha256WithRSAEncryption', dtype=object),
+        'certificate.key_type': np.full(n, 'rsa', dtype=object),
+        'certificate.key_length': rng.choice([2048, 4096], size=n),
+        'certificate.exponent': np.full(n, '65537', dtype=object), 'basic_constraints.ca': np.zeros(n, dtype=bool),
+    }
+
+
+def _conn(rng, n, start, net):
+    state = weighted_choice(rng, CONN_STATES, n)
+    service = rng.choice(['ssl', 'dns', 'http', None, None], size=n)
+    port = np.select([service == 'ssl', service == 'dns', service == 'http'], [443, 53, 80],
+                     rng.choice([22, 445, 3389, 8080, 135], size=n))
+    orig_bytes = rng.lognormal(6, 2, size=n).astype(np.int64)
+    resp_bytes = rng.lognormal(8, 2.5, size=n).astype(np.int64)
+    orig_pkts = np.maximum(1, orig_bytes // 500)
+    resp_pkts = np.maximum(1, resp_bytes // 1200)
+    return {
+        'ts': _times(rng, n, start), 'uid': _uids(rng, n), 'id.orig_h': _ips(rng, n, net.internal),
+        'id.orig_p': rng.integers(1024, 65536, size=n), 'id.resp_h': _ips(rng, n, net.external, skew=0.9),
+        'id.resp_p': port, 'proto': np.where(service == 'dns', 'udp', 'tcp').astype(object), 'service': service,
+        'duration': rng.exponential(2.0, size=n), 'orig_bytes': orig_bytes, 'resp_bytes': resp_bytes,
+        'conn_state': np.array([s[0] for s in CONN_STATES], dtype=object)[state], 'missed_bytes': np.zeros(n, dtype=np.int64),
+        'history': np.array([s[1] for s in CONN_STATES], dtype=object)[state], 'orig_pkts': orig_pkts,
+        'orig_ip_bytes': orig_bytes + 40 * orig_pkts, 'resp_pkts': resp_pkts,
+        'resp_ip_bytes': resp_bytes + 40 * resp_pkts,
+    }
+
+
+GENERATORS = {'dns': _dns, 'ssl': _ssl, 'x509': _x509, 'conn': _conn}
+
+
+def _ascii_frame(columns, log_type):
+    """Render a block the way Zeek writes ascii: T/F bools, comma joined vectors, - for unset"""
+    frame = {}
+    for field, zeek_type in SCHEMAS[log_type]:
+        values = columns[field]
+        if zeek_type == 'bool':
+            values = np.where(values, 'T', 'F')
+        elif zeek_type.startswith('vector'):
+            fmt = '{:.6f}' if 'interval' in zeek_type else '{}'
+            values = [','.join(fmt.format(item) for item in value) if value else '-' for value in values]
+        elif values.dtype == object:
+            values = pd.Series(values).fillna('-')
+        frame[field] = values
+    return pd.DataFrame(frame)
+
+
+def _json_frame(columns, log_type):
+    frame = {'@stream': log_type, '@system': SYSTEM, '@proc': 'zeek'}
+    for field, _ in SCHEMAS[log_type]:
+        frame[json_name(field)] = columns[field]
+    return pd.DataFrame(frame)
+
+
+def _json_lines(columns, log_type):
+    frame = _json_frame(columns, log_type)
+    return frame.to_json(orient='records', lines=True, double_precision=6).splitlines()
+
+
+def _write_ascii_header(out, log_type):
+    fields = SCHEMAS[log_type]
+    out.write('#separator \\x09\n#set_separator\t,\n#empty_field\t(empty)\n#unset_field\t-\n')
+    out.write('#path\t{:s}\n#open\t{:s}\n'.format(log_type, time.strftime('%Y-%m-%d-%H-%M-%S', time.gmtime(START_TS))))
+    out.write('#fields\t' + '\t'.join(field for field, _ in fields) + '\n')
+    out.write('#types\t' + '\t'.join(zeek_type for _, zeek_type in fields) + '\n')
+
+
+def generate(log_type, rows, path, json_format=True, seed=0, block_rows=BLOCK_ROWS):
+    """Write a synthetic log
+    Args:
+        log_type (str): dns, ssl, x509, conn or mixed (json only)
+        rows (int): Number of records
+        path (str): Output file
+        json_format (bool): json (one record per line) instead of ascii
+        seed (int): Same seed, same log
+    """
+    if log_type == 'mixed' and not json_format:
+        raise ValueError('mixed @stream logs only exist in json, generate the ascii logs one type at a time')
+    net = Network(seed)
+    with open(path, 'w') as out:
+        if not json_format:
+            _write_ascii_header(out, log_type)
+        for block, start_row in enumerate(range(0, rows, block_rows)):
+            n = min(block_rows, rows - start_row)
+            rng = np.random.default_rng([seed, block + 1])
+            start = START_TS + start_row / RATE
+            if log_type == 'mixed':
+                _write_mixed_block(out, rng, n, start, net)
+                continue
+            columns = GENERATORS[log_type](rng, n, start, net)
+            if json_format:
+                out.write('\n'.join(_json_lines(columns, log_type)) + '\n')
+            else:
+                _ascii_frame(columns, log_type).to_csv(out, sep='\t', header=False, index=False, na_rep='-',
+                                                       float_format='%.6f', quoting=csv.QUOTE_NONE, escapechar='\\')
+        if not json_format:
+            out.write('#close\t{:s}\n'.format(time.strftime('%Y-%m-%d-%H-%M-%S', time.gmtime(START_TS + rows / RATE))))
+
+
+def _write_mixed_block(out, rng, n, start, net):
+    """A block of a day log: every stream generated separately, then interleaved by ts"""
+    streams = list(MIXED_SHARES)
+    counts = rng.multinomial(n, [MIXED_SHARES[stream] for stream in streams])
+    lines = []
+    times = []
+    for stream, count in zip(streams, counts):
+        if not count:
+            continue
+        columns = GENERATORS[stream](rng, int(count), start, net)
+        lines += _json_lines(columns, stream)
+        times.append(columns['ts'])
+    order = np.argsort(np.concatenate(times), kind='stable')
+    out.write('\n'.join(lines[i] for i in order) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('log_type',
+            choices=LOG_TYPES,
+            help='Kind of log to generate, mixed is a json day log of every stream')
+    parser.add_argument('-n', '--rows',
+            help='Number of records, default=10000',
+            type=int,
+            default=10000)
+    parser.add_argument('-f', '--format',
+            help='Output format, default=json',
+            choices=['json', 'ascii'],
+            default='json')
+    parser.add_argument('-s', '--seed',
+            help='Random seed, default=0',
+            type=int,
+            default=0)
+    parser.add_argument('-o', '--output',
+            help='Output file, default=<log_type>.log',
+            default=None)
+    args = parser.parse_args()
+    if args.log_type == 'mixed' and args.format == 'ascii':
+        parser.error('mixed @stream logs only exist in json')
+    path = args.output or '{:s}.log'.format(args.log_type)
+    start = time.time()
+    generate(args.log_type, args.rows, path, json_format=args.format == 'json', seed=args.seed)
+    elapsed = time.time() - start
+    print('Wrote {:d} {:s} records to {:s} in {:.1f}s ({:.0f} rows/sec)'.format(
+        args.rows, args.log_type, path, elapsed, args.rows / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
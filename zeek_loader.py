@@ -0,0 +1,523 @@
+"""Shared Zeek log loading for the scripts in this repo
+
+Logs can be plain or compressed the way Zeek archives them (ssl.00:00:00-01:00:00.log.gz), gzip
+always and zstd when the zstandard package is installed. Compressed logs are decompressed while
+they are read, never to disk.
+"""
+
+import gzip
+import io
+import json
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from zat.log_to_dataframe import LogToDataFrame
+from zat.utils.field_info import get_field_info
+import parse_cache
+from compact_dtypes import compact as compact_frame, guess_log_type, unify_categories
+from ts_index import TsIndex, in_window
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Roughly how many bytes of raw log text get decoded per chunk
+# Keeps the raw lines and decoded dicts for a single chunk in memory, never the whole file
+CHUNK_BYTES = 32 * 1024 * 1024
+# Rows per chunk when streaming an ascii log
+ASCII_CHUNK_ROWS = 200000
+# Bytes read from the start of a log to tell ascii from json
+SNIFF_BYTES = 4096
+# Stream of a record in a mixed json log, read off the raw line so unwanted records aren't decoded
+STREAM_REGEX = re.compile(rb'"@stream"\s*:\s*"([^"]*)"')
+# First bytes of a gzip and a zstd file
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Decompressed bytes per block handed from the decompression thread to the parser, and how many
+# blocks it may run ahead
+PREFETCH_BYTES = 4 * 1024 * 1024
+PREFETCH_BLOCKS = 4
+
+
+def json_name(field):
+    """Field name as the json logs spell it, id.orig_h -> id_orig_h"""
+    return field.replace('.', '_')
+
+
+def project_records(records, fields):
+    """Build a DataFrame holding only the given fields of the decoded records
+    Fields may be spelled the ascii (id.orig_h) or json (id_orig_h) way, the column keeps the
+    spelling found in the log. Fields missing from every record are left out.
+    """
+    # Both passes run in C: a set union for the keys present, then from_records builds only the
+    # wanted columns, missing keys become NaN
+    present = set().union(*records)
+    keys = []
+    for field in fields:
+        for key in dict.fromkeys((field, json_name(field))):
+            if key in present:
+                keys.append(key)
+                break
+    if not keys:
+        # Still one row per record, callers count them
+        return pd.DataFrame(index=pd.RangeIndex(len(records)))
+    return pd.DataFrame.from_records(records, columns=keys)
+
+
+def _wanted_stream(line, streams):
+    """Keep a line of a mixed log whose @stream is in streams, lines without @stream are kept"""
+    match = STREAM_REGEX.search(line)
+    return match is None or match.group(1).decode() in streams
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of the bytes [start, end) of a file, end None for the end of the file"""
+
+    def __init__(self, path, start=0, end=None):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._left = None if end is None else max(end - start, 0)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer) if self._left is None else min(len(buffer), self._left)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        if self._left is not None:
+            self._left -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def compression(path):
+    """'gzip' or 'zstd' for a compressed log (told by its first bytes, not its name), None for a plain one"""
+    with open(path, 'rb') as log_file:
+        head = log_file.read(len(ZSTD_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+class _Prefetch(io.RawIOBase):
+    """Decompress a log in a background thread while the caller parses the blocks already done
+    zlib and zstd release the GIL while they decompress, so with a free core the two overlap.
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._blocks = queue.Queue(maxsize=PREFETCH_BLOCKS)
+        self._block = memoryview(b'')
+        self._done = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    def _decompress(self):
+        try:
+            while not self._stop.is_set():
+                block = self._source.read(PREFETCH_BYTES)
+                self._put(block)
+                if not block:
+                    break
+        except Exception as err:
+            # Raised again in the reading thread
+            self._put(err)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._block and not self._done:
+            block = self._blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            self._done = not block
+            self._block = memoryview(block)
+        size = min(len(buffer), len(self._block))
+        buffer[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+def open_log(path, prefetch=None):
+    """Open a log for reading bytes, plain or compressed
+    Args:
+        path (str): Path to the zeek log, plain, gzip or zstd
+        prefetch (bool): Decompress in a background thread while the caller parses, None does it
+            when there is more than one core (default = None)
+    """
+    kind = compression(path)
+    if kind is None:
+        return open(path, 'rb')
+    if kind == 'gzip':
+        source = gzip.open(path, 'rb')
+    elif zstandard is None:
+        raise ValueError('{:s} is zstd compressed, install zstandard to read it'.format(path))
+    else:
+        source = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    if prefetch is None:
+        prefetch = (os.cpu_count() or 1) > 1
+    if prefetch:
+        return io.BufferedReader(_Prefetch(source), PREFETCH_BYTES)
+    # The zstd reader has no readline, buffering gives it one
+    return source if kind == 'gzip' else io.BufferedReader(source, PREFETCH_BYTES)
+
+
+def field_info(path):
+    """(field names, zeek types) from the #fields and #types header of an ascii log, plain or compressed"""
+    if compression(path) is None:
+        return get_field_info(path)
+    names = types = None
+    with open_log(path, prefetch=False) as log_file:
+        for line in log_file:
+            if not line.startswith(b'#'):
+                break
+            if line.startswith(b'#fields'):
+                names = line.rstrip(b'\r\n').decode().split('\t')[1:]
+            elif line.startswith(b'#types'):
+                types = line.rstrip(b'\r\n').decode().split('\t')[1:]
+    if names is None or types is None:
+        raise ValueError('{:s} has no #fields/#types header'.format(path))
+    return names, types
+
+
+def byte_range(path, since=None, until=None):
+    """Byte range of a log holding the records between since and until (epoch seconds), see ts_index.py
+    Compressed logs can't be read from an offset, they are read whole (None)
+    """
+    if since is None and until is None:
+        return None
+    if compression(path) is not None:
+        return None
+    return TsIndex.open(path).byte_range(since, until)
+
+
+def iter_json_chunks(path, chunk_bytes=CHUNK_BYTES, fields=None, streams=None, byte_range=None, prefetch=None):
+    """Yield DataFrame chunks from a zeek log in json format
+    Args:
+        path (str): Path to the zeek log, one json record per line
+        chunk_bytes (int): Approximate size of raw text decoded per chunk
+        fields (list): Only build columns for these fields (default = None, every field)
+        streams (set): Only decode records of these @stream types, for mixed logs (default = None, every record)
+        byte_range (tuple): Only read the lines in (start, end), see zeek_loader.byte_range (default = None, the whole log)
+        prefetch (bool): Decompress a compressed log in a background thread, see open_log
+    """
+    json_file = io.BufferedReader(_ByteRange(path, *byte_range)) if byte_range else open_log(path, prefetch)
+    with json_file:
+        while True:
+            # readlines with a hint stops at the first line boundary past chunk_bytes
+            lines = json_file.readlines(chunk_bytes)
+            if not lines:
+                break
+            if streams is not None:
+                lines = [line for line in lines if _wanted_stream(line, streams)]
+                if not lines:
+                    continue
+            # Decode the whole chunk in one json.loads call by wrapping the lines in an array
+            records = json.loads(b'[' + b','.join(line for line in lines if line.strip()) + b']')
+            del lines
+            if fields:
+                yield project_records(records, fields)
+            else:
+                yield pd.DataFrame.from_records(records)
+
+
+def concat_chunks(chunks, ignore_index=True):
+    """Concatenate DataFrame chunks into a single DataFrame, skipping empty ones"""
+    frames = [chunk for chunk in chunks if chunk is not None and not chunk.empty]
+    if not frames:
+        return pd.DataFrame()
+    # A single chunk is returned as is, no need to pay for a copy
+    if len(frames) == 1:
+        return frames[0]
+    # Chunks categorize different values, line the categories up so the result stays categorical
+    return pd.concat(unify_categories(frames), ignore_index=ignore_index, sort=False)
+
+
+def import_json(path, chunk_bytes=CHUNK_BYTES, fields=None, log_type=None, compact=False, prefetch=None):
+    """Import a zeek log in json format into a single DataFrame
+    With compact every chunk is converted to compact dtypes (see compact_dtypes.py) before the
+    next one is decoded, so the object columns of only one chunk are alive at a time.
+    """
+    chunks = iter_json_chunks(path, chunk_bytes, fields, prefetch=prefetch)
+    if compact:
+        chunks = (compact_frame(chunk, log_type) for chunk in chunks)
+    return concat_chunks(chunks)
+
+
+def import_ascii(path, fields=None, prefetch=None):
+    """Import a zeek log in ascii format into a DataFrame indexed on ts
+    Args:
+        path (str): Path to the zeek log
+        fields (list): Only parse these fields, either spelling works (default = None, every field)
+        prefetch (bool): Decompress a compressed log in a background thread, see open_log
+    """
+    if compression(path) is not None:
+        # LogToDataFrame only reads plain files
+        return concat_chunks(iter_ascii_chunks(path, fields=fields, prefetch=prefetch), ignore_index=False)
+    usecols = None
+    if fields:
+        wanted = {json_name(field) for field in fields}
+        field_names, _ = get_field_info(path)
+        # LogToDataFrame always adds ts to usecols for the index
+        usecols = [name for name in field_names if json_name(name) in wanted] or ['ts']
+    return LogToDataFrame().create_dataframe(path, usecols=usecols)
+
+
+def iter_ascii_chunks(path, chunk_rows=ASCII_CHUNK_ROWS, fields=None, byte_range=None, prefetch=None):
+    """Yield DataFrame chunks from a zeek log in ascii format, typed and indexed like import_ascii
+    Args:
+        path (str): Path to the zeek log
+        chunk_rows (int): Rows per chunk
+        fields (list): Only parse these fields, either spelling works (default = None, every field)
+        byte_range (tuple): Only read the lines in (start, end), see iter_json_chunks
+        prefetch (bool): Decompress a compressed log in a background thread, see open_log
+    """
+    to_df = LogToDataFrame()
+    all_fields, all_types = field_info(path)
+    types = dict(zip(all_fields, all_types))
+    names = all_fields
+    if fields:
+        wanted = {json_name(field) for field in fields} | {'ts'}
+        names = [name for name in all_fields if json_name(name) in wanted]
+    dtypes = to_df.pd_column_types(names, [types[name] for name in names])
+    # The header comes from the top of the log, the rows from the byte range
+    source = io.BufferedReader(_ByteRange(path, *byte_range)) if byte_range else open_log(path, prefetch)
+    reader = pd.read_csv(source, sep='\t', names=all_fields, usecols=names, dtype=dtypes, comment='#',
+                         na_values='-', chunksize=chunk_rows)
+    try:
+        for chunk in reader:
+            for name in names:
+                if types[name] == 'time':
+                    chunk[name] = pd.to_datetime(chunk[name], unit='s')
+                elif types[name] == 'interval':
+                    chunk[name] = pd.to_timedelta(chunk[name], unit='s')
+            if 'ts' in chunk.columns:
+                chunk = chunk.set_index('ts')
+            yield chunk
+    finally:
+        source.close()
+
+
+def log_stream(path):
+    """Stream type of a single-type log: the #path header of an ascii log, else the file name
+    Returns None for logs that can't be told apart this way (mixed @stream logs carry it per record)
+    """
+    with open_log(path, prefetch=False) as log_file:
+        head = log_file.read(SNIFF_BYTES)
+    match = re.search(rb'^#path\t(\S+)', head, re.MULTILINE)
+    if match:
+        return match.group(1).decode()
+    return guess_log_type(path)
+
+
+def sniff_format(path):
+    """Tell an ascii zeek log from a json one by its first bytes
+    Returns:
+        'ascii' for a log starting with the #separator header, 'json' for a log starting with a
+        json object, None for anything else
+    """
+    with open_log(path, prefetch=False) as log_file:
+        head = log_file.read(SNIFF_BYTES).lstrip()
+    if head.startswith(b'#separator'):
+        return 'ascii'
+    if head.startswith(b'{'):
+        return 'json'
+    return None
+
+
+def _parse_log(path, json_format, fields, compact=True, since=None, until=None, prefetch=None):
+    log_type = guess_log_type(path)
+    if since is not None or until is not None:
+        # Only the slice of the log the ts index points at is parsed
+        chunks = iter_log_chunks(path, json_format, fields, compact, since=since, until=until, prefetch=prefetch)
+        return concat_chunks(chunks, ignore_index=json_format)
+    if json_format:
+        return import_json(path, fields=fields, log_type=log_type, compact=compact, prefetch=prefetch)
+    df = import_ascii(path, fields, prefetch)
+    return compact_frame(df, log_type) if compact else df
+
+
+def _is_json(path, json_format):
+    """Resolve json_format, sniffing the log when it's None"""
+    if json_format is not None:
+        return json_format
+    log_format = sniff_format(path)
+    if log_format is None:
+        raise ValueError('{:s} does not look like an ascii or json zeek log'.format(path))
+    return log_format == 'json'
+
+
+def load_log(path, json_format=None, cache=False, fields=None, compact=True, since=None, until=None, prefetch=None):
+    """Load a single zeek log into a DataFrame
+    Args:
+        path (str): Path to the zeek log
+        json_format (bool): Log is in json format instead of ascii, None detects it (default = None)
+        cache (bool): Go through the on-disk parse cache (see parse_cache.py)
+        fields (list): Only load these fields, spelled id.orig_h or id_orig_h (default = None, every field)
+        compact (bool): Use the log type's compact dtypes, see compact_dtypes.py (default = True)
+        since (float): Only records at or after this ts, epoch seconds (default = None, from the start)
+        until (float): Only records at or before this ts (default = None, to the end)
+        prefetch (bool): Decompress a gzip/zstd log in a background thread, see open_log
+    """
+    json_format = _is_json(path, json_format)
+    if cache:
+        options = {'json_format': json_format, 'fields': sorted(fields) if fields else None, 'compact': compact,
+                   'since': since, 'until': until}
+        return parse_cache.cached_load(path, options, lambda: _parse_log(path, json_format, fields, compact, since, until, prefetch))
+    return _parse_log(path, json_format, fields, compact, since, until, prefetch)
+
+
+def _load_file(job):
+    """Worker: parse a single log, returning (df, error) so failures can be reported by the parent"""
+    path, json_format, cache, fields, compact, since, until, prefetch = job
+    try:
+        df = load_log(path, json_format, cache, fields, compact, since, until, prefetch)
+    except Exception as err:
+        return None, '{:s}: {:s}'.format(type(err).__name__, str(err))
+    if df.empty:
+        return None, 'no records'
+    return df, None
+
+
+def list_logs(path, log_type=None):
+    """List the log files in a directory in a stable order
+    Args:
+        path (str): Directory of zeek logs
+        log_type (str): Only keep files named after this log type, e.g. 'ssl' keeps ssl.log and ssl.00:00:00-01:00:00.log
+    """
+    zeek_logs = []
+    for file in sorted(os.listdir(path)):
+        full_path = os.path.join(path, file)
+        if not os.path.isfile(full_path) or file.startswith('.'):
+            continue
+        if log_type and not file.startswith(log_type):
+            print('**Skipping {:s}, not a {:s} log**'.format(file, log_type))
+            continue
+        zeek_logs.append(full_path)
+    return zeek_logs
+
+
+def load_directory(path, json_format=None, workers=None, log_type=None, cache=False, fields=None, compact=True,
+                   since=None, until=None):
+    """Parse every log in a directory across a process pool and join them into one DataFrame
+    Args:
+        path (str): Directory of zeek logs
+        json_format (bool): Logs are in json format instead of ascii, None detects it per file so
+            directories can mix both formats (default = None)
+        workers (int): Number of worker processes (default = number of cores)
+        log_type (str): Only load logs of this type, see list_logs
+        cache (bool): Go through the on-disk parse cache (see parse_cache.py)
+        fields (list): Only load these fields, see load_log
+        compact (bool): Use compact dtypes, see load_log
+        since (float): Only records at or after this ts, see load_log
+        until (float): Only records at or before this ts, see load_log
+    """
+    zeek_logs = list_logs(path, log_type)
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, max(len(zeek_logs), 1))
+    # Compressed logs are decompressed in a thread next to the parsing when the pool leaves cores free
+    prefetch = cores > workers
+    jobs = [(log, json_format, cache, fields, compact, since, until, prefetch) for log in zeek_logs]
+    if workers > 1:
+        # map hands results back in submission order, so the frame order matches the file order
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_load_file, jobs))
+    else:
+        results = [_load_file(job) for job in jobs]
+
+    frames = []
+    for log, (df, error) in zip(zeek_logs, results):
+        if error:
+            print('**Skipping {:s} ({:s})**'.format(log, error))
+            continue
+        frames.append(df)
+
+    # ascii frames are indexed on ts, keep it when every log was ascii
+    ascii_frames = [isinstance(df.index, pd.DatetimeIndex) for df in frames]
+    if all(ascii_frames):
+        return concat_chunks(frames, ignore_index=False)
+    # Mixed directory, bring the ascii frames over to the json layout so the columns line up
+    if any(ascii_frames):
+        print('**Directory mixes ascii and json logs, using json field names**')
+        frames = [to_json_layout(df) if is_ascii else df for df, is_ascii in zip(frames, ascii_frames)]
+    return concat_chunks(frames)
+
+
+def iter_log_chunks(path, json_format=None, fields=None, compact=True, streams=None, since=None, until=None,
+                    prefetch=None):
+    """Yield a single zeek log as DataFrame chunks, the streaming counterpart of load_log
+    streams only applies to json logs (see iter_json_chunks), an ascii log holds a single stream
+    """
+    window = byte_range(path, since, until)
+    if _is_json(path, json_format):
+        chunks = iter_json_chunks(path, fields=fields, streams=streams, byte_range=window, prefetch=prefetch)
+    else:
+        chunks = iter_ascii_chunks(path, fields=fields, byte_range=window, prefetch=prefetch)
+    if since is not None or until is not None:
+        # The slice is a little wider than the window (or the whole of a compressed log), drop the rows outside it
+        chunks = (chunk for chunk in (in_window(chunk, since, until) for chunk in chunks) if len(chunk))
+    if compact:
+        log_type = guess_log_type(path)
+        return (compact_frame(chunk, log_type) for chunk in chunks)
+    return chunks
+
+
+def iter_directory_chunks(path, json_format=None, log_type=None, fields=None, compact=True, since=None, until=None):
+    """Yield every log in a directory as DataFrame chunks, one file after the other
+    Only one chunk is in memory at a time. Like load_directory, a directory mixing ascii and json
+    logs hands out every chunk in the json layout.
+    """
+    zeek_logs = []
+    for log in list_logs(path, log_type):
+        try:
+            zeek_logs.append((log, _is_json(log, json_format)))
+        except (OSError, ValueError) as err:
+            print('**Skipping {:s} ({:s})**'.format(log, str(err)))
+    mixed = len({is_json for _, is_json in zeek_logs}) > 1
+    if mixed:
+        print('**Directory mixes ascii and json logs, using json field names**')
+    for log, is_json in zeek_logs:
+        try:
+            for chunk in iter_log_chunks(log, is_json, fields, compact, since=since, until=until):
+                yield to_json_layout(chunk) if mixed and not is_json else chunk
+        except (OSError, ValueError) as err:
+            print('**Skipping the rest of {:s} ({:s})**'.format(log, str(err)))
+
+
+def to_json_layout(df):
+    """Convert a DataFrame from LogToDataFrame to the layout import_json produces
+    ts moves from the index to an epoch seconds column and dotted field names (id.orig_h) become
+    underscored (id_orig_h)
+    """
+    df = df.reset_index()
+    if 'ts' in df.columns and pd.api.types.is_datetime64_any_dtype(df['ts']):
+        df['ts'] = df['ts'].astype('int64') / 1e9
+    return df.rename(columns=json_name)
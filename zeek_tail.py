@@ -0,0 +1,313 @@
+"""Follow a growing Zeek log and hand out parsed records in micro-batches
+
+LogTailer wakes up on file system notifications (watchdog, which zat already depends on) and
+falls back to polling, survives Zeek's rotation (the log is renamed away and a new one created
+under the same name) and checkpoints the byte offset of everything it has handed out, so a
+restart resumes where the last run stopped without re-reading or dropping records. If the log
+was rotated while nothing was tailing it, the rotated file is found again by its inode in the
+log's directory (ssl.log.1, ssl.2020-04-30-00-00-00.log, ...), read from the saved offset and
+only then is the new log read from the start.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from zeek_loader import project_records
+from ts_index import in_window
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+CHECKPOINT_DIR = os.path.expanduser(os.environ.get('ZAT_TAIL_DIR', '~/.cache/zat_logs/tail'))
+# Batches are handed out when they reach this many records or when the log has no more data
+BATCH_RECORDS = 5000
+# How long to wait for a notification before checking the file anyway
+POLL_INTERVAL = 0.2
+# How many bytes to read per call while catching up
+READ_BYTES = 4 * 1024 * 1024
+
+
+def default_checkpoint(path):
+    """Checkpoint file for a log, one per absolute path"""
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    return os.path.join(CHECKPOINT_DIR, key + '.json')
+
+
+class _Wakeup(FileSystemEventHandler if Observer else object):
+    """Sets an event whenever something happens to the tailed file's name in its directory"""
+
+    def __init__(self, name, event):
+        self.name = name
+        self.event = event
+
+    def dispatch(self, event):
+        paths = [getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')]
+        if any(os.path.basename(path) == self.name for path in paths if path):
+            self.event.set()
+
+
+class LogTailer:
+    """Follow a Zeek log (ascii or json) and yield DataFrame micro-batches
+    Args:
+        path (str): Path to the live log, e.g. /opt/zeek/logs/current/ssl.log
+        fields (list): Only keep these fields, either spelling works (default = None, every field)
+        checkpoint (str): Offset checkpoint file, False to disable (default = one per log under ZAT_TAIL_DIR)
+        batch_records (int): Hand out a batch once it has this many records
+        poll_interval (float): Seconds to wait for a notification before looking at the file anyway
+        since (float): Only hand out records at or after this ts, epoch seconds (default = None)
+        until (float): Only hand out records at or before this ts (default = None)
+        offset (int): Start at this byte offset (a line boundary) instead of the checkpoint's (default = None)
+    """
+
+    def __init__(self, path, fields=None, checkpoint=None, batch_records=BATCH_RECORDS, poll_interval=POLL_INTERVAL,
+                 since=None, until=None, offset=None):
+        self.path = os.path.expanduser(path)
+        self.fields = fields
+        self.checkpoint = default_checkpoint(self.path) if checkpoint is None else checkpoint
+        self.batch_records = batch_records
+        self.poll_interval = poll_interval
+        self.since = since
+        self.until = until
+        self.offset = offset
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._handed_out = None
+        self._pending = b''
+        self._header = None
+        self._types = None
+        self._wakeup = threading.Event()
+        self._observer = None
+
+    # Checkpoints
+    def _load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return None
+        with open(self.checkpoint) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def _save_checkpoint(self):
+        if not self.checkpoint:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint) or '.', exist_ok=True)
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as checkpoint_file:
+            json.dump({'path': self.path, 'inode': self._inode, 'offset': self._offset}, checkpoint_file)
+        os.replace(tmp, self.checkpoint)
+
+    # File handling
+    def _open(self, offset=0, path=None):
+        """Open the log (waiting for it to appear) and position it at offset
+        path opens a rotated file instead, drained before the log itself (default = None, the log)
+        """
+        path = path or self.path
+        while True:
+            try:
+                self._file = open(path, 'rb')
+                break
+            except FileNotFoundError:
+                self._wait()
+        stat = os.fstat(self._file.fileno())
+        self._inode = stat.st_ino
+        # A file smaller than the saved offset was truncated or replaced, start over
+        self._offset = offset if offset <= stat.st_size else 0
+        self._file.seek(self._offset)
+        self._handed_out = None
+        self._pending = b''
+        self._header = None
+        self._types = None
+        if self._offset:
+            self._read_header(path)
+
+    def _read_header(self, path):
+        """Resuming mid-file, pick up the ascii #fields header from the top of the log"""
+        with open(path, 'rb') as log_file:
+            for line in log_file:
+                if not line.startswith(b'#'):
+                    break
+                self._parse_comment(line)
+
+    def _parse_comment(self, line):
+        if line.startswith(b'#fields'):
+            self._header = line.rstrip(b'\r\n').decode().split('\t')[1:]
+        elif line.startswith(b'#types'):
+            self._types = line.rstrip(b'\r\n').decode().split('\t')[1:]
+
+    def _find_rotated(self, inode):
+        """The file the log was rotated to while nothing was tailing it, by inode, None if it is gone
+        Only uncompressed names next to the log (ssl.log.1, ssl.*.log) are looked at, compressing
+        a rotated log writes a new file.
+        """
+        if inode is None:
+            return None
+        directory = os.path.dirname(os.path.abspath(self.path))
+        stem = os.path.basename(self.path).split('.')[0] + '.'
+        for name in sorted(os.listdir(directory)):
+            candidate = os.path.join(directory, name)
+            if not name.startswith(stem) or candidate == os.path.abspath(self.path):
+                continue
+            try:
+                if os.stat(candidate).st_ino == inode:
+                    return candidate
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _rotated(self):
+        """True when the name now points at a different file than the one we have open"""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    def _wait(self):
+        self._wakeup.wait(self.poll_interval)
+        self._wakeup.clear()
+
+    def _start_watching(self):
+        if Observer is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Wakeup(os.path.basename(self.path), self._wakeup), directory)
+            self._observer.start()
+        except (OSError, RuntimeError):
+            # No inotify (or similar) here, polling it is
+            self._observer = None
+
+    def _stop_watching(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    # Parsing
+    def _read_lines(self):
+        """Read whatever complete lines are available"""
+        data = self._file.read(READ_BYTES)
+        if not data:
+            return []
+        data = self._pending + data
+        # Keep a trailing partial line until the writer finishes it
+        cut = data.rfind(b'\n') + 1
+        self._pending = data[cut:]
+        return data[:cut].splitlines()
+
+    def _to_frame(self, lines):
+        """Parse raw lines into a DataFrame, ascii rows become a ts column instead of an index"""
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if line.startswith(b'#'):
+                self._parse_comment(line)
+            elif line.startswith(b'{'):
+                records.append(json.loads(line))
+            elif self._header:
+                values = line.decode().split('\t')
+                records.append({field: _ascii_value(value) for field, value in zip(self._header, values)})
+        if not records:
+            return None
+        if self.fields:
+            df = project_records(records, self.fields)
+        else:
+            df = pd.DataFrame.from_records(records)
+        # ascii values arrive as strings, use the #types header to give numeric fields numbers
+        if self._header and self._types:
+            types = dict(zip(self._header, self._types))
+            for column in df.columns:
+                if types.get(column) in NUMERIC_TYPES:
+                    df[column] = pd.to_numeric(df[column], errors='coerce')
+        return df
+
+    def batches(self):
+        """Yield DataFrame micro-batches forever (until the caller stops iterating)
+        The checkpoint is written when the caller calls commit() or comes back for the next batch,
+        so a batch that was handed out but not finished is read again after a restart.
+        """
+        saved = self._load_checkpoint()
+        if self.offset is not None:
+            self._open(self.offset)
+        elif not saved or saved.get('path') != self.path:
+            self._open(0)
+        elif self._inode_of_path() == saved.get('inode'):
+            self._open(saved['offset'])
+        else:
+            # Rotated while we were down, finish the old file first (the loop below moves on to
+            # the new one once it runs dry, as it does for a rotation while tailing)
+            rotated = self._find_rotated(saved.get('inode'))
+            if rotated is None:
+                print('**{:s} was rotated and the old file is gone, reading the new log from the start**'.format(self.path), file=sys.stderr)
+                self._open(0)
+            else:
+                print('**{:s} was rotated, reading the rest of {:s} first**'.format(self.path, rotated), file=sys.stderr)
+                self._open(saved['offset'], rotated)
+        self._start_watching()
+        try:
+            lines = []
+            draining = False
+            while True:
+                new_lines = self._read_lines()
+                lines += new_lines
+                # Flush a full batch right away, a partial one as soon as the log runs dry
+                if lines and (len(lines) >= self.batch_records or not new_lines):
+                    self._handed_out = self._file.tell() - len(self._pending)
+                    df = self._to_frame(lines)
+                    lines = []
+                    if df is not None:
+                        df = in_window(df, self.since, self.until)
+                    if df is not None and len(df):
+                        yield df
+                    # Back from the caller, so everything handed out has been handled
+                    self.commit()
+                    continue
+                if new_lines:
+                    continue
+                if self._rotated():
+                    if not draining:
+                        # One more pass over the old file for anything written right before the rename
+                        draining = True
+                        continue
+                    self._file.close()
+                    self._open(0)
+                    self._save_checkpoint()
+                    draining = False
+                    continue
+                self._wait()
+        finally:
+            self._stop_watching()
+            if self._file:
+                self._file.close()
+
+    def commit(self):
+        """Checkpoint everything handed out so far, call once a batch has been fully handled"""
+        if self._handed_out is not None and self._handed_out != self._offset:
+            self._offset = self._handed_out
+            self._save_checkpoint()
+
+    def _inode_of_path(self):
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+
+# Zeek ascii types that become numbers when tailing
+NUMERIC_TYPES = {'time', 'interval', 'count', 'int', 'port', 'double'}
+
+
+def _ascii_value(value):
+    """Zeek ascii unset (-) and empty ((empty)) markers"""
+    if value == '-':
+        return np.nan
+    if value == '(empty)':
+        return ''
+    return value
@@ -3,10 +3,8 @@ import os
 import sys
 import argparse
 
-# Local imports
-from zat.log_to_dataframe import LogToDataFrame
 
-if __name__ == '__main__':
+def main():
     # Example to populate a Pandas dataframe from a zeek log reader
 
     # Collect args from the command line
@@ -23,9 +21,14 @@ if __name__ == '__main__':
     if args.zeek_log:
         args.zeek_log = os.path.expanduser(args.zeek_log)
 
-        # Create a Pandas dataframe from a Zeek log
+        # Create a Pandas dataframe from a Zeek log, zat (and pandas) only loaded now so -h starts fast
+        from zat.log_to_dataframe import LogToDataFrame
         log_to_df = LogToDataFrame()
         zeek_df = log_to_df.create_dataframe(args.zeek_log)
 
         # Print out the head of the dataframe
-        print(zeek_df)
\ No newline at end of file
+        print(zeek_df)
+
+
+if __name__ == '__main__':
+    main()